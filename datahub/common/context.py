@@ -94,6 +94,13 @@ class RequestContext(object):
                 'user_identity': user_idt,
                 'user_name': self.user_name}
 
+    def redacted_copy(self):
+        """Return a copy of the context without its auth token, as sent
+        along notifications.
+        """
+        return self.from_dict(self.to_dict(), auth_token=None,
+                              roles=self.roles, overwrite=False)
+
     def get_logging_values(self):
         """Return a dictionary of logging specific context attributes."""
         values = {'user_name': self.user_name}
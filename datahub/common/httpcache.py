@@ -0,0 +1,190 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+On-disk HTTP cache shared by the news detector and the news_slave crawler.
+
+Pages are stored with their response headers so that a later download can
+be made conditional with If-None-Match/If-Modified-Since, a 304 answer
+then reuses the stored body.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_used_at ON pages (used_at);
+"""
+
+
+class CacheEntry(object):
+    """Response stored for one URL. `headers` maps each header name to the
+    list of its values.
+    """
+
+    def __init__(self, url, status, headers, body, stored_at):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+
+    def header(self, name):
+        """Return the first value of a header, None if it is missing."""
+        name = name.lower()
+        for key, values in self.headers.items():
+            if key.lower() == name and values:
+                return values[0]
+        return None
+
+    @property
+    def etag(self):
+        return self.header('ETag')
+
+    @property
+    def last_modified(self):
+        return self.header('Last-Modified')
+
+    def validators(self):
+        """Return the headers making a download of the URL conditional."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache(object):
+    """SQLite store of HTTP responses.
+
+    Entries older than `ttl` seconds are dropped when read, 0 keeps them
+    forever. When the bodies exceed `max_size` bytes, the least recently
+    used entries are evicted, 0 does not bound the cache.
+    """
+
+    def __init__(self, path, ttl=0, max_size=0):
+        if path != ':memory:':
+            dirname = os.path.dirname(os.path.abspath(path))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._size = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    @property
+    def size(self):
+        """Total size in bytes of the stored bodies."""
+        return self._size
+
+    def _expired(self, stored_at, now):
+        return self.ttl and now - stored_at > self.ttl
+
+    def _delete(self, url):
+        row = self._conn.execute('SELECT size FROM pages WHERE url = ?',
+                                 (url,)).fetchone()
+        if row is not None:
+            self._conn.execute('DELETE FROM pages WHERE url = ?', (url,))
+            self._size -= row[0]
+
+    def get(self, url):
+        """Return the CacheEntry of `url`, None if missing or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT status, headers, body, stored_at FROM pages '
+                'WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return None
+            status, headers, body, stored_at = row
+            if self._expired(stored_at, now):
+                self._delete(url)
+                return None
+            self._conn.execute('UPDATE pages SET used_at = ? WHERE url = ?',
+                               (now, url))
+        return CacheEntry(url, status, json.loads(headers), bytes(body),
+                          stored_at)
+
+    def _evict(self):
+        # Evict down to 90% of the bound so that puts rarely pay for it
+        target = self.max_size * 9 // 10
+        cursor = self._conn.execute(
+            'SELECT url, size FROM pages ORDER BY used_at')
+        evicted = []
+        for url, size in cursor:
+            if self._size <= target:
+                break
+            evicted.append((url,))
+            self._size -= size
+        self._conn.executemany('DELETE FROM pages WHERE url = ?', evicted)
+
+    def put(self, url, status, headers, body):
+        """Store a response, `body` being bytes."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._delete(url)
+            self._conn.execute(
+                'INSERT INTO pages (url, status, headers, body, size, '
+                'stored_at, used_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, status, json.dumps(headers), sqlite3.Binary(body),
+                 len(body), now, now))
+            self._size += len(body)
+            if self.max_size and self._size > self.max_size:
+                self._evict()
+
+    def refresh(self, url, headers=None):
+        """Mark the entry of `url` as validated by a 304 answer, whose
+        `headers` update the stored ones.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            if headers:
+                row = self._conn.execute(
+                    'SELECT headers FROM pages WHERE url = ?',
+                    (url,)).fetchone()
+                if row is None:
+                    return
+                stored = json.loads(row[0])
+                lowered = dict((key.lower(), key) for key in stored)
+                for key, values in headers.items():
+                    stored.pop(lowered.get(key.lower()), None)
+                    stored[key] = values
+                self._conn.execute(
+                    'UPDATE pages SET headers = ? WHERE url = ?',
+                    (json.dumps(stored), url))
+            self._conn.execute(
+                'UPDATE pages SET stored_at = ?, used_at = ? WHERE url = ?',
+                (now, now, url))
+
+    def delete(self, url):
+        with self._lock, self._conn:
+            self._delete(url)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
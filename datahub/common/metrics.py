@@ -0,0 +1,194 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Stage timings and counts, recorded into a pluggable sink.
+
+Each unit of work, such as the parse of a page, records into its own
+`Metrics` with `Metrics.timer` blocks and `Metrics.count` calls, then
+calls `Metrics.flush` to hand all its records to the sink at once. Units
+running concurrently do not mix their records that way. NO_METRICS is
+used when instrumentation is disabled, its timers do nothing.
+
+A sink has a `send(timings, counts)` method taking lists of (name, value)
+tuples, timings being in milliseconds: HistogramSink keeps the values in
+memory, StatsdSink sends them to a statsd daemon over UDP and NotifierSink
+as oslo.messaging notifications.
+"""
+
+import collections
+import socket
+import time
+
+from oslo_log import log as logging
+
+from datahub.common import context as dh_context
+
+LOG = logging.getLogger(__name__)
+
+
+class _Timer(object):
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.timings.append(
+            (self.name, (time.perf_counter() - self.start) * 1000))
+
+
+class _NullTimer(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics(object):
+    """Records of one unit of work, sent to `sink` by `flush`."""
+
+    enabled = True
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.timings = []
+        self.counts = []
+
+    def timer(self, name):
+        """Return a context manager recording the duration of its block
+        as the `name` timing, in milliseconds.
+        """
+        return _Timer(self, name)
+
+    def count(self, name, value):
+        self.counts.append((name, value))
+
+    def flush(self):
+        """Send the records to the sink. A failing sink is logged, it does
+        not fail the instrumented code.
+        """
+        timings, counts = self.timings, self.counts
+        if not timings and not counts:
+            return
+        self.timings, self.counts = [], []
+        try:
+            self.sink.send(timings, counts)
+        except Exception:
+            LOG.exception("Cannot send metrics to %s" %
+                          type(self.sink).__name__)
+
+
+class _NoMetrics(Metrics):
+
+    enabled = False
+
+    def __init__(self):
+        super(_NoMetrics, self).__init__(None)
+
+    def timer(self, name):
+        return _NULL_TIMER
+
+    def count(self, name, value):
+        pass
+
+    def flush(self):
+        pass
+
+
+NO_METRICS = _NoMetrics()
+
+
+def for_sink(sink):
+    """Return a Metrics for a unit of work, NO_METRICS if `sink` is None."""
+    return NO_METRICS if sink is None else Metrics(sink)
+
+
+class HistogramSink(object):
+    """In-memory histograms of the last `size` values of each name."""
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.values = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.size))
+
+    def send(self, timings, counts):
+        for name, value in timings:
+            self.values[name].append(value)
+        for name, value in counts:
+            self.values[name].append(value)
+
+    def percentile(self, name, percent):
+        """Return the nearest-rank `percent` percentile of `name`, None
+        if nothing was recorded.
+        """
+        samples = sorted(self.values.get(name, ()))
+        if not samples:
+            return None
+        rank = max(int(round(percent / 100.0 * len(samples))), 1)
+        return samples[min(rank, len(samples)) - 1]
+
+
+class StatsdSink(object):
+    """Statsd client, the records of a flush are sent in one datagram.
+    Counts are sent as histograms, statsd would sum counters across
+    units of work. Delivery is not checked, metrics are lost when nothing
+    listens.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='datahub'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, timings, counts):
+        lines = ['%s.%s:%.3f|ms' % (self.prefix, name, ms)
+                 for name, ms in timings]
+        lines += ['%s.%s:%d|h' % (self.prefix, name, value)
+                  for name, value in counts]
+        try:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'),
+                                self.address)
+        except socket.error as e:
+            LOG.debug("Cannot send metrics to %s:%d: %s" %
+                      (self.address + (e,)))
+
+    def close(self):
+        self._socket.close()
+
+
+class NotifierSink(object):
+    """Records of each flush sent as one `event_type` notification, its
+    payload mapping `timings` and `counts` names to their values.
+    """
+
+    def __init__(self, notifier, event_type='metrics'):
+        self.notifier = notifier
+        self.event_type = event_type
+
+    def send(self, timings, counts):
+        payload = {'timings': dict(timings), 'counts': dict(counts)}
+        context = dh_context.RequestContext(is_admin=True, overwrite=False)
+        self.notifier.info(context, self.event_type, payload)
@@ -27,6 +27,158 @@ detector_engine_opts = [
                default='vi',
                help='Decide which language of article that datahub will crawl.'
                     'Default is vi - vietnamese.'),
+    cfg.IntOpt('language_sniff_size',
+               default=8192,
+               min=0,
+               help='Number of leading characters of a downloaded page '
+                    'searched for its declared language, pages in another '
+                    'language than `language` are then dropped without '
+                    'being parsed. 0 always parses the page to find it.'),
+    cfg.StrOpt('template_store',
+               default='$state_path/templates.sqlite',
+               help='Path of the SQLite database keeping the article format '
+                    'detected for each domain, so that known domains skip '
+                    'the detection. Set to an empty value to disable it.'),
+    cfg.FloatOpt('template_min_success_rate',
+                 default=0.5,
+                 min=0.0,
+                 max=1.0,
+                 help='Stored article formats with a lower extraction '
+                      'success rate are detected again.'),
+    cfg.StrOpt('seen_index',
+               default='',
+               help='Path of the SQLite database indexing the article URLs '
+                    'already downloaded and parsed, so that they are not '
+                    'downloaded again by other categories, sources or runs. '
+                    'Articles failing to download or parse are not indexed. '
+                    'Once set, detections only return articles not seen '
+                    'before: a source yields its unseen articles only and '
+                    'a batch detection returns None for the articles '
+                    'already parsed. Disabled when empty, the default, so '
+                    'that every detection returns all the articles found. '
+                    '$state_path/seen.sqlite keeps it across runs.'),
+    cfg.IntOpt('seen_index_size',
+               default=1000000,
+               min=1,
+               help='Maximum number of URLs kept in the seen URL index, '
+                    'the least recently seen are dropped first.'),
+    cfg.StrOpt('http_cache',
+               default='$state_path/httpcache.sqlite',
+               help='Path of the SQLite database caching the downloaded '
+                    'source and category pages, which are then downloaded '
+                    'again with a conditional request. Set to an empty '
+                    'value to disable it.'),
+    cfg.IntOpt('http_cache_ttl',
+               default=86400,
+               min=0,
+               help='Seconds a cached page is kept without being validated '
+                    'again by the site. 0 keeps pages until evicted.'),
+    cfg.IntOpt('http_cache_size',
+               default=512,
+               min=0,
+               help='Maximum size in MiB of the cached pages, the least '
+                    'recently used are evicted first. 0 does not bound '
+                    'the cache.'),
+    cfg.StrOpt('replay_corpus',
+               default='',
+               help='Path of a WARC file, or of a directory of html files '
+                    'listed by an index.tsv file, whose pages are served '
+                    'instead of downloading them. No request is sent then, '
+                    'a page missing from the corpus fails to download. The '
+                    'template store and the seen URL index are kept in '
+                    'memory for the run, so that replays are repeatable. '
+                    'Empty downloads pages from the web.'),
+    cfg.IntOpt('fetch_pool_size',
+               default=20,
+               min=1,
+               help='Maximum number of pages downloaded concurrently while '
+                    'detecting article formats.'),
+    cfg.IntOpt('fetch_per_host',
+               default=4,
+               min=1,
+               help='Maximum number of pages downloaded concurrently from '
+                    'the same host.'),
+    cfg.FloatOpt('fetch_timeout',
+                 default=7.0,
+                 min=0.1,
+                 help='Timeout in seconds of each page download, the longest '
+                      'one when domain_health adapts it.'),
+    cfg.BoolOpt('domain_health',
+                default=True,
+                help='Track the latency and error rate of each domain: the '
+                     'timeout of its downloads adapts to its latency and '
+                     'a domain whose downloads keep failing is skipped for '
+                     'circuit_cooldown seconds.'),
+    cfg.FloatOpt('fetch_timeout_min',
+                 default=1.0,
+                 min=0.1,
+                 help='Shortest timeout in seconds of a page download, '
+                      'however fast its domain answered before.'),
+    cfg.FloatOpt('circuit_error_rate',
+                 default=0.5,
+                 min=0.0,
+                 max=1.0,
+                 help='Moving average of the failed downloads of a domain '
+                      'from which the domain is skipped.'),
+    cfg.IntOpt('circuit_min_requests',
+               default=5,
+               min=1,
+               help='Number of downloads from a domain before it can be '
+                    'skipped.'),
+    cfg.IntOpt('circuit_cooldown',
+               default=300,
+               min=0,
+               help='Number of seconds a failing domain is skipped, a '
+                    'single download is then tried before downloading '
+                    'from it again.'),
+    cfg.IntOpt('detect_workers',
+               default=10,
+               min=1,
+               help='Number of URLs processed concurrently by a batch '
+                    'detection, whatever their domain. The requests sent '
+                    'to a single host are bounded by fetch_per_host.'),
+    cfg.IntOpt('parse_workers',
+               default=0,
+               min=0,
+               help='Number of worker processes parsing the downloaded '
+                    'articles. 0 parses them in the detector process.'),
+    cfg.IntOpt('parse_cache_size',
+               default=10000,
+               min=0,
+               help='Number of pages whose parse result is kept along with '
+                    'a fingerprint of their html, so that a page downloaded '
+                    'again unchanged is not parsed again. 0 disables it.'),
+    cfg.IntOpt('parse_cache_simhash_distance',
+               default=0,
+               min=0,
+               max=64,
+               help='Also reuse the parse result of a page whose simhash '
+                    'differs by at most this number of bits, such as pages '
+                    'only differing by a timestamp or an ad. 0 only reuses '
+                    'the results of identical pages.'),
+    cfg.StrOpt('metrics_sink',
+               default='none',
+               choices=['none', 'memory', 'statsd', 'notifier'],
+               help='Where the duration of each stage of an article parse '
+                    'and the number of nodes of its tree are recorded: '
+                    'in-memory histograms, a statsd daemon or oslo.messaging '
+                    'notifications. none disables the instrumentation.'),
+    cfg.StrOpt('statsd_host',
+               default='127.0.0.1',
+               help='Host of the statsd daemon of the statsd metrics sink.'),
+    cfg.PortOpt('statsd_port',
+                default=8125,
+                help='UDP port of the statsd daemon of the statsd metrics '
+                     'sink.'),
+    cfg.StrOpt('metrics_prefix',
+               default='datahub.news_detector',
+               help='Prefix of the metric names sent to statsd.'),
+    cfg.StrOpt('scorer',
+               default='auto',
+               choices=['auto', 'python', 'numpy'],
+               help='Implementation of the content scoring of the top node '
+                    'detection. auto uses NumPy, when it is installed, for '
+                    'pages with many text nodes.'),
 ]
 
 
@@ -27,3 +27,8 @@ class Engine(object):
         :param context: MQ Context.
         :param target: List of news URL target object.
         """
+
+    def close(self):
+        """Release the resources held by the engine, once it stops serving
+        detections.
+        """
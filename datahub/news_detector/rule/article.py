@@ -10,8 +10,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import copy
 import fixtures
+import functools
+import itertools
 from newspaper import article as base_article
 from newspaper.cleaners import DocumentCleaner
 from newspaper import source
@@ -20,18 +23,108 @@ from newspaper import utils
 from oslo_log import log as logging
 from urllib import parse
 
+from datahub.common import metrics
 import datahub.conf
 from datahub.news_detector.rule.extractor import VideoExtractor
+from datahub.news_detector.rule.health import domain_of
+from datahub.news_detector.rule.language import sniff_language
+from datahub.news_detector.rule.parser import Parser
+from datahub.news_detector.rule import seen
+from datahub.news_detector.rule.template import CompiledTemplate
 
 CONF = datahub.conf.CONF
 LOG = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=65536)
+def split_url(url):
+    """Return the netloc and path of `url`, memoized as the same links are
+    looked up for every category of a source.
+    """
+    url = parse.urlparse(url)
+    return url.netloc, url.path
+
+
 class ArticleException(Exception):
     def __init__(self, *args, **kwargs):
         super(ArticleException, self).__init__(*args, **kwargs)
 
 
+class ParseResult(object):
+    """Picklable outcome of `Article.parse`: the XPaths and metadata found,
+    without any lxml tree. Parse pools send it back from their workers and
+    fingerprint caches keep it for unchanged pages.
+    """
+
+    FIELDS = ('title', 'authors', 'text', 'publish_date', 'canonical_link',
+              'meta_favicon', 'meta_description', 'meta_keywords',
+              'meta_data', 'tags', 'movies', 'link_hash', 'is_parsed')
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def from_article(cls, article):
+        return cls(**dict((field, getattr(article, field))
+                          for field in cls.FIELDS))
+
+    def update(self, article):
+        """Copy the result onto `article`."""
+        for field in self.FIELDS:
+            setattr(article, field, getattr(self, field))
+
+
+class ArticleMetadata(object):
+    """Values found in the <head> of an article: title, canonical link,
+    meta description, keywords and data, language and publish date.
+    """
+
+    FIELDS = ('title', 'canonical_link', 'meta_description',
+              'meta_keywords', 'meta_data', 'meta_lang', 'publish_date')
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields.get(field, ''))
+
+    @staticmethod
+    def _value(doc, xpath):
+        if not xpath:
+            return ''
+        items = doc.xpath(xpath)
+        if not items:
+            return ''
+        if isinstance(items[0], str):
+            return items[0].strip()
+        if items[0].tag == 'meta':
+            return items[0].get('content', '').strip()
+        return Parser.getText(items[0])
+
+    @classmethod
+    def _values(cls, doc, xpaths):
+        return dict((key, cls._values(doc, xpath) if isinstance(xpath, dict)
+                     else cls._value(doc, xpath))
+                    for key, xpath in xpaths.items())
+
+    @classmethod
+    def from_doc(cls, url, doc, extractor):
+        """Extract the metadata of a document parsed up to its <head>."""
+        xpaths = {
+            'title': extractor.get_title(doc),
+            'canonical_link': extractor.get_canonical_link(doc),
+            'meta_description': extractor.get_meta_description(doc),
+            'meta_keywords': extractor.get_meta_keywords(doc),
+            'publish_date': extractor.get_publishing_date(url, doc),
+        }
+        fields = dict((field, cls._value(doc, xpath))
+                      for field, xpath in xpaths.items())
+        fields['meta_data'] = cls._values(doc, extractor.get_meta_data(doc))
+        fields['meta_lang'] = extractor.get_meta_lang(doc)[0]
+        return cls(**fields)
+
+
 class Article(base_article.Article):
 
     def __init__(self, url, title='', source_url='', config=None,
@@ -40,112 +133,171 @@ class Article(base_article.Article):
         self.title = ''
         self.link_hash = None
         self.extractor = extractor
+        self.compiled_template = None
+        # Body as downloaded and the encoding `html` was decoded with, the
+        # tree is built from them until the article is parsed
+        self.raw_html = None
+        self.html_encoding = None
 
     def set_meta_language(self, meta_lang):
         """Save langauges in their ISO 2-character form
         """
         self.meta_lang = meta_lang
 
+    def _fromstring(self, parser):
+        """Build the tree from the downloaded bytes when they are kept,
+        they are released then: a later tree comes from `html`.
+        """
+        raw_html, self.raw_html = self.raw_html, None
+        if raw_html:
+            return parser.fromstring(raw_html, encoding=self.html_encoding)
+        return parser.fromstring(self.html)
+
     def parse(self):
         if not self.is_downloaded:
             raise ArticleException(self)
 
-        self.doc = self.config.get_parser().fromstring(self.html)
-        self.clean_doc = copy.deepcopy(self.doc)
+        # Pages declaring another language are dropped before building
+        # their tree, when the beginning of the html is enough to tell
+        sniff_size = CONF.news_detector.language_sniff_size
+        if sniff_size and self.html:
+            lang = sniff_language(self.html, sniff_size)
+            if lang is not None and CONF.news_detector.language not in lang:
+                return
+
+        stats = metrics.for_sink(getattr(self.config, 'metrics_sink', None))
+        try:
+            with stats.timer('parse'):
+                self._parse(stats)
+        finally:
+            stats.flush()
+
+    def _parse(self, stats):
+        """Parse the downloaded html, timing each stage into `stats`."""
+        parser = self.config.get_parser()
+        with stats.timer('fromstring'):
+            self.doc = self._fromstring(parser)
 
         if self.doc is None:
             # `parse` call failed, return nothing
             return
 
-        # TODO(hieulq): Fix this, sync in our fix_url() method
-        meta_lang = self.extractor.get_meta_lang(self.clean_doc)
-        if CONF.news_detector.language not in meta_lang[0]:
-            return
-
-        if self.config.use_meta_language:
-            self.extractor.update_language(meta_lang[0])
-
-        parse_candidate = self.get_parse_candidate()
-        self.link_hash = parse_candidate.link_hash  # MD5
-
-        document_cleaner = DocumentCleaner(self.config)
-
-        title = self.extractor.get_title(self.clean_doc)
-        self.set_title(title)
-
-        authors = self.extractor.get_authors(self.clean_doc)
-        self.set_authors(authors)
-
-        meta_favicon = self.extractor.get_favicon(self.clean_doc)
-        self.set_meta_favicon(meta_favicon)
-
-        meta_description = \
-            self.extractor.get_meta_description(self.clean_doc)
-        self.set_meta_description(meta_description)
-
-        canonical_link = self.extractor.get_canonical_link(self.clean_doc)
-        self.set_canonical_link(canonical_link)
-
-        tags = self.extractor.extract_tags(self.clean_doc)
-        self.set_tags(tags)
-
-        meta_keywords = self.extractor.get_meta_keywords(
-            self.clean_doc)
-        self.set_meta_keywords(meta_keywords)
-
-        meta_data = self.extractor.get_meta_data(self.clean_doc)
-        self.set_meta_data(meta_data)
-
-        self.publish_date = self.extractor.get_publishing_date(
-            self.url,
-            self.clean_doc)
-
-        # Before any computations on the body, clean DOM object
-        self.doc = document_cleaner.clean(self.doc)
-
-        self.top_node = self.extractor.calculate_best_node(self.doc)
+        # Metadata extraction is read-only, so it runs on the parsed tree
+        # itself. The tree is only copied when DocumentCleaner writes to it,
+        # see below. Index it once for all the getElementsByTag lookups.
+        self.clean_doc = self.doc
+        with stats.timer('index'):
+            index = parser.index(self.clean_doc)
+        try:
+            if stats.enabled:
+                stats.count('nodes', len(index))
+
+            # TODO(hieulq): Fix this, sync in our fix_url() method
+            with stats.timer('get_meta_lang'):
+                meta_lang = self.extractor.get_meta_lang(self.clean_doc)
+            if CONF.news_detector.language not in meta_lang[0]:
+                return
+
+            if self.config.use_meta_language:
+                self.extractor.update_language(meta_lang[0])
+
+            parse_candidate = self.get_parse_candidate()
+            self.link_hash = parse_candidate.link_hash  # MD5
+
+            document_cleaner = DocumentCleaner(self.config)
+
+            with stats.timer('get_title'):
+                title = self.extractor.get_title(self.clean_doc)
+            self.set_title(title)
+
+            with stats.timer('get_authors'):
+                authors = self.extractor.get_authors(self.clean_doc)
+            self.set_authors(authors)
+
+            with stats.timer('get_favicon'):
+                meta_favicon = self.extractor.get_favicon(self.clean_doc)
+            self.set_meta_favicon(meta_favicon)
+
+            with stats.timer('get_meta_description'):
+                meta_description = \
+                    self.extractor.get_meta_description(self.clean_doc)
+            self.set_meta_description(meta_description)
+
+            with stats.timer('get_canonical_link'):
+                canonical_link = self.extractor.get_canonical_link(
+                    self.clean_doc)
+            self.set_canonical_link(canonical_link)
+
+            with stats.timer('extract_tags'):
+                tags = self.extractor.extract_tags(self.clean_doc)
+            self.set_tags(tags)
+
+            with stats.timer('get_meta_keywords'):
+                meta_keywords = self.extractor.get_meta_keywords(
+                    self.clean_doc)
+            self.set_meta_keywords(meta_keywords)
+
+            with stats.timer('get_meta_data'):
+                meta_data = self.extractor.get_meta_data(self.clean_doc)
+            self.set_meta_data(meta_data)
+
+            with stats.timer('get_publishing_date'):
+                self.publish_date = self.extractor.get_publishing_date(
+                    self.url,
+                    self.clean_doc)
+        finally:
+            parser.drop_index(self.clean_doc)
+
+        # Before any computations on the body, clean DOM object. Copy on
+        # write: the untouched tree is only kept aside when asked for.
+        if self.config.keep_clean_doc:
+            with stats.timer('deepcopy'):
+                self.doc = copy.deepcopy(self.doc)
+        else:
+            self.clean_doc = None
+        with stats.timer('clean'):
+            self.doc = document_cleaner.clean(self.doc)
+        if stats.enabled:
+            stats.count('clean.nodes', sum(1 for _ in self.doc.iter()))
+
+        with stats.timer('calculate_best_node'):
+            self.top_node = self.extractor.calculate_best_node(self.doc)
         if self.top_node:
-            video_extractor = VideoExtractor(self.config, self.top_node)
-            self.set_movies(video_extractor.get_videos())
+            with stats.timer('get_videos'):
+                video_extractor = VideoExtractor(self.config, self.top_node)
+                self.set_movies(video_extractor.get_videos())
             self.set_text(self.top_node.xpath)
 
         self.is_parsed = True
         self.release_resources()
 
+    def compile_template(self):
+        """Return the CompiledTemplate of this parsed article, built once."""
+        if not self.is_parsed:
+            raise ArticleException(self)
+        if self.compiled_template is None:
+            self.compiled_template = CompiledTemplate.from_article(self)
+        return self.compiled_template
+
     def from_format(self, template):
-        if not template or not isinstance(template, Article) or \
-                not template.is_parsed or not self.is_downloaded:
+        """Extract content with the format of a parsed article, given as
+        the template `Article` itself or as its `CompiledTemplate`.
+        """
+        if isinstance(template, Article) and template.is_parsed:
+            template = template.compile_template()
+        if not isinstance(template, CompiledTemplate) or \
+                not self.is_downloaded:
             raise ArticleException(self)
 
-        self.doc = self.config.get_parser().fromstring(self.html)
-        self.clean_doc = copy.deepcopy(self.doc)
+        parser = self.config.get_parser()
+        self.doc = self._fromstring(parser)
 
         if self.doc is None:
             # `parse` call failed, return nothing
             raise ArticleException(self)
 
-        parser = self.config.get_parser()
-        if template.title:
-            res = parser.xpath_re(self.doc, template.title)
-            if res:
-                self.title = res[0].text
-
-        if template.text:
-            texts = parser.xpath_re(self.doc, template.text)
-            res = ''
-            for text in texts:
-                res += text.text + '\n'
-            self.text = res
-
-        if template.authors:
-            res = parser.xpath_re(self.doc, template.authors[0])
-            if res:
-                self.authors = res[0].text
-
-        if template.publish_date:
-            res = parser.xpath_re(self.doc, template.publish_date)
-            if res:
-                self.publish_date = res[0].text
+        for field, value in template.apply(self.doc).items():
+            setattr(self, field, value)
 
         self.is_parsed = True
         self.release_resources()
@@ -160,9 +312,72 @@ class Article(base_article.Article):
                 "+ Content: %s\n" % (self.url, self.title, self.authors,
                                      self.publish_date, self.text))
 
+    def download(self, html=None, **kwargs):
+        fetcher = getattr(self.config, 'fetcher', None)
+        raw_html = encoding = None
+        if html is None and fetcher is not None:
+            raw_html, charset = fetcher.fetch_raw(self.url)
+            html, encoding = self.config.get_parser().decode(raw_html,
+                                                             charset)
+        if html is not None:
+            kwargs['html'] = html
+        super(Article, self).download(**kwargs)
+        # a meta refresh may have replaced the fetched html
+        if raw_html and self.html is html:
+            self.raw_html, self.html_encoding = raw_html, encoding
+        else:
+            self.raw_html = self.html_encoding = None
+
+    def parse_downloaded(self):
+        """Parse the downloaded html, in a worker process when the config
+        has a parse pool. A page whose html did not change since its last
+        parse gets the result of that parse from the fingerprint cache.
+        """
+        fingerprints = getattr(self.config, 'fingerprints', None)
+        if fingerprints is not None:
+            result = fingerprints.get(self.url, self.html)
+            if result is not None:
+                copy.deepcopy(result).update(self)
+                return
+
+        parse_pool = getattr(self.config, 'parse_pool', None)
+        if parse_pool is None:
+            self.parse()
+        else:
+            parse_pool.parse(self)
+
+        if fingerprints is not None and self.html:
+            fingerprints.put(self.url, self.html,
+                             copy.deepcopy(ParseResult.from_article(self)))
+
+    def mark_seen(self):
+        """Add a parsed article to the seen index. Articles failing to
+        download or parse are not, they are tried again later.
+        """
+        seen_index = getattr(self.config, 'seen_index', None)
+        if seen_index is not None and self.is_parsed:
+            seen_index.add(self.url)
+
     def process(self):
         self.download()
-        self.parse()
+        self.parse_downloaded()
+        self.mark_seen()
+
+    def fetch_metadata(self):
+        """Metadata-only mode: return the ArticleMetadata of the article
+        from its <head>, without parsing its body. With a fetcher the body
+        is not even downloaded. Return None if the page can not be read.
+        """
+        fetcher = getattr(self.config, 'fetcher', None)
+        if fetcher is not None and not self.is_downloaded:
+            doc = fetcher.fetch_head(self.url)
+        else:
+            if not self.is_downloaded:
+                self.download()
+            doc = Parser.head_fromchunks([self.html]) if self.html else None
+        if doc is None:
+            return None
+        return ArticleMetadata.from_doc(self.url, doc, self.extractor)
 
 
 class Source(source.Source):
@@ -175,6 +390,8 @@ class Source(source.Source):
         self.config = utils.extend_config(self.config, kwargs)
 
         self.extractor = extractor
+        self.fetcher = getattr(self.config, 'fetcher', None)
+        self.seen_index = getattr(self.config, 'seen_index', None)
 
         self.url = url
         self.url = urls.prepare_url(url)
@@ -198,70 +415,116 @@ class Source(source.Source):
         self.is_downloaded = False
 
     def set_categories(self):
-        targets = self._get_category_urls(self.domain)
-        # de-duplicate URL in result
-        seen = set()
-        targets = [url for url in targets
-                   if url not in seen and not seen.add(url)]
-        self.categories = [source.Category(url=url) for url in targets]
+        targets = collections.OrderedDict()
+        for url in self._get_category_urls(self.domain):
+            targets.setdefault(seen.canonicalize(url), url)
+        self.categories = [source.Category(url=url)
+                           for url in targets.values()]
+
+    def download(self):
+        if self.fetcher is None:
+            return super(Source, self).download()
+        self.html = self.fetcher.fetch(self.url, cached=True)
+
+    def download_categories(self):
+        """Download all category html concurrently, drop the categories
+        that failed to download
+        """
+        if self.fetcher is None:
+            return super(Source, self).download_categories()
+        pages = self.fetcher.fetch_many(
+            [c.url for c in self.categories], cached=True)
+        for category, html in zip(self.categories, pages):
+            category.html = html
+            if not html:
+                LOG.debug("Cannot download category with url %s" %
+                          category.url)
+        self.categories = [c for c in self.categories if c.html]
+
+    @staticmethod
+    def _process_candidates(articles):
+        """Process articles in order until one is parsed, drop the ones
+        which failed. Return the remaining articles.
+        """
+        while articles:
+            try:
+                articles[0].process()
+                if not articles[0].is_parsed:
+                    raise ArticleException(articles[0])
+            except ArticleException:
+                LOG.error("Cannot process article with url %s" %
+                          articles[0].url)
+                del articles[0]
+                continue
+            break
+        return articles
+
+    @staticmethod
+    def _process_article(article):
+        try:
+            article.process()
+        except ArticleException:
+            LOG.error("Cannot process article with url %s" % article.url)
+
+    def _bucket_articles(self):
+        """Return the articles indexed by netloc and by netloc plus their
+        first path segment, in their original order.
+        """
+        by_netloc = {}
+        by_segment = {}
+        for article in self.articles:
+            netloc, path = split_url(article.url)
+            by_netloc.setdefault(netloc, []).append(article)
+            if path:
+                segment = netloc + "/" + path.split('/', 2)[1]
+                by_segment.setdefault(segment, []).append(article)
+        return by_netloc, by_segment
 
     def _generate_format_for_categories(self, sampling=1,
                                         process_article=True,
                                         process_all=False):
-        categories = self.categories
-        articles = self.articles
         candidates = {}
-        # Eliminate all articles have same domain, keep only sampling candidate
-        for category in categories:
-            flag = sampling
-            domain_path = parse.urlparse(category.url).path
-            domain = parse.urlparse(category.url).netloc + domain_path
-            for article in articles:
-                a_domain = parse.urlparse(article.url).netloc
-                if domain_path:
-                    a_domain += "/" + \
-                        parse.urlparse(article.url).path.split('/', 2)[1]
-                if domain == a_domain:
-                    if domain not in candidates:
-                        candidates[domain] = []
-                    candidates[domain].append(article)
-                    flag -= 1
-                if flag == 0:
-                    break
+        by_netloc, by_segment = self._bucket_articles()
+        # Eliminate all articles have same domain, keep only sampling
+        # candidate. A category without path matches the articles of its
+        # netloc, otherwise the ones under the same first path segment.
+        for category in self.categories:
+            netloc, domain_path = split_url(category.url)
+            domain = netloc + domain_path
+            if domain_path:
+                matches = by_segment.get(domain)
+            else:
+                matches = by_netloc.get(domain)
+            if not matches:
+                continue
+            if self.seen_index is not None:
+                # articles downloaded before are no candidates, looked up
+                # only until enough candidates are found
+                matches = (article for article in matches
+                           if article.url not in self.seen_index)
+            matches = list(itertools.islice(
+                matches, sampling if sampling > 0 else None))
+            if matches:
+                candidates.setdefault(domain, []).extend(matches)
 
         # Return unprocess article if process_article=False
         if not process_article:
             return candidates
 
-        # Detect format for each domain
+        # Detect format for each domain, domains are processed concurrently
+        # when a fetcher is configured
+        imap = self.fetcher.imap if self.fetcher else map
         if process_all:
-            for key, values in candidates.items():
-                for value in values:
-                    try:
-                        value.process()
-                    except ArticleException:
-                        LOG.error("Cannot process article with url %s" %
-                                  value.url)
-                        continue
+            list(imap(self._process_article,
+                      [value for values in candidates.values()
+                       for value in values]))
         else:
-            for domain in list(candidates):
-                while True:
-                    try:
-                        if len(candidates[domain]) > 0:
-                            candidates[domain][0].process()
-                            if not candidates[domain][0].is_parsed:
-                                raise ArticleException(candidates[domain][0])
-                        else:
-                            break
-                    except ArticleException:
-                        LOG.error("Cannot process article with url %s" %
-                                  candidates[domain][0].url)
-                        del candidates[domain][0]
-                        if len(candidates[domain]) < 1:
-                            del candidates[domain]
-                            break
-                        continue
-                    break
+            domains = list(candidates)
+            results = imap(self._process_candidates,
+                           [candidates[domain] for domain in domains])
+            for domain, remaining in zip(domains, results):
+                if not remaining:
+                    del candidates[domain]
 
         return candidates
 
@@ -283,37 +546,90 @@ class Source(source.Source):
     #
     #     return articles
 
-    def categories_to_articles(self):
-        """Takes the categories, splays them into a big list of urls and churns
-        the articles out of each url with the url_to_article method
+    def parse_categories(self):
+        """Parse the html of each category. A category whose html did not
+        change since its last parse gets its links from the fingerprint
+        cache instead.
         """
-        articles = []
+        fingerprints = getattr(self.config, 'fingerprints', None)
+        if fingerprints is None:
+            return super(Source, self).parse_categories()
+        parser = self.config.get_parser()
         for category in self.categories:
-            cur_articles = []
-            url_title_tups = self.extractor.get_urls(category.doc, titles=True)
-
-            for tup in url_title_tups:
-                indiv_url = tup[0]
-                indiv_title = tup[1]
-
-                _article = Article(url=indiv_url, source_url=self.url,
-                                   title=indiv_title, config=self.config,
-                                   extractor=self.extractor)
-                cur_articles.append(_article)
-
-            cur_articles = self.purge_articles('url', cur_articles)
-            articles.extend(cur_articles)
+            key = ('links', category.url)
+            category.links = fingerprints.get(key, category.html or '')
+            if category.links is not None:
+                continue
+            category.doc = parser.fromstring(category.html)
+            if category.doc is not None:
+                category.links = list(
+                    self.extractor.iter_urls(category.doc, titles=True))
+                fingerprints.put(key, category.html, category.links)
+        self.categories = [c for c in self.categories
+                           if c.links is not None]
+
+    def purge_articles(self, reason, articles):
+        """Delete rejected articles. A list is purged in place and
+        returned, any other iterable is filtered lazily.
+        """
+        if reason == 'url':
+            kept = (a for a in articles if a.is_valid_url())
+        elif reason == 'body':
+            kept = (a for a in articles if a.is_valid_body())
+        else:
+            kept = iter(articles)
+        if isinstance(articles, list):
+            articles[:] = kept
+            return articles
+        return kept
+
+    def _iter_category_articles(self):
+        """Yield an article for each link of the categories."""
+        for category in self.categories:
+            links = getattr(category, 'links', None)
+            if links is None:
+                links = self.extractor.iter_urls(category.doc, titles=True)
+            for url, title in links:
+                yield Article(url=url, source_url=self.url, title=title,
+                              config=self.config, extractor=self.extractor)
 
+    def categories_to_articles(self):
+        """Stream the links of every category into articles, keeping the
+        first valid article of each url.
+        """
+        urls = set()
+        articles = []
+        for article in self.purge_articles('url',
+                                           self._iter_category_articles()):
+            key = seen.canonicalize(article.url)
+            if key not in urls:
+                urls.add(key)
+                articles.append(article)
         return articles
 
-    def process(self):
+    def _is_failing(self):
+        health = getattr(self.config, 'health', None)
+        if health is not None and health.is_open(domain_of(self.url)):
+            LOG.warning("Skip source with url %s, its domain is failing" %
+                        self.url)
+            return True
+        return False
+
+    def process(self, process_article=True):
+        """Return candidate articles by category key, the first one of each
+        parsed unless `process_article` is False.
+        """
         result = {}
+        if self._is_failing():
+            return result
         try:
             self.download()
             self.parse()
 
             self.set_categories()
             self.download_categories()  # mthread
+            if self._is_failing():
+                return result
             self.parse_categories()
 
             # self.set_feeds()
@@ -321,7 +637,8 @@ class Source(source.Source):
             # TODO(hieulq): self.parse_feeds()  # regex for now
 
             self.generate_articles()
-            result = self._generate_format_for_categories()
+            result = self._generate_format_for_categories(
+                process_article=process_article)
         except fixtures.TimeoutException:
             LOG.error("Cannot process source with url %s" %
                       self.url)
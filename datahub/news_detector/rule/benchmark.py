@@ -0,0 +1,251 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+End-to-end benchmark of the rule detector, run as datahub-benchmark.
+
+Every page of a corpus goes through the stages of `Article.parse`, each of
+them timed separately, then through `Article.from_format` with the
+template of that page. Results are dumped as JSON to be compared with the
+results of another commit:
+
+    datahub-benchmark --output before.json
+    # ... change the code ...
+    datahub-benchmark --baseline before.json --threshold 10
+
+The second run exits with status 1 when the median latency of a stage grew
+by more than the threshold. The command is not eventlet monkey patched,
+unlike the services of datahub.cmd.
+"""
+
+import argparse
+import collections
+import copy
+import json
+import os
+import sys
+import time
+
+from newspaper.cleaners import DocumentCleaner
+
+import datahub
+from datahub.news_detector.rule.article import Article
+from datahub.news_detector.rule.config import SourceConfig
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule import replay
+
+# Pages of the unit tests, shipped with the package
+BUNDLED_CORPUS = os.path.join(os.path.dirname(datahub.__file__), 'tests',
+                              'unit', 'news_detector', 'rule', 'fixtures')
+# Base URL of the pages of a plain html directory
+CORPUS_URL = 'http://localhost/'
+PERCENTILES = (50, 95, 99)
+
+BenchmarkPage = collections.namedtuple('BenchmarkPage',
+                                       ['url', 'body', 'charset'])
+
+
+def load_corpus(path):
+    """Return the BenchmarkPages of `path`: a replay corpus, see
+    `replay.open_corpus`, or a directory of .html files.
+    """
+    if os.path.isdir(path) and \
+            not os.path.exists(os.path.join(path, replay.DIRECTORY_INDEX)):
+        pages = []
+        for name in sorted(os.listdir(path)):
+            if name.endswith('.html'):
+                with open(os.path.join(path, name), 'rb') as f:
+                    pages.append(BenchmarkPage(CORPUS_URL + name, f.read(),
+                                               None))
+        return pages
+    corpus = replay.open_corpus(path)
+    try:
+        pages = []
+        for url in corpus:
+            page = corpus.get(url)
+            if page is not None and page.body:
+                pages.append(BenchmarkPage(url, page.body, page.charset))
+        return pages
+    finally:
+        corpus.close()
+
+
+def percentile(samples, percent):
+    """Return the nearest-rank `percent` percentile of sorted `samples`."""
+    if not samples:
+        return 0.0
+    rank = max(int(round(percent / 100.0 * len(samples))), 1)
+    return samples[min(rank, len(samples)) - 1]
+
+
+def summarize(durations):
+    """Return the throughput and latency figures of a list of durations,
+    in seconds, of one stage.
+    """
+    samples = sorted(durations)
+    total = sum(samples)
+    result = {
+        'count': len(samples),
+        'pages_per_sec': len(samples) / total if total else 0.0,
+        'mean_ms': total * 1000 / len(samples) if samples else 0.0,
+    }
+    for percent in PERCENTILES:
+        result['p%d_ms' % percent] = percentile(samples, percent) * 1000
+    return result
+
+
+class Benchmark(object):
+    """Stage timings of the rule detector over a list of BenchmarkPages."""
+
+    EXTRACTOR_STAGES = ('get_meta_lang', 'get_title', 'get_authors',
+                        'get_favicon', 'get_meta_description',
+                        'get_canonical_link', 'get_meta_keywords',
+                        'get_meta_data')
+
+    def __init__(self, pages, config=None):
+        self.pages = pages
+        self.config = config or SourceConfig()
+        self.extractor = Extractor(self.config)
+        self.parser = self.config.get_parser()
+        self.durations = collections.OrderedDict()
+        self._templates = {}
+
+    def _time(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.durations.setdefault(stage, []).append(
+            time.perf_counter() - start)
+        return result
+
+    def _template(self, page, html):
+        template = self._templates.get(page.url)
+        if template is None:
+            article = Article(page.url, config=self.config,
+                              extractor=self.extractor)
+            article.download(html=html)
+            article.parse()
+            template = self._templates[page.url] = (
+                article.compile_template() if article.is_parsed else False)
+        return template
+
+    def run_page(self, page):
+        """Time each stage once on `page`."""
+        html, encoding = self._time('decode', self.parser.decode,
+                                    page.body, page.charset)
+        doc = self._time('fromstring', self.parser.fromstring, page.body,
+                         encoding)
+        if doc is None:
+            return
+        self._time('index', self.parser.index, doc)
+        for stage in self.EXTRACTOR_STAGES:
+            self._time(stage, getattr(self.extractor, stage), doc)
+        self._time('get_publishing_date', self.extractor.get_publishing_date,
+                   page.url, doc)
+        self.parser.drop_index(doc)
+
+        doc = self._time('deepcopy', copy.deepcopy, doc)
+        cleaner = DocumentCleaner(self.config)
+        doc = self._time('clean', cleaner.clean, doc)
+        self._time('calculate_best_node', self.extractor.calculate_best_node,
+                   doc)
+
+        template = self._template(page, html)
+        if template:
+            article = Article(page.url, config=self.config,
+                              extractor=self.extractor)
+            article.download(html=html)
+            self._time('from_format', article.from_format, template)
+
+    def run(self, rounds=1):
+        """Run every page `rounds` times, return the results by stage."""
+        for _ in range(rounds):
+            for page in self.pages:
+                self.run_page(page)
+        return collections.OrderedDict(
+            (stage, summarize(durations))
+            for stage, durations in self.durations.items())
+
+
+def compare(baseline, results, threshold):
+    """Return the stages whose median latency grew by more than
+    `threshold` percent from `baseline`, both being results of `run`, as
+    (stage, baseline p50, p50) tuples.
+    """
+    regressions = []
+    for stage, result in results.items():
+        before = baseline.get(stage)
+        if not before or not before['p50_ms']:
+            continue
+        if result['p50_ms'] > before['p50_ms'] * (1 + threshold / 100.0):
+            regressions.append((stage, before['p50_ms'], result['p50_ms']))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='datahub-benchmark',
+        description='Measure the throughput and latency of each stage of '
+                    'the rule detector over a local html corpus.')
+    parser.add_argument('--corpus', default=BUNDLED_CORPUS,
+                        help='Directory of .html files, replay directory '
+                             'or WARC file. Defaults to the bundled pages.')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Number of runs over the corpus.')
+    parser.add_argument('--output',
+                        help='File the JSON results are written to, stdout '
+                             'by default.')
+    parser.add_argument('--baseline',
+                        help='JSON results of an earlier run to compare '
+                             'with.')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Median latency increase, in percent, '
+                             'reported as a regression.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    pages = load_corpus(args.corpus)
+    if not pages:
+        sys.stderr.write('No page found in %s\n' % args.corpus)
+        return 2
+
+    results = {
+        'corpus': args.corpus,
+        'pages': len(pages),
+        'rounds': args.rounds,
+        'stages': Benchmark(pages).run(args.rounds),
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline['stages'], results['stages'],
+                              args.threshold)
+        results['regressions'] = [
+            {'stage': stage, 'baseline_p50_ms': before, 'p50_ms': after}
+            for stage, before, after in regressions]
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+    for stage, before, after in regressions:
+        sys.stderr.write('Regression of %s: p50 %.3f ms -> %.3f ms\n' %
+                         (stage, before, after))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -28,6 +28,27 @@ class SourceConfig(configuration.Configuration):
         self.fetch_images = False
         self.memoize_articles = False
         self.browser_user_agent = 'datahub/1.0'
+        # Keep a pristine copy of the article tree in `clean_doc` after
+        # parsing, otherwise the tree is cleaned in place
+        self.keep_clean_doc = False
+        # Fetcher shared by sources and articles, newspaper's own network
+        # functions are used when it is not set
+        self.fetcher = None
+        # Pool of processes parsing downloaded articles, articles are
+        # parsed in place when it is not set
+        self.parse_pool = None
+        # Index of the article URLs already parsed, articles are
+        # downloaded whether seen or not when it is not set
+        self.seen_index = None
+        # Cache of the parse results of pages, every download is parsed
+        # when it is not set
+        self.fingerprints = None
+        # Metrics sink receiving the timings of the parse stages, parses are
+        # not instrumented when it is not set
+        self.metrics_sink = None
+        # Health of the domains requested by the fetcher, failing domains
+        # are requested anyway when it is not set
+        self.health = None
 
     def get_parser(self):
         return Parser
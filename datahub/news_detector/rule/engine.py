@@ -10,14 +10,30 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import eventlet
+from eventlet import queue
 from oslo_log import log as logging
+from oslo_utils import units
 
+from datahub.common import httpcache
+from datahub.common import metrics
+from datahub.common import mq
 from datahub.news_detector import engine_base
 from datahub.news_detector.rule.article import Article
 from datahub.news_detector.rule.article import ArticleException
 from datahub.news_detector.rule.article import Source
 from datahub.news_detector.rule.config import SourceConfig
 from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule.fetcher import Fetcher
+from datahub.news_detector.rule.fingerprint import FingerprintCache
+from datahub.news_detector.rule.health import domain_of
+from datahub.news_detector.rule.health import HealthTracker
+from datahub.news_detector.rule.parse_pool import ParsePool
+from datahub.news_detector.rule.replay import open_corpus
+from datahub.news_detector.rule.replay import ReplayFetcher
+from datahub.news_detector.rule.seen import SeenIndex
+from datahub.news_detector.rule.store import template_key
+from datahub.news_detector.rule.store import TemplateStore
 
 import datahub.conf
 
@@ -30,23 +46,251 @@ class Engine(engine_base.Engine):
     def __init__(self):
         self.config = SourceConfig()
         self.extractor = Extractor(self.config)
+        if CONF.news_detector.replay_corpus:
+            self.config.fetcher = ReplayFetcher(
+                self.config, open_corpus(CONF.news_detector.replay_corpus))
+        else:
+            cache = None
+            if CONF.news_detector.http_cache:
+                cache = httpcache.HttpCache(
+                    CONF.news_detector.http_cache,
+                    ttl=CONF.news_detector.http_cache_ttl,
+                    max_size=CONF.news_detector.http_cache_size * units.Mi)
+            if CONF.news_detector.domain_health:
+                self.config.health = HealthTracker(
+                    CONF.news_detector.fetch_timeout,
+                    min_timeout=CONF.news_detector.fetch_timeout_min,
+                    error_rate=CONF.news_detector.circuit_error_rate,
+                    min_requests=CONF.news_detector.circuit_min_requests,
+                    cooldown=CONF.news_detector.circuit_cooldown)
+            self.config.fetcher = Fetcher(self.config, cache=cache,
+                                          health=self.config.health)
+        if CONF.news_detector.parse_cache_size:
+            self.config.fingerprints = FingerprintCache(
+                CONF.news_detector.parse_cache_size,
+                CONF.news_detector.parse_cache_simhash_distance)
+        self.config.metrics_sink = self._metrics_sink()
+        if CONF.news_detector.parse_workers:
+            self.config.parse_pool = ParsePool(
+                CONF.news_detector.parse_workers)
+        self.store = None
+        if CONF.news_detector.template_store:
+            self.store = TemplateStore(
+                self._state_path(CONF.news_detector.template_store))
+        if CONF.news_detector.seen_index:
+            self.config.seen_index = SeenIndex(
+                self._state_path(CONF.news_detector.seen_index),
+                CONF.news_detector.seen_index_size)
 
-    def detect(self, context, target_url, is_article=False):
-        if is_article:
-            article = Article(target_url, config=self.config,
-                              extractor=self.extractor)
-            try:
-                article.process()
-            except ArticleException:
-                LOG.error("Cannot process article with %s" % target_url)
-                article = None
-            return article
+    def close(self):
+        if self.config.parse_pool is not None:
+            self.config.parse_pool.close()
+        self.config.fetcher.close()
+        if self.store is not None:
+            self.store.close()
+        if self.config.seen_index is not None:
+            self.config.seen_index.close()
+        close_sink = getattr(self.config.metrics_sink, 'close', None)
+        if close_sink is not None:
+            close_sink()
+
+    @staticmethod
+    def _state_path(path):
+        # a replay starts from a clean state, so that runs over the same
+        # corpus give the same results
+        if CONF.news_detector.replay_corpus:
+            return ':memory:'
+        return path
+
+    @staticmethod
+    def _metrics_sink():
+        sink = CONF.news_detector.metrics_sink
+        if sink == 'memory':
+            return metrics.HistogramSink()
+        if sink == 'statsd':
+            return metrics.StatsdSink(CONF.news_detector.statsd_host,
+                                      CONF.news_detector.statsd_port,
+                                      CONF.news_detector.metrics_prefix)
+        if sink == 'notifier':
+            if mq.NOTIFIER is None:
+                mq.init(CONF)
+            return metrics.NotifierSink(
+                mq.get_notifier(service='news_detector'),
+                event_type='news_detector.parse')
+        return None
+
+    def _is_trusted(self, record):
+        if record.is_trusted(CONF.news_detector.template_min_success_rate):
+            return True
+        LOG.info("Detect format of %s again, stored one is failing" %
+                 record.key)
+        return False
+
+    def _lookup(self, target_url):
+        if self.store is None:
+            return None
+        record = self.store.lookup(target_url)
+        if record is not None and not self._is_trusted(record):
+            return None
+        return record
+
+    def _extract(self, article, record):
+        """Extract a downloaded article with a stored format, return True
+        if content was found. A page which failed to download says nothing
+        of the format, ArticleException is raised for it.
+        """
+        if not article.is_downloaded:
+            raise ArticleException(article)
+        try:
+            article.from_format(record.template)
+        except ArticleException:
+            pass
         else:
+            if article.title and article.text:
+                self.store.record_success(record.key)
+                return True
+        self.store.record_failure(record.key)
+        article.is_parsed = False
+        return False
+
+    def _process(self, article, record, key):
+        """Download and parse an article, with the stored format of
+        `record` if given. A format detected instead is saved under `key`.
+        """
+        if record is None:
+            article.process()
+        else:
+            article.download()
+            if self._extract(article, record):
+                article.mark_seen()
+                return
+            article.parse_downloaded()
+            article.mark_seen()
+        if self.store is not None and article.is_parsed:
+            self.store.save(key, article)
+
+    def _detect_article(self, target_url):
+        article = Article(target_url, config=self.config,
+                          extractor=self.extractor)
+        record = self._lookup(target_url)
+        try:
+            self._process(article, record,
+                          record.key if record else template_key(target_url))
+        except ArticleException:
+            LOG.error("Cannot process article with %s" % target_url)
+            article = None
+        return article
+
+    def _detect_category(self, articles, record, key):
+        """Process the candidate articles of category `key` in order until
+        one is parsed, drop the ones which failed. Return the remaining
+        articles.
+        """
+        while articles:
             try:
-                src = Source(target_url, config=self.config,
-                             extractor=self.extractor)
-                result = src.process()
-            except ValueError:
-                LOG.error("Cannot process domain with %s" % target_url)
-                result = None
+                self._process(articles[0], record, key)
+                if articles[0].is_parsed:
+                    break
+            except ArticleException:
+                pass
+            LOG.error("Cannot process article with url %s" %
+                      articles[0].url)
+            del articles[0]
+        return articles
+
+    def _detect_source(self, target_url):
+        """Return the candidate articles of a site by category key, the
+        first one of each parsed, with the trusted stored formats of the
+        site if it has any.
+        """
+        try:
+            src = Source(target_url, config=self.config,
+                         extractor=self.extractor)
+        except ValueError:
+            LOG.error("Cannot process domain with %s" % target_url)
+            return None
+
+        records = {}
+        if self.store is not None:
+            records = dict((record.key, record)
+                           for record in self.store.get_site(src.domain)
+                           if self._is_trusted(record))
+        if not records:
+            result = src.process()
+            if self.store is not None and result:
+                for key, articles in result.items():
+                    if articles and articles[0].is_parsed:
+                        self.store.save(key, articles[0])
             return result
+
+        result = src.process(process_article=False)
+        fetcher = getattr(self.config, 'fetcher', None)
+        imap = fetcher.imap if fetcher is not None else map
+        keys = list(result)
+        remaining = imap(lambda key: self._detect_category(
+            result[key], records.get(key), key), keys)
+        for key, articles in zip(keys, remaining):
+            if not articles:
+                del result[key]
+        return result
+
+    def detect(self, context, target_url, is_article=False):
+        if is_article:
+            return self._detect_article(target_url)
+        return self._detect_source(target_url)
+
+    def _detect_claimed(self, context, url, is_article):
+        seen_index = self.config.seen_index
+        health = self.config.health
+        # checked first, a skipped URL must not be claimed
+        if health is not None and health.is_open(domain_of(url)):
+            LOG.debug("Skip %s, its domain is failing" % url)
+            return None
+        if (is_article and seen_index is not None and
+                not seen_index.add(url)):
+            LOG.debug("Skip %s, it was already downloaded" % url)
+            return None
+        try:
+            result = self.detect(context, url, is_article=is_article)
+        except Exception:
+            LOG.exception("Cannot detect %s" % url)
+            result = None
+        if (is_article and seen_index is not None and
+                not getattr(result, 'is_parsed', False)):
+            # claimed above, a failed article is tried again later
+            seen_index.discard(url)
+        return result
+
+    def _detect_one(self, context, url, is_article, results):
+        # detect_many waits for exactly one result per URL
+        result = None
+        try:
+            result = self._detect_claimed(context, url, is_article)
+        except Exception:
+            LOG.exception("Cannot detect %s" % url)
+        finally:
+            results.put((url, result))
+
+    def detect_many(self, context, urls, is_article=True):
+        """Detect a batch of URLs concurrently.
+
+        Each URL is handled by one of `detect_workers` green threads, the
+        fetcher bounding the requests sent to a single host. Yield (url,
+        result) tuples as they complete, not in input order. URLs of a
+        domain whose circuit is open are skipped with a None result. With
+        a seen index, so are the articles already parsed or claimed by
+        another URL of this batch, and an article which is not parsed is
+        released from the index.
+        """
+        urls = list(urls)
+        results = queue.LightQueue()
+        pool = eventlet.GreenPool(CONF.news_detector.detect_workers)
+
+        def dispatch():
+            for url in urls:
+                pool.spawn_n(self._detect_one, context, url, is_article,
+                             results)
+
+        eventlet.spawn_n(dispatch)
+        for _ in range(len(urls)):
+            yield results.get()
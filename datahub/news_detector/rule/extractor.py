@@ -16,7 +16,14 @@ from newspaper import extractors
 from newspaper.videos import extractors as ve
 import re
 
+from datahub.news_detector.rule import scoring
+
 RE_LANG = r'^[A-Za-z]{2}$'
+RE_TITLE_FILTER = re.compile(r'[^a-zA-Z0-9\ ]')
+RE_DIGITS = re.compile(r'\d')
+RE_HTML_TAGS = re.compile(r'<[^<]+?>')
+RE_BYLINE = re.compile(r'[bB][yY][\:\s]|[fF]rom[\:\s]')
+RE_NAME_SEPARATOR = re.compile(r"[^\w\'\-\.]")
 NO_STRINGS = set()
 A_REL_TAG_SELECTOR = "a[rel=tag]"
 A_HREF_TAG_SELECTOR = ("a[href*='/tag/'], a[href*='/tags/'], "
@@ -35,6 +42,33 @@ class VideoExtractor(ve.VideoExtractor):
 
 class Extractor(extractors.ContentExtractor):
 
+    def __init__(self, config):
+        super(Extractor, self).__init__(config)
+        self._stopwords = {}
+
+    def get_stopwords(self):
+        """Return the stopwords object of the current language, built once
+        per language and stopwords class.
+        """
+        key = (self.stopwords_class, self.language)
+        stopwords = self._stopwords.get(key)
+        if stopwords is None:
+            stopwords = self.stopwords_class(language=self.language)
+            self._stopwords[key] = stopwords
+        return stopwords
+
+    def get_stopword_count(self, text, counts=None):
+        """Return the stopword count of `text`, memoized in `counts` when
+        given.
+        """
+        if counts is not None and text in counts:
+            return counts[text]
+        count = self.get_stopwords().get_stopword_count(text).\
+            get_stopword_count()
+        if counts is not None:
+            counts[text] = count
+        return count
+
     def get_title(self, doc):
         """Fetch the article title and analyze it
 
@@ -88,10 +122,9 @@ class Extractor(extractors.ContentExtractor):
 
         # create filtered versions of title_text, title_text_h1, title_text_fb
         # for finer comparison
-        filter_regex = re.compile(r'[^a-zA-Z0-9\ ]')
-        filter_title_text = filter_regex.sub('', title_text).lower()
-        filter_title_text_h1 = filter_regex.sub('', title_text_h1).lower()
-        filter_title_text_fb = filter_regex.sub('', title_text_fb).lower()
+        filter_title_text = RE_TITLE_FILTER.sub('', title_text).lower()
+        filter_title_text_h1 = RE_TITLE_FILTER.sub('', title_text_h1).lower()
+        filter_title_text_fb = RE_TITLE_FILTER.sub('', title_text_fb).lower()
 
         # check for better alternatives for title_text and possibly
         # skip splitting
@@ -117,10 +150,8 @@ class Extractor(extractors.ContentExtractor):
         """Fetch the authors of the article, return as a list
         Only works for english articles
         """
-        _digits = re.compile('\d')
-
         def contains_digits(d):
-            return bool(_digits.search(d))
+            return bool(RE_DIGITS.search(d))
 
         def uniqify_list(lst):
             """Remove duplicates from provided list but maintain original order.
@@ -144,15 +175,15 @@ class Extractor(extractors.ContentExtractor):
             """
             search_str = obj.text
             # Remove HTML boilerplate
-            search_str = re.sub('<[^<]+?>', '', search_str)
+            search_str = RE_HTML_TAGS.sub('', search_str)
 
             # Remove original By statement
-            search_str = re.sub('[bB][yY][\:\s]|[fF]rom[\:\s]', '', search_str)
+            search_str = RE_BYLINE.sub('', search_str)
 
             search_str = search_str.strip()
 
             # Chunk the line by non alphanumeric tokens (few name exceptions)
-            name_tokens = re.split("[^\w\'\-\.]", search_str)
+            name_tokens = RE_NAME_SEPARATOR.split(search_str)
             name_tokens = [s.strip() for s in name_tokens]
 
             _authors = []
@@ -408,96 +439,133 @@ class Extractor(extractors.ContentExtractor):
 
         return ''
 
-    def calculate_best_node(self, doc):
-        top_node = None
-        nodes_to_check = self.nodes_to_check(doc)
-        starting_boost = float(1.0)
-        cnt = 0
-        i = 0
-        parent_nodes = []
+    def _is_boostable(self, node, counts):
+        para = "p"
+        steps_away = 0
+        minimum_stopword_count = 5
+        max_stepsaway_from_node = 3
+
+        # Siblings are walked lazily, the search stops a few paragraphs
+        # away from the node
+        for current_node in self.parser.previousSiblings(node):
+            if self.parser.getTag(current_node) == para:
+                if steps_away >= max_stepsaway_from_node:
+                    return False
+                paragraph_text = self.parser.getText(current_node)
+                if self.get_stopword_count(paragraph_text, counts) > \
+                        minimum_stopword_count:
+                    return True
+                steps_away += 1
+        return False
+
+    def is_boostable(self, node):
+        return self._is_boostable(node, {})
+
+    def is_highlink_density(self, e):
+        return scoring.LinkDensity(e).is_high(e)
+
+    def _nodes_with_text(self, doc, counts):
+        """Return the (node, stopword count) of the nodes to check which
+        hold enough text and few links.
+        """
         nodes_with_text = []
-
+        nodes_to_check = self.nodes_to_check(doc)
+        if not nodes_to_check:
+            return nodes_with_text
+        link_density = scoring.LinkDensity(doc)
         for node in nodes_to_check:
             text_node = self.parser.getText(node.ele)
-            word_stats = self.stopwords_class(language=self.language).\
-                get_stopword_count(text_node)
-            high_link_density = self.is_highlink_density(node.ele)
-            if word_stats.get_stopword_count() > 2 and not high_link_density:
-                nodes_with_text.append(node)
-
-        nodes_number = len(nodes_with_text)
-        negative_scoring = 0
-        bottom_negativescore_nodes = float(nodes_number) * 0.25
-
-        for node in nodes_with_text:
-            boost_score = float(0)
-            # boost
-            if self.is_boostable(node.ele):
-                if cnt >= 0:
-                    boost_score = float((1.0 / starting_boost) * 50)
-                    starting_boost += 1
-            # nodes_number
-            if nodes_number > 15:
-                if (nodes_number - i) <= bottom_negativescore_nodes:
-                    booster = float(
-                        bottom_negativescore_nodes - (nodes_number - i))
-                    boost_score = float(-pow(booster, float(2)))
-                    negscore = abs(boost_score) + negative_scoring
-                    if negscore > 40:
-                        boost_score = float(5)
-
-            text_node = self.parser.getText(node.ele)
-            word_stats = self.stopwords_class(language=self.language).\
-                get_stopword_count(text_node)
-            upscore = int(word_stats.get_stopword_count() + boost_score)
-
-            parent_node = self.parser.getParent(node)
-            self.update_score(parent_node, upscore)
-            self.update_node_count(parent_node, 1)
-
-            if parent_node not in parent_nodes:
-                parent_nodes.append(parent_node)
+            stopword_count = self.get_stopword_count(text_node, counts)
+            high_link_density = link_density.is_high(node.ele)
+            if stopword_count > 2 and not high_link_density:
+                nodes_with_text.append((node, stopword_count))
+        return nodes_with_text
+
+    def _upscores(self, nodes_with_text, counts, scorer=scoring.PYTHON):
+        """Return the score each node gives to its parent."""
+        stopword_counts = [count for _, count in nodes_with_text]
+        boostable = [self._is_boostable(node.ele, counts)
+                     for node, _ in nodes_with_text]
+        return scorer.upscores(stopword_counts, boostable)
+
+    def _parent_scores(self, nodes_with_text, upscores,
+                       scorer=scoring.PYTHON):
+        """Add up the scores of the parents and grandparents of the nodes.
+
+        Return a dict keyed by lxml element, in order of first occurrence,
+        of [ObjectParser, score, node count]. The wrapper, and so the
+        xpath, of an element is only built once.
+        """
+        index = {}
+        wrappers = []
+        parents = []
+        grandparents = []
+        for node, _ in nodes_with_text:
+            parent = node.ele.getparent()
+            if parent is None:
+                parents.append(-1)
+                grandparents.append(-1)
+                continue
+            parent_index = index.get(parent)
+            if parent_index is None:
+                parent_index = index[parent] = len(wrappers)
+                wrappers.append(self.parser.getParent(node))
+            parents.append(parent_index)
 
             # Parent of parent node
-            parent_parent_node = self.parser.getParent(parent_node)
-            if parent_parent_node is not None:
-                self.update_node_count(parent_parent_node, 1)
-                self.update_score(parent_parent_node, upscore / 2)
-                if parent_parent_node not in parent_nodes:
-                    parent_nodes.append(parent_parent_node)
-            cnt += 1
-            i += 1
-
-        top_node_score = 0
-        for e in parent_nodes:
-            score = self.get_score(e)
+            grandparent = parent.getparent()
+            if grandparent is None:
+                grandparents.append(-1)
+                continue
+            grandparent_index = index.get(grandparent)
+            if grandparent_index is None:
+                grandparent_index = index[grandparent] = len(wrappers)
+                wrappers.append(self.parser.getParent(wrappers[parent_index]))
+            grandparents.append(grandparent_index)
 
-            if score > top_node_score:
-                top_node = e
-                top_node_score = score
+        scores, node_counts = scorer.accumulate(parents, grandparents,
+                                                upscores, len(wrappers))
+        return dict((ele, [wrappers[i], scores[i], node_counts[i]])
+                    for ele, i in index.items())
 
-            if top_node is None:
-                top_node = e
+    def calculate_best_node(self, doc):
+        # Stopword counts by text, shared by the filter, boost and score
+        # steps
+        counts = {}
+        nodes_with_text = self._nodes_with_text(doc, counts)
+        scorer = scoring.get_scorer(len(nodes_with_text))
+        upscores = self._upscores(nodes_with_text, counts, scorer)
+        scores = self._parent_scores(nodes_with_text, upscores, scorer)
+
+        # Highest score wins, the first parent seen when none is positive
+        top_node = None
+        top_node_score = 0
+        for node, score, _ in scores.values():
+            if top_node is None or score > top_node_score:
+                top_node = node
+                top_node_score = max(score, top_node_score)
 
         # Add xpath text() function
         if top_node:
             top_node.xpath += '//text()'
         return top_node
 
+    def iter_urls(self, doc, titles=False):
+        """Yield the distinct hrefs of the <a> tags of `doc`, or (href,
+        title_text) tuples if specified, skipping the ones with a fragment.
+        """
+        if doc is None:
+            return
+        seen = set()
+        for a in doc.iter('a'):
+            href = a.get('href')
+            if not href or '#' in href or href in seen:
+                continue
+            seen.add(href)
+            yield (href, a.text) if titles else href
+
     def _get_urls(self, doc, titles):
         """Return a list of urls or a list of (url, title_text) tuples
         if specified.
         """
-        if doc is None:
-            return []
-
-        a_kwargs = {'tag': 'a'}
-        a_tags = self.parser.getElementsByTag(doc, **a_kwargs)
-
-        # TODO(hieulq): this should be refactored! We should have a seperate
-        # method which siphones the titles our of a list of <a> tags.
-        if titles:
-            return [(a.ele.get('href'), a.ele.text) for a in a_tags
-                    if a.ele.get('href') and '#' not in a.ele.get('href')]
-        return [a.ele.get('href') for a in a_tags if a.ele.get('href') and
-                '#' not in a.ele.get('href')]
+        return list(self.iter_urls(doc, titles))
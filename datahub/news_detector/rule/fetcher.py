@@ -0,0 +1,195 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import contextlib
+import time
+
+import eventlet
+from eventlet import semaphore
+from oslo_log import log as logging
+import requests
+from requests import adapters
+from urllib import parse
+
+import datahub.conf
+from datahub.news_detector.rule.health import domain_of
+from datahub.news_detector.rule.parser import Parser
+
+CONF = datahub.conf.CONF
+LOG = logging.getLogger(__name__)
+
+# Bytes read at once by `Fetcher.fetch_head`, little is read past </head>
+HEAD_CHUNK_SIZE = 4096
+
+
+def content_charset(content_type):
+    """Return the charset given by a Content-Type header value."""
+    if not content_type or 'charset=' not in content_type.lower():
+        return None
+    return requests.utils.get_encoding_from_headers(
+        {'content-type': content_type})
+
+
+def _headers(response):
+    return dict((name, [value]) for name, value in response.headers.items())
+
+
+class Fetcher(object):
+    """Concurrent HTTP fetcher shared by the sources of an engine.
+
+    Requests reuse the connections of one session and are bounded both
+    globally (`fetch_pool_size`) and per host (`fetch_per_host`). Work is
+    spread on eventlet green threads, which only overlap once the process
+    is monkey patched as done by `datahub.cmd`.
+
+    With an HttpCache, the pages fetched as `cached` and served with an
+    ETag or Last-Modified header are stored and downloaded again
+    conditionally, a 304 answer reuses the stored html.
+
+    With a HealthTracker, the timeout of each request adapts to the
+    latency of its domain and the domains whose requests keep failing are
+    not requested until their cooldown is over.
+    """
+
+    def __init__(self, config, pool_size=None, per_host=None, timeout=None,
+                 cache=None, health=None):
+        self.config = config
+        self.cache = cache
+        self.health = health
+        self.pool_size = pool_size or CONF.news_detector.fetch_pool_size
+        self.per_host = per_host or CONF.news_detector.fetch_per_host
+        self.timeout = timeout or CONF.news_detector.fetch_timeout
+
+        self.session = requests.Session()
+        adapter = adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                       pool_maxsize=self.per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = config.browser_user_agent
+
+        self._slots = semaphore.Semaphore(self.pool_size)
+        self._hosts = collections.defaultdict(
+            lambda: semaphore.Semaphore(self.per_host))
+
+    @contextlib.contextmanager
+    def _slot(self, url):
+        with self._hosts[parse.urlparse(url).netloc], self._slots:
+            yield
+
+    def _request(self, url, **kwargs):
+        domain = domain_of(url)
+        timeout = self.timeout
+        if self.health is not None:
+            if not self.health.allow(domain):
+                LOG.debug("Skip %s, its domain is failing" % url)
+                return None
+            timeout = self.health.timeout(domain)
+
+        start = time.monotonic()
+        try:
+            response = self.session.get(url, timeout=timeout,
+                                        allow_redirects=True, **kwargs)
+        except requests.exceptions.RequestException as e:
+            LOG.debug("%s on %s" % (e, url))
+            if self.health is not None:
+                self.health.failure(domain)
+            return None
+        if self.health is not None:
+            # Client errors tell nothing of the health of the server
+            if response.status_code >= 500 or response.status_code == 429:
+                self.health.failure(domain)
+            else:
+                self.health.success(domain, time.monotonic() - start)
+
+        if self.config.http_success_only:
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                LOG.debug("%s on %s" % (e, url))
+                return None
+        return response
+
+    def get(self, url, headers=None):
+        """Return the response of `url`, or None if the request failed."""
+        with self._slot(url):
+            return self._request(url, headers=headers)
+
+    def fetch_head(self, url):
+        """Return the document root of `url` parsed up to the end of its
+        <head>, the rest of the page is not downloaded. Return None on
+        failure.
+        """
+        with self._slot(url):
+            response = self._request(url, stream=True)
+            if response is None:
+                return None
+            charset = content_charset(response.headers.get('Content-Type'))
+            try:
+                return Parser.head_fromchunks(
+                    response.iter_content(HEAD_CHUNK_SIZE), encoding=charset)
+            except requests.exceptions.RequestException as e:
+                LOG.debug("%s on %s" % (e, url))
+                return None
+            finally:
+                response.close()
+
+    def fetch_raw(self, url, cached=False):
+        """Return the body of `url` as bytes, with the charset declared by
+        its Content-Type or None. Return (b'', None) on failure.
+
+        Only `cached` pages go through the HttpCache, the source and
+        category pages downloaded again on each run. Articles are not
+        downloaded twice and would only evict them.
+        """
+        cache = self.cache if cached else None
+        entry = cache.get(url) if cache is not None else None
+        response = self.get(url, entry.validators() if entry else None)
+        if response is None:
+            return b'', None
+        if entry is not None and response.status_code == 304:
+            cache.refresh(url, _headers(response))
+            return entry.body, content_charset(entry.header('Content-Type'))
+
+        body = response.content or b''
+        if cache is not None:
+            if body and ('ETag' in response.headers or
+                         'Last-Modified' in response.headers):
+                cache.put(url, response.status_code, _headers(response),
+                          body)
+            elif entry is not None:
+                # its validators would get an outdated body served
+                cache.delete(url)
+        return body, content_charset(response.headers.get('Content-Type'))
+
+    def fetch(self, url, cached=False):
+        """Return the html of `url`, or an empty string on failure."""
+        return Parser.decode(*self.fetch_raw(url, cached=cached))[0]
+
+    def imap(self, func, iterable):
+        """Apply `func` concurrently, yielding results in input order.
+
+        A pool is created for each call so that nested calls cannot
+        starve each other, the fetch slots bound the actual concurrency.
+        """
+        pool = eventlet.GreenPool(self.pool_size)
+        return pool.imap(func, iterable)
+
+    def fetch_many(self, urls, cached=False):
+        """Return the html of each url, in the order of `urls`."""
+        return list(self.imap(lambda url: self.fetch(url, cached=cached),
+                              urls))
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,116 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import hashlib
+import re
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SIMHASH_BITS = 64
+RE_TAGS = re.compile(r'<[^>]*>')
+
+
+def digest(html):
+    """Return a fingerprint of `html`, the same for pages differing only
+    by their line endings or surrounding whitespace.
+    """
+    html = html.strip().replace('\r\n', '\n')
+    return hashlib.md5(html.encode('utf-8', 'replace')).digest()
+
+
+def _features(html):
+    words = RE_TAGS.sub(' ', html).lower().split()
+    return set(zip(words, words[1:]))
+
+
+def _hash(feature):
+    return int.from_bytes(hashlib.blake2b(
+        ' '.join(feature).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(html):
+    """Return the 64 bits simhash of the distinct word pairs of `html`,
+    near identical pages get simhashes differing by a few bits.
+    """
+    hashes = [_hash(feature) for feature in _features(html)]
+    if not hashes:
+        return 0
+    if numpy is not None:
+        bits = numpy.unpackbits(
+            numpy.array(hashes, dtype='>u8').view(numpy.uint8).reshape(
+                len(hashes), 8), axis=1)
+        # most significant bit first
+        weights = bits.sum(axis=0)
+        value = 0
+        for count in weights:
+            value = (value << 1) | (1 if count * 2 > len(hashes) else 0)
+        return value
+    value = 0
+    for bit in range(SIMHASH_BITS):
+        count = sum(1 for h in hashes if h >> bit & 1)
+        if count * 2 > len(hashes):
+            value |= 1 << bit
+    return value
+
+
+def distance(a, b):
+    """Return the number of bits differing between two simhashes."""
+    return bin(a ^ b).count('1')
+
+
+class FingerprintCache(object):
+    """LRU of the results extracted from pages, keyed by their URL or any
+    hashable key.
+
+    A result is reused while the page keeps the same fingerprint. With a
+    `max_distance`, it is also reused for pages whose simhash is at most
+    that many bits away, such as pages only differing by a timestamp or an
+    ad.
+    """
+
+    def __init__(self, size, max_distance=0):
+        self.size = size
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, html):
+        """Return the result stored for `key` if `html` did not change."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        page_digest, page_simhash, result = entry
+        if page_digest == digest(html):
+            return result
+        if self.max_distance and \
+                distance(page_simhash, simhash(html)) <= self.max_distance:
+            return result
+        return None
+
+    def put(self, key, html, result):
+        page_simhash = simhash(html) if self.max_distance else None
+        entry = (digest(html), page_simhash, result)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
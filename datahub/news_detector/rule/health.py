@@ -0,0 +1,147 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+import time
+from urllib import parse
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Weights of the last sample in the latency average and deviation, and
+# multiplier of the deviation in the timeout, as in TCP (RFC 6298)
+LATENCY_WEIGHT = 0.125
+DEVIATION_WEIGHT = 0.25
+DEVIATION_FACTOR = 4
+# Weight of the last request in the error rate
+ERROR_WEIGHT = 0.2
+
+
+def domain_of(url):
+    """Return the domain whose health covers `url`."""
+    return parse.urlsplit(url).netloc.lower()
+
+
+class DomainHealth(object):
+    """Latency and error rate of the requests sent to one domain."""
+
+    __slots__ = ('latency', 'deviation', 'error_rate', 'requests',
+                 'opened_at')
+
+    def __init__(self):
+        self.latency = None
+        self.deviation = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.opened_at = None
+
+    def record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+            self.deviation = seconds / 2
+        else:
+            self.deviation += DEVIATION_WEIGHT * (
+                abs(self.latency - seconds) - self.deviation)
+            self.latency += LATENCY_WEIGHT * (seconds - self.latency)
+
+    def record(self, failed):
+        self.requests += 1
+        self.error_rate += ERROR_WEIGHT * ((1.0 if failed else 0.0) -
+                                           self.error_rate)
+
+
+class HealthTracker(object):
+    """Health of the domains requested by the fetcher of an engine.
+
+    The timeout of a request is derived from the latency of the previous
+    ones, from `min_timeout` up to `max_timeout` for unknown or erratic
+    domains. Once the error rate of a domain reaches `error_rate` over at
+    least `min_requests` requests, its circuit opens: its requests are
+    refused for `cooldown` seconds, then a single probe request is let
+    through, closing the circuit if it succeeds and opening it again for
+    another cooldown if it fails.
+    """
+
+    def __init__(self, max_timeout, min_timeout=1.0, error_rate=0.5,
+                 min_requests=5, cooldown=300):
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._domains = {}
+
+    def get(self, domain):
+        """Return the DomainHealth of `domain`, None if never requested."""
+        return self._domains.get(domain)
+
+    def _health(self, domain):
+        health = self._domains.get(domain)
+        if health is None:
+            health = self._domains[domain] = DomainHealth()
+        return health
+
+    def timeout(self, domain):
+        """Return the timeout in seconds of a request to `domain`."""
+        health = self._domains.get(domain)
+        if health is None or health.latency is None:
+            return self.max_timeout
+        timeout = health.latency + DEVIATION_FACTOR * health.deviation
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def is_open(self, domain):
+        """Return True while the circuit of `domain` refuses requests."""
+        health = self._domains.get(domain)
+        return (health is not None and health.opened_at is not None and
+                time.monotonic() - health.opened_at < self.cooldown)
+
+    def allow(self, domain):
+        """Return True if a request may be sent to `domain`. Past the
+        cooldown of an open circuit, the first caller is allowed as the
+        probe and the cooldown starts again for the others, so that a lost
+        probe does not keep the circuit open.
+        """
+        with self._lock:
+            health = self._domains.get(domain)
+            if health is None or health.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - health.opened_at < self.cooldown:
+                return False
+            health.opened_at = now
+            return True
+
+    def success(self, domain, seconds):
+        """Record a request to `domain` answered in `seconds`."""
+        with self._lock:
+            health = self._health(domain)
+            health.record_latency(seconds)
+            health.record(False)
+            if health.opened_at is not None:
+                health.opened_at = None
+                health.error_rate = 0.0
+
+    def failure(self, domain):
+        """Record a request to `domain` which timed out or failed."""
+        with self._lock:
+            health = self._health(domain)
+            health.record(True)
+            if health.opened_at is not None:
+                health.opened_at = time.monotonic()
+            elif (health.requests >= self.min_requests and
+                    health.error_rate >= self.error_rate):
+                health.opened_at = time.monotonic()
+                LOG.warning("Skip %s for %d seconds, %d%% of its requests "
+                            "failed" % (domain, self.cooldown,
+                                        health.error_rate * 100))
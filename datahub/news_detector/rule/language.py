@@ -0,0 +1,66 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import re
+
+# Comments and scripts, whose text is not markup
+RE_SKIPPED = re.compile(r'<!--.*?-->|<script\b[^>]*>.*?</script\s*>',
+                        re.I | re.S)
+RE_SKIPPED_START = re.compile(r'<!--|<script\b', re.I)
+RE_HTML = re.compile(r'<html\b([^>]*)>', re.I)
+RE_META = re.compile(r'<meta\b([^>]*)>', re.I)
+RE_ATTR = re.compile(r'''(?:^|\s)([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|'''
+                     r'''([^\s"'>]+))''')
+
+# Meta tags read by `Extractor.get_meta_lang`, in its order
+META_LANGUAGE = (('http-equiv', 'content-language'), ('name', 'lang'))
+
+
+def _attributes(tag):
+    return dict((name.lower(), dquoted or squoted or bare)
+                for name, dquoted, squoted, bare in RE_ATTR.findall(tag))
+
+
+def sniff_language(html, size):
+    """Return the language `Extractor.get_meta_lang` would find in `html`,
+    reading only its first `size` characters, without building any tree.
+
+    The <html lang> attribute is used first, then the content-language
+    and lang meta tags, outside of comments and scripts. None is returned
+    when the beginning of the page is not enough to tell, the page has to
+    be parsed then.
+    """
+    complete = len(html) <= size
+    window = RE_SKIPPED.sub(' ', html[:size])
+    # an unterminated comment or script hides the rest of the window
+    start = RE_SKIPPED_START.search(window)
+    if start is not None:
+        window = window[:start.start()]
+
+    root = RE_HTML.search(window)
+    if root is not None:
+        lang = _attributes(root.group(1)).get('lang')
+        if lang:
+            return lang.lower()
+    elif not complete:
+        return None
+
+    metas = [_attributes(meta) for meta in RE_META.findall(window)]
+    for name, value in META_LANGUAGE:
+        for attributes in metas:
+            if value in attributes.get(name, '').lower():
+                content = attributes.get('content')
+                return content.lower() if content is not None else None
+        if not complete:
+            # a matching tag may follow the window
+            return None
+    return ''
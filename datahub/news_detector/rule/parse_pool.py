@@ -0,0 +1,110 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from concurrent import futures
+import multiprocessing
+import os
+
+from eventlet import hubs
+from eventlet import patcher
+
+import datahub.conf
+from datahub.news_detector.rule.article import Article
+from datahub.news_detector.rule.article import ArticleException
+from datahub.news_detector.rule.article import ParseResult
+from datahub.news_detector.rule.config import SourceConfig
+from datahub.news_detector.rule.extractor import Extractor
+
+CONF = datahub.conf.CONF
+
+# Config and extractor of a worker process, built once by `_init_worker`
+_WORKER = {}
+
+
+def _init_worker(options):
+    # Spawned workers did not parse the configuration of the detector
+    for name, value in options.items():
+        CONF.set_override(name, value, group='news_detector')
+    config = SourceConfig()
+    _WORKER['config'] = config
+    _WORKER['extractor'] = Extractor(config)
+
+
+def _parse(url, html):
+    """Parse `html` in a worker process and return its ParseResult."""
+    article = Article(url, config=_WORKER['config'],
+                      extractor=_WORKER['extractor'])
+    article.download(html=html)
+    article.parse()
+    return ParseResult.from_article(article)
+
+
+class ParsePool(object):
+    """Pool of worker processes running `Article.parse`.
+
+    Downloads stay in the calling process, only the url and html are sent
+    to a worker and a ParseResult comes back. The news_detector options of
+    the detector are passed to the workers.
+
+    Workers are forked, unless the process is eventlet monkey patched: a
+    child forked from a green thread inherits it and never exits, so they
+    are spawned then.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        context = None
+        if patcher.is_monkey_patched('thread'):
+            context = multiprocessing.get_context('spawn')
+        self._executor = futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_init_worker,
+            initargs=(dict(CONF.news_detector),))
+
+    def submit(self, url, html):
+        return self._executor.submit(_parse, url, html)
+
+    @staticmethod
+    def _wait(future):
+        if not patcher.is_monkey_patched('thread') or future.done():
+            return future.result()
+        # Waiting on the future would block the eventlet hub, and its lock
+        # cannot be waited on from a tpool thread either. Its callback may
+        # run in a native thread of the executor, so it wakes the green
+        # thread through a pipe. Each end is closed by its only user.
+        rfd, wfd = os.pipe()
+
+        def done(future):
+            try:
+                os.write(wfd, b'.')
+            except OSError:
+                # the waiting green thread was killed
+                pass
+            finally:
+                os.close(wfd)
+
+        try:
+            future.add_done_callback(done)
+            hubs.trampoline(rfd, read=True)
+        finally:
+            os.close(rfd)
+        return future.result()
+
+    def parse(self, article):
+        """Parse a downloaded article in a worker process."""
+        if not article.is_downloaded:
+            raise ArticleException(article)
+        result = self._wait(self.submit(article.url, article.html))
+        result.update(article)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -9,30 +9,131 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import codecs
 
+from collections import defaultdict
+import functools
 import html
+import re
+import weakref
 
+from bs4 import UnicodeDammit
+from eventlet import patcher
 import lxml.etree
 import lxml.html
 import lxml.html.clean
+from oslo_log import log as logging
 
 from newspaper import parsers
 from newspaper import text
 
+# Per-document element indexes, dropped together with their document root
+_INDEXES = weakref.WeakKeyDictionary()
+# Marker of ObjectParser attributes which are not computed yet
+_UNSET = object()
+# HTML parsers of the native thread, by encoding. Green threads run one
+# at a time in a native thread and share them, even once monkey patched
+_LOCAL = patcher.original('threading').local()
+
+LOG = logging.getLogger(__name__)
+
+REGEXP_NAMESPACES = {'re': "http://exslt.org/regular-expressions"}
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_xpath(expression):
+    """Return the compiled XPath of `expression`, with the EXSLT regular
+    expression namespace, memoized.
+    """
+    return lxml.etree.XPath(expression, namespaces=REGEXP_NAMESPACES)
+
+
+@functools.lru_cache(maxsize=1024)
+def tag_xpath(tag=None, attr=None, value=None):
+    """Return the compiled XPath selecting `tag` elements, the context
+    node included, whose `attr` matches the `value` regex.
+    """
+    selector = 'descendant-or-self::%s' % (tag or '*')
+    if attr and value:
+        selector = '%s[re:test(@%s, "%s", "i")]' % (selector, attr, value)
+    return compile_xpath(selector)
+
+
+def _lxml_encoding(encoding):
+    # libxml2 does not know all the aliases Python does
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return None
+
+
+def html_parser(encoding=None):
+    """Return the lxml HTML parser of the calling thread for bytes in
+    `encoding`, None if libxml2 does not support it. A parser is built
+    once per native thread and encoding and then reused for every
+    document, by all the green threads of that thread.
+    """
+    parsers = getattr(_LOCAL, 'parsers', None)
+    if parsers is None:
+        parsers = _LOCAL.parsers = {}
+    if encoding not in parsers:
+        name = encoding and _lxml_encoding(encoding)
+        try:
+            if encoding and name is None:
+                raise LookupError(encoding)
+            parsers[encoding] = lxml.html.HTMLParser(encoding=name)
+        except LookupError:
+            parsers[encoding] = None
+    return parsers[encoding]
+
 
 class ObjectParser(object):
-    def __init__(self, ele, xpath, text=''):
+    """Wrapper of an lxml element with its xpath and text content.
+
+    `xpath` and `text` are only computed on first access and then cached.
+    Give the element `tree` instead of an `xpath` to have the path derived
+    lazily with `getpath`. Both can still be overridden by assignment.
+    """
+
+    __slots__ = ('ele', '_xpath', '_text', '_tree')
+
+    def __init__(self, ele, xpath=None, text='', tree=None):
         self.ele = ele
-        self.xpath = xpath
-        if isinstance(ele, lxml.html.HtmlComment) or \
-                isinstance(ele, lxml.etree._Comment):
-            self.text = ele.text
+        self._tree = tree
+        if xpath is None and tree is not None:
+            self._xpath = _UNSET
+        else:
+            self._xpath = xpath
+        if isinstance(ele, lxml.etree._Comment):
+            self._text = ele.text
         elif text:
-            self.text = text
+            self._text = text
         elif ele is not None:
-            self.text = Parser.getText(ele)
+            self._text = _UNSET
         else:
-            self.text = ''
+            self._text = ''
+
+    @property
+    def xpath(self):
+        if self._xpath is _UNSET:
+            self._xpath = self._tree.getpath(self.ele)
+            self._tree = None
+        return self._xpath
+
+    @xpath.setter
+    def xpath(self, value):
+        self._xpath = value
+        self._tree = None
+
+    @property
+    def text(self):
+        if self._text is _UNSET:
+            self._text = Parser.getText(self.ele)
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
 
     def clear(self):
         self.ele.clear()
@@ -43,6 +144,74 @@ class ObjectParser(object):
         self.ele.insert(idx, element)
 
 
+class ElementIndex(object):
+    """Tag and attribute index of a read-only document.
+
+    The index is built in a single walk over the tree and answers the
+    `descendant-or-self::tag[re:test(@attr, value, "i")]` lookups made by
+    `Parser.getElementsByTag` without evaluating XPath over the whole
+    document. Elements are kept in document order so results match the
+    XPath ones. The document must not be mutated while indexed.
+
+    The root itself is not kept, only its tag and attributes, as the index
+    is the value of the weak `_INDEXES` entry keyed by that root: the root
+    is given back to `find` by the caller instead.
+    """
+
+    def __init__(self, root):
+        self.root_tag = root.tag
+        self.root_attrs = dict(root.attrib)
+        self.elements = []
+        self.tags = defaultdict(list)
+        self.attrs = defaultdict(list)
+        self._matches = {}
+        for elem in root.iterdescendants(lxml.etree.Element):
+            self.elements.append(elem)
+            self.tags[elem.tag].append(elem)
+            for attr, value in elem.attrib.items():
+                self.attrs[attr].append((elem, value.lower()))
+
+    def __len__(self):
+        return len(self.elements) + 1
+
+    def match(self, attr, value):
+        """Return descendants whose `attr` matches the `value` regex,
+        ignoring case, memoized by (attribute, value).
+        """
+        key = (attr, value)
+        if key not in self._matches:
+            regex = re.compile(value, re.I)
+            self._matches[key] = [elem for elem, val in
+                                  self.attrs.get(attr, [])
+                                  if regex.search(val)]
+        return self._matches[key]
+
+    def _root_matches(self, tag, attr, value):
+        if tag and tag != self.root_tag:
+            return False
+        if attr and value:
+            val = self.root_attrs.get(attr)
+            return (val is not None and
+                    re.search(value, val.lower(), re.I) is not None)
+        return True
+
+    def find(self, root, tag=None, attr=None, value=None):
+        """Return the elements of `root`, the indexed document, matching
+        `tag` and the `attr` regex `value`, in document order.
+        """
+        if attr and value:
+            elems = self.match(attr, value)
+            if tag:
+                elems = [elem for elem in elems if elem.tag == tag]
+        elif tag:
+            elems = self.tags.get(tag, [])
+        else:
+            elems = self.elements
+        if self._root_matches(tag, attr, value):
+            return [root] + elems
+        return list(elems)
+
+
 # Decorator for convert ObjectParser to LXML object
 def check(idx=[], *types):
     def check_type(f):
@@ -62,8 +231,7 @@ class Parser(parsers.Parser):
     @classmethod
     def xpath_re(cls, node, expression):
         result = []
-        regexp_namespace = "http://exslt.org/regular-expressions"
-        items = node.xpath(expression, namespaces={'re': regexp_namespace})
+        items = compile_xpath(expression)(node)
         for item in items:
             if isinstance(item, str):
                 result.append(ObjectParser(None, expression, item))
@@ -71,6 +239,68 @@ class Parser(parsers.Parser):
                 result.append(ObjectParser(item, expression))
         return result
 
+    @classmethod
+    def decode(cls, html, encoding=None):
+        """Return the text of `html` bytes and the encoding it was decoded
+        with: `encoding` when Python knows it, else the one detected from
+        the markup as newspaper does.
+        """
+        if encoding:
+            try:
+                return html.decode(encoding, 'replace'), encoding
+            except LookupError:
+                pass
+        if not html:
+            return '', None
+        converted = UnicodeDammit(html, is_html=True)
+        if not converted.unicode_markup:
+            LOG.debug('Cannot detect the encoding of html, tried: %s',
+                      ', '.join(converted.tried_encodings))
+            return '', None
+        return converted.unicode_markup, converted.original_encoding
+
+    @classmethod
+    def fromstring(cls, html, encoding=None):
+        """Return the document root of `html`, None if it can not be
+        parsed. Bytes are fed as they are, in their `encoding` or the one
+        declared by the markup, to the parser of the calling thread, so
+        they are never decoded into a str first.
+        """
+        if not isinstance(html, bytes):
+            return super(Parser, cls).fromstring(html)
+        parser = html_parser(encoding)
+        if parser is None:
+            return super(Parser, cls).fromstring(
+                cls.decode(html, encoding)[0])
+        try:
+            return lxml.html.fromstring(html, parser=parser)
+        except Exception:
+            LOG.debug('fromstring() failed on: %r...', html[:20])
+            return None
+
+    @classmethod
+    def head_fromchunks(cls, chunks, encoding=None):
+        """Parse html `chunks`, str or bytes, only until the end of the
+        <head>: the remaining chunks are not consumed. `encoding` is the
+        charset of bytes chunks, sniffed from the html when not given.
+        Return the document root, None if nothing could be parsed.
+        """
+        encoding = encoding and _lxml_encoding(encoding)
+        try:
+            parser = lxml.etree.HTMLPullParser(events=('end',), tag='head',
+                                               encoding=encoding)
+        except LookupError:
+            parser = lxml.etree.HTMLPullParser(events=('end',), tag='head')
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        for chunk in chunks:
+            parser.feed(chunk)
+            if any(True for _ in parser.read_events()):
+                break
+        try:
+            return parser.close()
+        except lxml.etree.XMLSyntaxError:
+            return None
+
     @classmethod
     def drop_tag(cls, nodes):
         if isinstance(nodes, list):
@@ -92,7 +322,7 @@ class Parser(parsers.Parser):
         tree = lxml.etree.ElementTree(node)
         items = node.cssselect(selector)
         for item in items:
-            result.append(ObjectParser(item, tree.getpath(item)))
+            result.append(ObjectParser(item, tree=tree))
         return result
 
     @classmethod
@@ -103,24 +333,49 @@ class Parser(parsers.Parser):
         """
         return lxml.etree.tostring(node, method='html').decode()
 
+    @classmethod
+    def index(cls, doc):
+        """Build the element index of `doc` and use it for the next
+        `getElementsByTag` lookups on that document.
+        """
+        index = ElementIndex(doc)
+        _INDEXES[doc] = index
+        return index
+
+    @classmethod
+    def drop_index(cls, doc):
+        try:
+            _INDEXES.pop(doc, None)
+        except TypeError:
+            pass
+
+    @classmethod
+    def get_index(cls, doc):
+        if not _INDEXES:
+            return None
+        try:
+            return _INDEXES.get(doc)
+        except TypeError:
+            # plain lxml.etree elements can not be weakly referenced
+            return None
+
     @classmethod
     @check([1], ObjectParser)
     def getElementsByTag(
             cls, node, tag=None, attr=None, value=None, childs=False):
         result = []
-        NS = "http://exslt.org/regular-expressions"
-        # selector = tag or '*'
-        selector = 'descendant-or-self::%s' % (tag or '*')
-        if attr and value:
-            selector = '%s[re:test(@%s, "%s", "i")]' % (selector, attr, value)
-        elems = node.xpath(selector, namespaces={"re": NS})
+        index = cls.get_index(node)
+        if index is not None:
+            elems = index.find(node, tag, attr, value)
+        else:
+            elems = tag_xpath(tag, attr, value)(node)
+        tree = lxml.etree.ElementTree(node)
         # remove the root node
         # if we have a selection tag
         if node in elems and (tag or childs):
             elems.remove(node)
-        tree = lxml.etree.ElementTree(node)
         for elem in elems:
-            result.append(ObjectParser(elem, tree.getpath(elem)))
+            result.append(ObjectParser(elem, tree=tree))
         return result
 
     @classmethod
@@ -158,7 +413,7 @@ class Parser(parsers.Parser):
         tree = lxml.etree.ElementTree(node)
         items = node.xpath('//comment()')
         for item in items:
-            result.append(ObjectParser(item, tree.getpath(item)))
+            result.append(ObjectParser(item, tree=tree))
         return result
 
     @classmethod
@@ -210,6 +465,12 @@ class Parser(parsers.Parser):
                 break
         return nodes[0] if nodes else None
 
+    @classmethod
+    @check([1], ObjectParser)
+    def previousSiblings(cls, node):
+        """Iterate lazily over the preceding siblings, nearest first."""
+        return node.itersiblings(preceding=True)
+
     # NOTE(hieulq): get attr of iframe data-src is not implemented in video
     # extractor
     @classmethod
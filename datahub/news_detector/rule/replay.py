@@ -0,0 +1,339 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""
+Offline replay of a crawled corpus.
+
+A ReplayFetcher stands in for the Fetcher of a SourceConfig and serves the
+pages of a local corpus instead of downloading them, so the detector runs
+without any network access and always sees the same pages. The corpus is
+either a WARC file, plain or with one gzip member per record as written
+by most crawlers, or a directory of html files listed by an index.
+"""
+
+import mmap
+import os
+from urllib import parse
+import zlib
+
+from oslo_log import log as logging
+
+from datahub.news_detector.rule.fetcher import content_charset
+from datahub.news_detector.rule.fetcher import HEAD_CHUNK_SIZE
+from datahub.news_detector.rule.parser import Parser
+from datahub.news_detector.rule.seen import canonicalize
+
+LOG = logging.getLogger(__name__)
+
+# Index of a corpus directory: one "url<TAB>file[<TAB>charset]" line per
+# page, files being relative to the directory and gzip'd when ending in .gz
+DIRECTORY_INDEX = 'index.tsv'
+# Redirects followed inside a corpus, as requests does on the web
+MAX_REDIRECTS = 5
+# Bytes decompressed at once while indexing a gzip'd WARC
+_GZIP_CHUNK_SIZE = 65536
+
+
+class Page(object):
+    """Response replayed for one URL."""
+
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def header(self, name):
+        return self.headers.get(name.lower())
+
+    @property
+    def charset(self):
+        return content_charset(self.header('Content-Type'))
+
+
+def _parse_headers(lines):
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(b':')
+        if sep:
+            headers[name.strip().decode('latin-1').lower()] = \
+                value.strip().decode('latin-1')
+    return headers
+
+
+def _dechunk(body):
+    chunks = []
+    pos = 0
+    while True:
+        end = body.find(b'\r\n', pos)
+        if end < 0:
+            break
+        size = int(body[pos:end].split(b';')[0].strip() or b'0', 16)
+        if not size:
+            break
+        chunks.append(body[end + 2:end + 2 + size])
+        pos = end + 2 + size + 2
+    return b''.join(chunks)
+
+
+def _decode_content(body, encoding):
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+def parse_http_response(block):
+    """Return the Page of a raw HTTP response, as stored in the block of a
+    WARC response record, None if it is not one.
+    """
+    head, sep, body = block.partition(b'\r\n\r\n')
+    lines = head.split(b'\r\n')
+    status_line = lines[0].split(None, 2)
+    if not sep or len(status_line) < 2 or \
+            not status_line[0].startswith(b'HTTP/'):
+        return None
+    try:
+        status = int(status_line[1])
+    except ValueError:
+        return None
+    headers = _parse_headers(lines[1:])
+    try:
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            body = _dechunk(body)
+        body = _decode_content(
+            body, headers.get('content-encoding', '').strip().lower())
+    except (ValueError, zlib.error):
+        return None
+    return Page(status, headers, body)
+
+
+class WarcCorpus(object):
+    """Response records of a WARC file, memory mapped.
+
+    The file is scanned once to index the offset of the response record of
+    each URL, the last one of a URL wins. Records are only read, and
+    decompressed, when their page is asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._index = {}
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file can not be mapped
+            self._map = b''
+        self.gzipped = self._map[:2] == b'\x1f\x8b'
+        if self.gzipped:
+            self._index_members()
+        else:
+            self._index_records()
+
+    def _add(self, headers, location):
+        if headers.get('warc-type') != 'response':
+            return
+        url = headers.get('warc-target-uri', '').strip('<>')
+        if url:
+            self._index[canonicalize(url)] = location
+
+    def _read_record(self, data, pos):
+        """Return the headers of the record at `pos` of `data`, the offset
+        of its block and the offset following it. None at the end.
+        """
+        while data[pos:pos + 2] == b'\r\n':
+            pos += 2
+        end = data.find(b'\r\n\r\n', pos)
+        if end < 0 or not data[pos:pos + 5] == b'WARC/':
+            return None
+        headers = _parse_headers(data[pos:end].split(b'\r\n')[1:])
+        start = end + 4
+        return headers, start, start + int(headers.get('content-length', 0))
+
+    def _index_records(self):
+        pos = 0
+        while True:
+            record = self._read_record(self._map, pos)
+            if record is None:
+                break
+            headers, start, pos = record
+            self._add(headers, (start, pos - start))
+
+    def _index_members(self):
+        view = memoryview(self._map)
+        pos = 0
+        try:
+            while pos < len(view):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                head = b''
+                offset = pos
+                while not decompressor.eof and offset < len(view):
+                    chunk = view[offset:offset + _GZIP_CHUNK_SIZE]
+                    offset += len(chunk)
+                    data = decompressor.decompress(chunk)
+                    # the record headers lie at the beginning of the member
+                    if b'\r\n\r\n' not in head:
+                        head += data
+                length = offset - pos - len(decompressor.unused_data)
+                record = self._read_record(head, 0)
+                if record is not None:
+                    self._add(record[0], (pos, length))
+                pos += length
+        except zlib.error as e:
+            LOG.warning("Stop reading %s at offset %d: %s" %
+                        (self.path, pos, e))
+        finally:
+            view.release()
+
+    def __contains__(self, url):
+        return canonicalize(url) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        """Iterate over the canonical URLs of the pages."""
+        return iter(self._index)
+
+    def get(self, url):
+        """Return the Page of `url`, None if the WARC does not have it."""
+        location = self._index.get(canonicalize(url))
+        if location is None:
+            return None
+        offset, length = location
+        block = self._map[offset:offset + length]
+        if self.gzipped:
+            record = zlib.decompress(block, 16 + zlib.MAX_WBITS)
+            _headers, start, end = self._read_record(record, 0)
+            block = record[start:end]
+        return parse_http_response(block)
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+
+class DirectoryCorpus(object):
+    """Html files of a directory, listed by its DIRECTORY_INDEX."""
+
+    def __init__(self, path):
+        self.path = path
+        self._index = {}
+        with open(os.path.join(path, DIRECTORY_INDEX)) as f:
+            for line in f:
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) < 2 or not fields[0]:
+                    continue
+                charset = fields[2] if len(fields) > 2 else None
+                self._index[canonicalize(fields[0])] = (fields[1],
+                                                        charset or None)
+
+    def __contains__(self, url):
+        return canonicalize(url) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def get(self, url):
+        entry = self._index.get(canonicalize(url))
+        if entry is None:
+            return None
+        name, charset = entry
+        try:
+            with open(os.path.join(self.path, name), 'rb') as f:
+                body = f.read()
+        except IOError as e:
+            LOG.debug("%s on %s" % (e, url))
+            return None
+        if name.endswith('.gz'):
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        content_type = 'text/html'
+        if charset:
+            content_type += '; charset=%s' % charset
+        return Page(200, {'content-type': content_type}, body)
+
+    def close(self):
+        pass
+
+
+def open_corpus(path):
+    """Return the corpus stored at `path`, a directory or a WARC file."""
+    if os.path.isdir(path):
+        return DirectoryCorpus(path)
+    return WarcCorpus(path)
+
+
+class ReplayFetcher(object):
+    """Fetcher serving the pages of a corpus, a URL missing from it is a
+    failed download. No request is ever sent.
+    """
+
+    def __init__(self, config, corpus):
+        self.config = config
+        self.corpus = corpus
+
+    def _page(self, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            page = self.corpus.get(url)
+            if page is None:
+                LOG.debug("%s is not in the replayed corpus" % url)
+                return None
+            location = page.header('Location')
+            if not (300 <= page.status < 400 and location):
+                break
+            url = parse.urljoin(url, location)
+        if self.config.http_success_only and page.status >= 400:
+            return None
+        return page
+
+    def fetch_raw(self, url, cached=False):
+        """Return the body of `url` as bytes with its charset, like
+        `Fetcher.fetch_raw`. The corpus is the cache, `cached` is ignored.
+        """
+        page = self._page(url)
+        if page is None:
+            return b'', None
+        return page.body, page.charset
+
+    def fetch(self, url, cached=False):
+        return Parser.decode(*self.fetch_raw(url))[0]
+
+    def fetch_head(self, url):
+        page = self._page(url)
+        if page is None:
+            return None
+        body = page.body
+        return Parser.head_fromchunks(
+            (body[i:i + HEAD_CHUNK_SIZE]
+             for i in range(0, len(body), HEAD_CHUNK_SIZE)),
+            encoding=page.charset)
+
+    def imap(self, func, iterable):
+        # pages are read from disk, there is nothing to wait for
+        return map(func, iterable)
+
+    def fetch_many(self, urls, cached=False):
+        return list(self.imap(self.fetch, urls))
+
+    def close(self):
+        self.corpus.close()
@@ -0,0 +1,189 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import datahub.conf
+
+CONF = datahub.conf.CONF
+
+# Below this number of nodes, array setup costs more than the Python loop
+NUMPY_MIN_NODES = 200
+
+
+class Scorer(object):
+    """Content scores of the top node detection, computed in Python.
+
+    Nodes are described by their stopword count and boostability, in
+    document order. Parents are given as indexes, -1 for none.
+    """
+
+    def upscores(self, stopword_counts, boostable):
+        """Return the score each node gives to its parent: its stopword
+        count, boosted for leading paragraphs and lowered for the tail.
+        """
+        starting_boost = float(1.0)
+        nodes_number = len(stopword_counts)
+        negative_scoring = 0
+        bottom_negativescore_nodes = float(nodes_number) * 0.25
+        upscores = []
+
+        for i, stopword_count in enumerate(stopword_counts):
+            boost_score = float(0)
+            # boost
+            if boostable[i]:
+                boost_score = float((1.0 / starting_boost) * 50)
+                starting_boost += 1
+            # nodes_number
+            if nodes_number > 15:
+                if (nodes_number - i) <= bottom_negativescore_nodes:
+                    booster = float(
+                        bottom_negativescore_nodes - (nodes_number - i))
+                    boost_score = float(-pow(booster, float(2)))
+                    negscore = abs(boost_score) + negative_scoring
+                    if negscore > 40:
+                        boost_score = float(5)
+
+            upscores.append(int(stopword_count + boost_score))
+        return upscores
+
+    def accumulate(self, parents, grandparents, upscores, size):
+        """Return the scores and node counts of `size` parents, a node
+        gives its upscore to its parent and half of it to its grandparent.
+        """
+        scores = [0] * size
+        counts = [0] * size
+        for parent, grandparent, upscore in zip(parents, grandparents,
+                                                upscores):
+            if parent >= 0:
+                scores[parent] += upscore
+                counts[parent] += 1
+            if grandparent >= 0:
+                scores[grandparent] += upscore / 2
+                counts[grandparent] += 1
+        return scores, counts
+
+
+class NumpyScorer(Scorer):
+    """Scorer computing with NumPy arrays, same results as `Scorer`."""
+
+    def upscores(self, stopword_counts, boostable):
+        nodes_number = len(stopword_counts)
+        boostable = numpy.asarray(boostable, dtype=bool)
+        boost = numpy.zeros(nodes_number)
+        # the k-th boostable node gets 50 / k
+        rank = numpy.cumsum(boostable)[boostable]
+        boost[boostable] = (1.0 / rank) * 50
+
+        if nodes_number > 15:
+            bottom = float(nodes_number) * 0.25
+            remaining = nodes_number - numpy.arange(nodes_number)
+            tail = remaining <= bottom
+            booster = bottom - remaining[tail]
+            penalty = booster * booster
+            boost[tail] = numpy.where(penalty > 40, 5.0, -penalty)
+
+        upscores = numpy.asarray(stopword_counts, dtype=float) + boost
+        return upscores.astype(numpy.int64)
+
+    def accumulate(self, parents, grandparents, upscores, size):
+        parents = numpy.asarray(parents, dtype=numpy.intp)
+        grandparents = numpy.asarray(grandparents, dtype=numpy.intp)
+        upscores = numpy.asarray(upscores, dtype=float)
+        has_parent = parents >= 0
+        has_grandparent = grandparents >= 0
+
+        scores = numpy.bincount(parents[has_parent],
+                                weights=upscores[has_parent],
+                                minlength=size)
+        scores += numpy.bincount(grandparents[has_grandparent],
+                                 weights=upscores[has_grandparent] / 2,
+                                 minlength=size)
+        counts = numpy.bincount(parents[has_parent], minlength=size) + \
+            numpy.bincount(grandparents[has_grandparent], minlength=size)
+        return scores.tolist(), counts.tolist()
+
+
+def _count_words(text):
+    """Return the number of words and of alphanumeric words of `text`."""
+    if not text:
+        return 0, 0
+    words = text.split()
+    return len(words), sum(1 for word in words if word.isalnum())
+
+
+class LinkDensity(object):
+    """Link density of every element of a tree, from one bottom-up walk.
+
+    Each element records its words, alphanumeric words, `<a>` descendants,
+    words inside them and how many of them have text, so that the check of
+    `ContentExtractor.is_highlink_density` becomes a lookup.
+    """
+
+    def __init__(self, root):
+        self._stats = {}
+        # reversed document order visits children before their parent
+        for ele in reversed(list(root.iter())):
+            if not isinstance(ele.tag, str):
+                # comments and processing instructions hold no text
+                self._stats[ele] = (0, 0, 0, 0, 0)
+                continue
+            words, alnum = _count_words(ele.text)
+            links = link_words = text_links = 0
+            for child in ele:
+                c_words, c_alnum, c_links, c_link_words, c_text_links = \
+                    self._stats[child]
+                t_words, t_alnum = _count_words(child.tail)
+                words += c_words + t_words
+                alnum += c_alnum + t_alnum
+                links += c_links
+                link_words += c_link_words
+                text_links += c_text_links
+                if child.tag == 'a':
+                    links += 1
+                    link_words += c_words
+                    text_links += 1 if c_words else 0
+            self._stats[ele] = (words, alnum, links, link_words, text_links)
+
+    def is_high(self, ele):
+        """Same result as `ContentExtractor.is_highlink_density`."""
+        _, alnum, links, link_words, text_links = self._stats[ele]
+        if not links:
+            return False
+        if not alnum:
+            return True
+        # link texts are joined without separator, so the last word of a
+        # link merges with the first word of the next one
+        if text_links:
+            link_words -= text_links - 1
+        link_divisor = float(float(link_words) / float(alnum))
+        score = float(link_divisor * float(links))
+        return score >= 1.0
+
+
+PYTHON = Scorer()
+NUMPY = NumpyScorer() if numpy is not None else None
+
+
+def get_scorer(nodes_number):
+    """Return the scorer to use for `nodes_number` nodes, according to the
+    `news_detector.scorer` option.
+    """
+    name = CONF.news_detector.scorer
+    if NUMPY is None or name == 'python':
+        return PYTHON
+    if name == 'numpy' or nodes_number >= NUMPY_MIN_NODES:
+        return NUMPY
+    return PYTHON
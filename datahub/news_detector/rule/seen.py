@@ -0,0 +1,157 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import functools
+import os
+import sqlite3
+import threading
+import time
+from urllib import parse
+
+# Query parameters added by trackers, they never change the page
+TRACKING_PARAMS = frozenset(['fbclid', 'gclid', 'dclid', 'msclkid', 'yclid',
+                             'igshid', 'mc_cid', 'mc_eid', '_ga', 'ref_src'])
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Number of recently seen URLs answered from memory
+CACHE_SIZE = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    url TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_at ON seen (seen_at);
+"""
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+@functools.lru_cache(maxsize=65536)
+def canonicalize(url):
+    """Return the canonical form of `url` identifying a page: https folded
+    into http, host lowercased without default port, no trailing slash,
+    tracking parameters and fragment removed. It is meant for comparing
+    URLs, pages are still downloaded from their original URL.
+    """
+    url = parse.urlsplit(url.strip())
+    scheme = url.scheme.lower()
+    if scheme == 'https':
+        scheme = 'http'
+
+    host = (url.hostname or '').rstrip('.')
+    try:
+        port = url.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(url.scheme.lower()):
+        host = '%s:%d' % (host, port)
+
+    path = url.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+
+    query = parse.urlencode(
+        [(name, value) for name, value in
+         parse.parse_qsl(url.query, keep_blank_values=True)
+         if not _is_tracking(name)])
+    return parse.urlunsplit((scheme, host, path, query, ''))
+
+
+class SeenIndex(object):
+    """Bounded SQLite index of the canonical URLs already downloaded and
+    parsed, shared by the sources of an engine and kept across runs.
+
+    Only the `size` most recently seen URLs are kept, the recent ones are
+    also answered from memory.
+    """
+
+    def __init__(self, path, size):
+        if path != ':memory:':
+            dirname = os.path.dirname(os.path.abspath(path))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        self.size = size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._count = self._conn.execute(
+            'SELECT COUNT(*) FROM seen').fetchone()[0]
+        self._recent = collections.OrderedDict()
+
+    def _remember(self, key):
+        self._recent[key] = True
+        self._recent.move_to_end(key)
+        if len(self._recent) > CACHE_SIZE:
+            self._recent.popitem(last=False)
+
+    def _has(self, key):
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            return True
+        row = self._conn.execute('SELECT 1 FROM seen WHERE url = ?',
+                                 (key,)).fetchone()
+        if row is not None:
+            self._remember(key)
+        return row is not None
+
+    def __contains__(self, url):
+        key = canonicalize(url)
+        with self._lock:
+            return self._has(key)
+
+    def __len__(self):
+        return self._count
+
+    def _trim(self):
+        # Trim by a tenth at once so that inserts rarely pay for it
+        excess = self._count - self.size + self.size // 10
+        self._conn.execute(
+            'DELETE FROM seen WHERE url IN (SELECT url FROM seen '
+            'ORDER BY seen_at LIMIT ?)', (excess,))
+        self._count = self._conn.execute(
+            'SELECT COUNT(*) FROM seen').fetchone()[0]
+        self._recent.clear()
+
+    def add(self, url):
+        """Mark `url` as seen. Return False if it already was."""
+        key = canonicalize(url)
+        with self._lock, self._conn:
+            seen = self._has(key)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO seen (url, seen_at) VALUES (?, ?)',
+                (key, time.time()))
+            if not seen:
+                self._remember(key)
+                self._count += 1
+                if self._count > self.size:
+                    self._trim()
+        return not seen
+
+    def discard(self, url):
+        """Forget `url`, so that it is downloaded again."""
+        key = canonicalize(url)
+        with self._lock, self._conn:
+            self._recent.pop(key, None)
+            deleted = self._conn.execute('DELETE FROM seen WHERE url = ?',
+                                         (key,)).rowcount
+            self._count -= deleted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._recent.clear()
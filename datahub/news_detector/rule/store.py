@@ -0,0 +1,206 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import sqlite3
+import threading
+import time
+from urllib import parse
+
+from datahub.news_detector.rule.template import CompiledTemplate
+
+# Number of template uses before its success rate is trusted
+MIN_ATTEMPTS = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    key TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    title TEXT NOT NULL,
+    text TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    publish_date TEXT NOT NULL,
+    canonical_link TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    detected_at REAL NOT NULL,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS templates_site ON templates (site);
+"""
+_COLUMNS = ('key', 'site', 'title', 'text', 'authors', 'publish_date',
+            'canonical_link', 'version', 'detected_at', 'successes',
+            'failures')
+
+
+def template_keys(url):
+    """Return the store keys an article URL may be filed under, the most
+    specific first. Keys are built like the candidate domains of
+    `Source._generate_format_for_categories`: netloc plus the category
+    path.
+    """
+    url = parse.urlparse(url)
+    keys = []
+    segment = url.path.split('/', 2)[1] if url.path.count('/') else ''
+    if segment:
+        keys.append(url.netloc + '/' + segment)
+        keys.append(url.netloc + '/' + segment + '/')
+    keys.append(url.netloc)
+    return keys
+
+
+def template_key(url):
+    """Return the key the format of an article URL is saved under: netloc
+    plus the first path segment when the article lies below it, the netloc
+    alone otherwise.
+    """
+    url = parse.urlparse(url)
+    parts = url.path.split('/', 2)
+    if len(parts) > 2 and parts[1]:
+        return url.netloc + '/' + parts[1]
+    return url.netloc
+
+
+class TemplateRecord(object):
+    """Article format stored for one domain/category key."""
+
+    def __init__(self, key, site, title, text, authors, publish_date,
+                 canonical_link, version, detected_at, successes, failures):
+        self.key = key
+        self.site = site
+        self.title = title
+        self.text = text
+        self.authors = authors
+        self.publish_date = publish_date
+        self.canonical_link = canonical_link
+        self.version = version
+        self.detected_at = detected_at
+        self.successes = successes
+        self.failures = failures
+        self._template = None
+
+    @property
+    def success_rate(self):
+        attempts = self.successes + self.failures
+        if not attempts:
+            return None
+        return float(self.successes) / attempts
+
+    def is_trusted(self, min_success_rate):
+        if self.successes + self.failures < MIN_ATTEMPTS:
+            return True
+        return self.success_rate >= min_success_rate
+
+    @property
+    def template(self):
+        if self._template is None:
+            self._template = CompiledTemplate(
+                title=self.title, text=self.text, authors=self.authors,
+                publish_date=self.publish_date)
+        return self._template
+
+
+class TemplateStore(object):
+    """SQLite store of the article formats detected per domain/category.
+
+    Records are cached in memory, so a known key costs no query and its
+    XPaths are only compiled once per process. Missing keys are not, the
+    formats saved meanwhile by other processes are found on next lookup.
+    """
+
+    def __init__(self, path):
+        if path != ':memory:':
+            dirname = os.path.dirname(os.path.abspath(path))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._cache = {}
+
+    def _fetch(self, where, args):
+        cursor = self._conn.execute(
+            'SELECT %s FROM templates WHERE %s' % (', '.join(_COLUMNS),
+                                                   where), args)
+        return [TemplateRecord(*row) for row in cursor.fetchall()]
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._cache:
+                records = self._fetch('key = ?', (key,))
+                if not records:
+                    return None
+                self._cache[key] = records[0]
+            return self._cache[key]
+
+    def get_site(self, site):
+        """Return all the records of a site (netloc)."""
+        with self._lock:
+            records = self._fetch('site = ? ORDER BY key', (site,))
+            for record in records:
+                cached = self._cache.get(record.key)
+                if cached is None or cached.version != record.version:
+                    self._cache[record.key] = record
+            return [self._cache[record.key] for record in records]
+
+    def lookup(self, url):
+        """Return the most specific record matching an article URL."""
+        for key in template_keys(url):
+            record = self.get(key)
+            if record is not None:
+                return record
+        return None
+
+    def save(self, key, article):
+        """Store the format of a parsed article under `key`. Saving a known
+        key bumps its version and resets its counters.
+        """
+        site = key.split('/', 1)[0]
+        authors = article.authors[0] if article.authors else ''
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT version FROM templates WHERE key = ?',
+                (key,)).fetchone()
+            version = row[0] + 1 if row else 1
+            self._conn.execute(
+                'INSERT OR REPLACE INTO templates (%s) VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0)' % ', '.join(_COLUMNS),
+                (key, site, article.title or '', article.text or '', authors,
+                 article.publish_date or '', article.canonical_link or '',
+                 version, time.time()))
+            self._cache.pop(key, None)
+        return self.get(key)
+
+    def _count(self, key, column):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE templates SET %s = %s + 1 WHERE key = ?' %
+                (column, column), (key,))
+            record = self._cache.get(key)
+            if record is not None:
+                setattr(record, column, getattr(record, column) + 1)
+
+    def record_success(self, key):
+        self._count(key, 'successes')
+
+    def record_failure(self, key):
+        self._count(key, 'failures')
+
+    def delete(self, key):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM templates WHERE key = ?', (key,))
+            self._cache.pop(key, None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._cache.clear()
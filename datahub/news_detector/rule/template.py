@@ -0,0 +1,75 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import lxml.etree
+
+from datahub.news_detector.rule.parser import Parser
+from datahub.news_detector.rule.parser import REGEXP_NAMESPACES
+
+
+class CompiledTemplate(object):
+    """Article format with its XPath expressions compiled once.
+
+    A template is built from the title, text, authors and publish_date
+    XPaths of a parsed article and then applied to any number of documents
+    of the same site.
+    """
+
+    FIELDS = ('title', 'text', 'authors', 'publish_date')
+
+    def __init__(self, title='', text='', authors='', publish_date=''):
+        self.title = title
+        self.text = text
+        self.authors = authors
+        self.publish_date = publish_date
+        self._xpaths = {}
+        for field in self.FIELDS:
+            expression = getattr(self, field)
+            if expression:
+                self._xpaths[field] = lxml.etree.XPath(
+                    expression, namespaces=REGEXP_NAMESPACES,
+                    smart_strings=False)
+
+    @classmethod
+    def from_article(cls, article):
+        authors = article.authors[0] if article.authors else ''
+        return cls(title=article.title, text=article.text, authors=authors,
+                   publish_date=article.publish_date)
+
+    @staticmethod
+    def _to_text(item):
+        if isinstance(item, str):
+            return item
+        return Parser.getText(item)
+
+    def _first(self, field, doc):
+        xpath = self._xpaths.get(field)
+        if xpath is None:
+            return None
+        items = xpath(doc)
+        if not items:
+            return None
+        return self._to_text(items[0])
+
+    def apply(self, doc):
+        """Return a dict of the fields found in `doc`."""
+        result = {}
+        for field in ('title', 'authors', 'publish_date'):
+            value = self._first(field, doc)
+            if value is not None:
+                result[field] = value
+
+        xpath = self._xpaths.get('text')
+        if xpath is not None:
+            result['text'] = ''.join([self._to_text(item) + '\n'
+                                      for item in xpath(doc)])
+        return result
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# HTTP cache storage backed by the cache of the news detector
+#
+# See documentation in:
+# http://doc.scrapy.org/en/latest/topics/downloader-middleware.html
+
+import os
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+from datahub.common import httpcache
+
+
+class SqliteCacheStorage(object):
+    """Store the GET responses in a `datahub.common.httpcache.HttpCache`.
+
+    Used with `RFC2616Policy`, cached pages are downloaded again with
+    If-None-Match/If-Modified-Since and a 304 answer reuses the stored
+    body. HTTPCACHE_EXPIRATION_SECS drops old pages and HTTPCACHE_MAX_SIZE
+    bounds the size in bytes of the stored bodies.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_size = settings.getint('HTTPCACHE_MAX_SIZE')
+        self.cache = None
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, '%s.sqlite' % spider.name)
+        self.cache = httpcache.HttpCache(path, ttl=self.expiration_secs,
+                                         max_size=self.max_size)
+
+    def close_spider(self, spider):
+        self.cache.close()
+
+    def retrieve_response(self, spider, request):
+        if request.method != 'GET':
+            return None
+        entry = self.cache.get(request.url)
+        if entry is None:
+            return None
+        headers = Headers(entry.headers)
+        respcls = responsetypes.from_args(headers=headers, url=request.url,
+                                          body=entry.body)
+        return respcls(url=request.url, headers=headers, status=entry.status,
+                       body=entry.body)
+
+    def store_response(self, spider, request, response):
+        if request.method != 'GET':
+            return
+        headers = dict((name.decode('latin-1'),
+                        [value.decode('latin-1') for value in values])
+                       for name, values in response.headers.items())
+        self.cache.put(request.url, response.status, headers, response.body)
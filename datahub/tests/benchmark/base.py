@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import os
+import time
+
+from datahub.news_detector.rule import article
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'unit',
+                        'news_detector', 'rule', 'fixtures')
+ARTICLE_URL = 'http://baotainguyenmoitruong.vn/kinh-te/201703/bai-viet.html'
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+def parse_article(html, conf=None, url=ARTICLE_URL):
+    conf = conf or config.SourceConfig()
+    art = article.Article(url, config=conf, extractor=Extractor(conf))
+    art.download(html=html)
+    art.parse()
+    return art
+
+
+def timeit(func, rounds):
+    """Mean wall time in milliseconds of `rounds` calls of `func`."""
+    func()
+    start = time.time()
+    for _ in range(rounds):
+        func()
+    return (time.time() - start) * 1000 / rounds
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import copy
+import gc
+import os
+import resource
+
+from oslo_log import log as logging
+
+from datahub.news_detector.rule import article
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule import fingerprint
+from datahub.news_detector.rule.language import sniff_language
+from datahub.news_detector.rule.parser import Parser
+from datahub.tests import base
+from datahub.tests.benchmark import base as benchmark
+
+LOG = logging.getLogger(__name__)
+
+
+def parse_article(html, keep_clean_doc):
+    conf = config.SourceConfig()
+    conf.keep_clean_doc = keep_clean_doc
+    return benchmark.parse_article(html, conf)
+
+
+def resident_memory():
+    """Current resident set size of this process in KiB."""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() // 1024
+
+
+def retained_memory(name, keep_clean_doc, count=10):
+    """Resident memory in KiB held by one parsed fixture article."""
+    html = benchmark.load_fixture(name)
+    parse_article(html, keep_clean_doc)
+    gc.collect()
+    before = resident_memory()
+    articles = [parse_article(html, keep_clean_doc) for _ in range(count)]
+    after = resident_memory()
+    del articles
+    gc.collect()
+    return (after - before) // count
+
+
+def latency(name, keep_clean_doc, rounds=5):
+    """Mean wall time in milliseconds of parsing one fixture."""
+    html = benchmark.load_fixture(name)
+    return benchmark.timeit(lambda: parse_article(html, keep_clean_doc),
+                            rounds)
+
+
+class ArticleParseBenchmark(base.BaseTestCase):
+    """Compare `Article.parse` with a deep copied tree (`keep_clean_doc`)
+    and with the copy-on-write tree cleaned in place.
+    """
+
+    def test_parse_latency(self):
+        for name in ('article_1.html', 'article_large.html'):
+            copied = latency(name, keep_clean_doc=True)
+            in_place = latency(name, keep_clean_doc=False)
+            LOG.info('%s latency: deepcopy %.2f ms, copy-on-write %.2f ms',
+                     name, copied, in_place)
+
+    def test_deepcopy_cost(self):
+        doc = Parser.fromstring(benchmark.load_fixture('article_large.html'))
+        LOG.info('article_large.html deepcopy saved: %.2f ms per article',
+                 benchmark.timeit(lambda: copy.deepcopy(doc), 20))
+
+    def test_parse_retained_memory(self):
+        if not os.path.exists('/proc/self/statm'):
+            self.skipTest('resident memory is only read from procfs')
+        copied = retained_memory('article_large.html', keep_clean_doc=True)
+        in_place = retained_memory('article_large.html',
+                                   keep_clean_doc=False)
+        LOG.info('article_large.html memory per article: deepcopy %d KiB, '
+                 'copy-on-write %d KiB', copied, in_place)
+        self.assertLess(in_place, copied)
+
+
+class FingerprintBenchmark(base.BaseTestCase):
+    """Compare parsing a page downloaded again with reusing the result
+    kept by the fingerprint cache.
+    """
+
+    def test_unchanged_page(self):
+        conf = config.SourceConfig()
+        extractor = Extractor(conf)
+        for name in ('article_1.html', 'article_large.html'):
+            html = benchmark.load_fixture(name)
+
+            def parse():
+                art = article.Article(benchmark.ARTICLE_URL, config=conf,
+                                      extractor=extractor)
+                art.download(html=html)
+                art.parse_downloaded()
+                return art
+
+            conf.fingerprints = None
+            parsed = benchmark.timeit(parse, 5)
+            conf.fingerprints = fingerprint.FingerprintCache(10)
+            cached = benchmark.timeit(parse, 5)
+            conf.fingerprints = fingerprint.FingerprintCache(10, 3)
+            simhashed = benchmark.timeit(parse, 5)
+            LOG.info('%s: parse %.2f ms, unchanged %.2f ms, unchanged with '
+                     'simhash %.2f ms', name, parsed, cached, simhashed)
+            self.assertLess(cached, parsed)
+
+
+class LanguageGateBenchmark(base.BaseTestCase):
+    """Cost of rejecting a page in another language."""
+
+    def test_reject(self):
+        extractor = Extractor(config.SourceConfig())
+        html = benchmark.load_fixture('article_en.html')
+
+        def parsed():
+            return extractor.get_meta_lang(Parser.fromstring(html))[0]
+
+        def sniffed():
+            return sniff_language(html, 8192)
+
+        self.assertEqual(parsed(), sniffed())
+        parse_ms = benchmark.timeit(parsed, 50)
+        sniff_ms = benchmark.timeit(sniffed, 50)
+        LOG.info('article_en.html rejection: parse %.3f ms, sniff %.3f ms',
+                 parse_ms, sniff_ms)
+        self.assertLess(sniff_ms, parse_ms)
+
+
+class MetadataBenchmark(base.BaseTestCase):
+    """Compare the full parse of an article with the metadata-only mode,
+    which reads the page only up to its </head>.
+    """
+
+    def test_metadata_only(self):
+        conf = config.SourceConfig()
+        extractor = Extractor(conf)
+        for name in ('article_1.html', 'article_large.html'):
+            html = benchmark.load_fixture(name)
+            data = html.encode('utf-8')
+            chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+            read = []
+
+            def parse():
+                art = article.Article(benchmark.ARTICLE_URL, config=conf,
+                                      extractor=extractor)
+                art.download(html=html)
+                art.parse_downloaded()
+                return art
+
+            def metadata():
+                def stream():
+                    for chunk in chunks:
+                        read.append(len(chunk))
+                        yield chunk
+                doc = Parser.head_fromchunks(stream(), encoding='utf-8')
+                return article.ArticleMetadata.from_doc(
+                    benchmark.ARTICLE_URL, doc, extractor)
+
+            parse_ms = benchmark.timeit(parse, 5)
+            del read[:]
+            metadata()
+            head_bytes = sum(read)
+            metadata_ms = benchmark.timeit(metadata, 5)
+            LOG.info('%s: parse %.2f ms, metadata only %.2f ms reading '
+                     '%d of %d bytes', name, parse_ms, metadata_ms,
+                     head_bytes, len(data))
+            self.assertLess(metadata_ms, parse_ms)
+            self.assertLess(head_bytes, len(data))
@@ -0,0 +1,211 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import time
+
+from newspaper.cleaners import DocumentCleaner
+from newspaper.extractors import ContentExtractor
+from oslo_log import log as logging
+import testtools
+
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule.parser import Parser
+from datahub.news_detector.rule import scoring
+from datahub.tests import base
+from datahub.tests.benchmark import base as benchmark
+from datahub.tests.unit.news_detector.rule.test_scoring import \
+    random_features
+
+LOG = logging.getLogger(__name__)
+
+
+def legacy_calculate_best_node(self, doc):
+    """`Extractor.calculate_best_node` as it was before stopword counts
+    were cached.
+    """
+    top_node = None
+    nodes_to_check = self.nodes_to_check(doc)
+    starting_boost = float(1.0)
+    cnt = 0
+    i = 0
+    parent_nodes = []
+    nodes_with_text = []
+
+    for node in nodes_to_check:
+        text_node = self.parser.getText(node.ele)
+        word_stats = self.stopwords_class(language=self.language).\
+            get_stopword_count(text_node)
+        high_link_density = self.is_highlink_density(node.ele)
+        if word_stats.get_stopword_count() > 2 and not high_link_density:
+            nodes_with_text.append(node)
+
+    nodes_number = len(nodes_with_text)
+    negative_scoring = 0
+    bottom_negativescore_nodes = float(nodes_number) * 0.25
+
+    for node in nodes_with_text:
+        boost_score = float(0)
+        if super(Extractor, self).is_boostable(node.ele):
+            if cnt >= 0:
+                boost_score = float((1.0 / starting_boost) * 50)
+                starting_boost += 1
+        if nodes_number > 15:
+            if (nodes_number - i) <= bottom_negativescore_nodes:
+                booster = float(
+                    bottom_negativescore_nodes - (nodes_number - i))
+                boost_score = float(-pow(booster, float(2)))
+                negscore = abs(boost_score) + negative_scoring
+                if negscore > 40:
+                    boost_score = float(5)
+
+        text_node = self.parser.getText(node.ele)
+        word_stats = self.stopwords_class(language=self.language).\
+            get_stopword_count(text_node)
+        upscore = int(word_stats.get_stopword_count() + boost_score)
+
+        parent_node = self.parser.getParent(node)
+        self.update_score(parent_node, upscore)
+        self.update_node_count(parent_node, 1)
+
+        if parent_node not in parent_nodes:
+            parent_nodes.append(parent_node)
+
+        parent_parent_node = self.parser.getParent(parent_node)
+        if parent_parent_node is not None:
+            self.update_node_count(parent_parent_node, 1)
+            self.update_score(parent_parent_node, upscore / 2)
+            if parent_parent_node not in parent_nodes:
+                parent_nodes.append(parent_parent_node)
+        cnt += 1
+        i += 1
+
+    top_node_score = 0
+    for e in parent_nodes:
+        score = self.get_score(e)
+
+        if score > top_node_score:
+            top_node = e
+            top_node_score = score
+
+        if top_node is None:
+            top_node = e
+
+    if top_node:
+        top_node.xpath += '//text()'
+    return top_node
+
+
+class CalculateBestNodeBenchmark(base.BaseTestCase):
+
+    def setUp(self):
+        super(CalculateBestNodeBenchmark, self).setUp()
+        self.config = config.SourceConfig()
+        self.extractor = Extractor(self.config)
+        self.html = benchmark.load_fixture('article_large.html')
+
+    def _cleaned_docs(self, rounds):
+        # scores are written on the tree, every call needs a fresh one
+        cleaner = DocumentCleaner(self.config)
+        return [cleaner.clean(Parser.fromstring(self.html))
+                for _ in range(rounds)]
+
+    def _time(self, func, rounds):
+        docs = self._cleaned_docs(rounds)
+        start = time.time()
+        results = [func(doc) for doc in docs]
+        return (time.time() - start) * 1000 / rounds, results[0]
+
+    def test_calculate_best_node(self):
+        rounds = 5
+        legacy, legacy_node = self._time(
+            lambda doc: legacy_calculate_best_node(self.extractor, doc),
+            rounds)
+        cached, node = self._time(self.extractor.calculate_best_node,
+                                  rounds)
+        self.assertEqual(legacy_node.xpath, node.xpath)
+        LOG.info('article_large.html best node: legacy %.1f ms, current '
+                 '%.1f ms', legacy, cached)
+        self.assertLess(cached, legacy)
+
+
+@testtools.skipIf(scoring.numpy is None, 'NumPy is not installed')
+class ScorerBenchmark(base.BaseTestCase):
+
+    def test_scorers(self):
+        for nodes_number in (100, 1000, 10000):
+            stopword_counts, boostable, parents, grandparents = \
+                random_features(nodes_number)
+            size = nodes_number // 4 + 1
+
+            def score(scorer):
+                upscores = scorer.upscores(stopword_counts, boostable)
+                return scorer.accumulate(parents, grandparents, upscores,
+                                         size)
+
+            self.assertEqual(score(scoring.PYTHON), score(scoring.NUMPY))
+            python = benchmark.timeit(lambda: score(scoring.PYTHON), 20)
+            numpy = benchmark.timeit(lambda: score(scoring.NUMPY), 20)
+            LOG.info('scoring %d nodes: python %.2f ms, numpy %.2f ms',
+                     nodes_number, python, numpy)
+            if nodes_number >= scoring.NUMPY_MIN_NODES:
+                self.assertLess(numpy, python)
+
+
+class LinkDensityBenchmark(base.BaseTestCase):
+
+    def test_link_density(self):
+        extractor = Extractor(config.SourceConfig())
+        doc = Parser.fromstring(benchmark.load_fixture('category.html'))
+        nodes = list(doc.iter('p', 'td', 'li', 'div'))
+
+        def legacy():
+            return [ContentExtractor.is_highlink_density(extractor, node)
+                    for node in nodes]
+
+        def single_pass():
+            density = scoring.LinkDensity(doc)
+            return [density.is_high(node) for node in nodes]
+
+        self.assertEqual(legacy(), single_pass())
+        legacy_ms = benchmark.timeit(legacy, 3)
+        single_ms = benchmark.timeit(single_pass, 3)
+        LOG.info('category.html link density of %d nodes: per node %.1f '
+                 'ms, single pass %.1f ms', len(nodes), legacy_ms, single_ms)
+        self.assertLess(single_ms, legacy_ms)
+
+
+class LinkExtractionBenchmark(base.BaseTestCase):
+
+    def test_get_urls(self):
+        extractor = Extractor(config.SourceConfig())
+        doc = Parser.fromstring(benchmark.load_fixture('category.html'))
+
+        def legacy():
+            # `Extractor._get_urls` before links were streamed
+            a_tags = extractor.parser.getElementsByTag(doc, tag='a')
+            return [(a.ele.get('href'), a.ele.text) for a in a_tags
+                    if a.ele.get('href') and '#' not in a.ele.get('href')]
+
+        def streaming():
+            return list(extractor.iter_urls(doc, titles=True))
+
+        seen = set()
+        expected = [(href, text) for href, text in legacy()
+                    if href not in seen and not seen.add(href)]
+        self.assertEqual(expected, streaming())
+        legacy_ms = benchmark.timeit(legacy, 20)
+        streaming_ms = benchmark.timeit(streaming, 20)
+        LOG.info('category.html links: getElementsByTag %.2f ms, iter '
+                 '%.2f ms', legacy_ms, streaming_ms)
+        self.assertLess(streaming_ms, legacy_ms)
@@ -0,0 +1,69 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import time
+
+import eventlet
+import mock
+from oslo_log import log as logging
+import requests
+
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.fetcher import Fetcher
+from datahub.news_detector.rule.health import HealthTracker
+from datahub.tests import base
+
+LOG = logging.getLogger(__name__)
+DOMAINS = 10
+DEAD = 2
+PAGES = 30
+LATENCY = 0.002
+TIMEOUT = 0.1
+
+
+def fake_get(url, timeout=None, **kwargs):
+    """Healthy domains answer in LATENCY, dead ones never answer."""
+    if '//dead' in url or timeout < LATENCY:
+        eventlet.sleep(timeout)
+        raise requests.exceptions.Timeout(url)
+    eventlet.sleep(LATENCY)
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'ok'
+    return response
+
+
+class HealthBenchmark(base.BaseTestCase):
+    """Wall time of fetching from a few dead domains among healthy ones,
+    with and without the domain health tracker.
+    """
+
+    def _fetch(self, health):
+        ftc = Fetcher(config.SourceConfig(), pool_size=20, per_host=4,
+                      timeout=TIMEOUT, health=health)
+        urls = ['http://%s%d.bar/%d' % ('dead' if d < DEAD else 'live', d, i)
+                for d in range(DOMAINS) for i in range(PAGES)]
+        start = time.time()
+        with mock.patch.object(ftc.session, 'get', side_effect=fake_get):
+            pages = ftc.fetch_many(urls)
+        elapsed = time.time() - start
+        self.assertEqual((DOMAINS - DEAD) * PAGES, pages.count('ok'))
+        return elapsed
+
+    def test_dead_domains(self):
+        without = self._fetch(None)
+        tracker = HealthTracker(TIMEOUT, min_timeout=0.01)
+        with_health = self._fetch(tracker)
+        LOG.info('%d pages of %d domains, %d of them dead: %.2f s without '
+                 'domain health, %.2f s with it', DOMAINS * PAGES, DOMAINS,
+                 DEAD, without, with_health)
+        self.assertTrue(tracker.is_open('dead0.bar'))
+        self.assertLess(with_health, without)
@@ -0,0 +1,55 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import os
+import time
+
+from oslo_log import log as logging
+
+from datahub.news_detector.rule import parse_pool
+from datahub.tests import base
+from datahub.tests.benchmark import base as benchmark
+
+LOG = logging.getLogger(__name__)
+
+
+class ParsePoolBenchmark(base.BaseTestCase):
+
+    def _throughput(self, workers, pages):
+        """Articles parsed per second by a pool of `workers` processes."""
+        pool = parse_pool.ParsePool(workers)
+        self.addCleanup(pool.close)
+        # warm the workers up
+        for future in [pool.submit(benchmark.ARTICLE_URL, pages[0])
+                       for _ in range(workers)]:
+            future.result()
+
+        start = time.time()
+        results = [future.result() for future in
+                   [pool.submit(benchmark.ARTICLE_URL, html)
+                    for html in pages]]
+        elapsed = time.time() - start
+        self.assertTrue(all(result.is_parsed for result in results))
+        return len(pages) / elapsed
+
+    def test_scaling(self):
+        pages = [benchmark.load_fixture(name)
+                 for name in ('article_1.html', 'article_2.html')] * 20
+        cores = os.cpu_count() or 1
+        single = self._throughput(1, pages)
+        LOG.info('parse pool, 1 worker: %.1f articles/s', single)
+        if cores > 1:
+            full = self._throughput(cores, pages)
+            LOG.info('parse pool, %d workers: %.1f articles/s (x%.1f)',
+                     cores, full, full / single)
+            self.assertGreater(full, single)
@@ -0,0 +1,94 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import lxml.etree
+import mock
+from oslo_log import log as logging
+
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule import parser
+from datahub.tests import base
+from datahub.tests.benchmark import base as benchmark
+
+LOG = logging.getLogger(__name__)
+FIXTURES = ('article_1.html', 'article_2.html', 'article_en.html',
+            'article_large.html')
+
+
+def uncached_compile_xpath(expression):
+    """XPath compilation on every call, as `node.xpath` used to do."""
+    return lxml.etree.XPath(expression, namespaces=parser.REGEXP_NAMESPACES)
+
+
+# Selector building without the LRU cache, compiling through the patched
+# compile_xpath
+uncached_tag_xpath = parser.tag_xpath.__wrapped__
+
+
+class CompiledXPathBenchmark(base.BaseTestCase):
+
+    def setUp(self):
+        super(CompiledXPathBenchmark, self).setUp()
+        self.extractor = Extractor(config.SourceConfig())
+
+    def _extract_metadata(self, doc, url=benchmark.ARTICLE_URL):
+        extractor = self.extractor
+        return (extractor.get_meta_lang(doc), extractor.get_title(doc),
+                extractor.get_authors(doc), extractor.get_favicon(doc),
+                extractor.get_meta_description(doc),
+                extractor.get_canonical_link(doc),
+                extractor.get_meta_keywords(doc),
+                extractor.get_meta_data(doc),
+                extractor.get_publishing_date(url, doc))
+
+    def test_metadata_extraction(self):
+        for name in FIXTURES:
+            # without the element index, every lookup evaluates an XPath
+            doc = parser.Parser.fromstring(benchmark.load_fixture(name))
+            expected = self._extract_metadata(doc)
+            cached = benchmark.timeit(lambda: self._extract_metadata(doc),
+                                      20)
+            with mock.patch.object(parser, 'compile_xpath',
+                                   uncached_compile_xpath), \
+                    mock.patch.object(parser, 'tag_xpath',
+                                      uncached_tag_xpath):
+                self.assertEqual(expected, self._extract_metadata(doc))
+                uncached = benchmark.timeit(
+                    lambda: self._extract_metadata(doc), 20)
+            LOG.info('%s metadata: compiled per call %.2f ms, cached %.2f '
+                     'ms', name, uncached, cached)
+
+
+class BytesParseBenchmark(base.BaseTestCase):
+    """Compare building the tree from the decoded html with feeding the
+    downloaded bytes to the parser of the thread.
+    """
+
+    def test_fromstring(self):
+        for name in FIXTURES:
+            data = benchmark.load_fixture(name).encode('utf-8')
+
+            def from_text():
+                return parser.Parser.fromstring(data.decode('utf-8'))
+
+            def from_bytes():
+                return parser.Parser.fromstring(data, encoding='utf-8')
+
+            self.assertEqual(lxml.etree.tostring(from_text()),
+                             lxml.etree.tostring(from_bytes()))
+            text_ms = benchmark.timeit(from_text, 10)
+            bytes_ms = benchmark.timeit(from_bytes, 10)
+            LOG.info('%s: decode and parse %.2f ms, parse bytes %.2f ms',
+                     name, text_ms, bytes_ms)
+            self.assertLess(bytes_ms, text_ms)
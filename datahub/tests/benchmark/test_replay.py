@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import gzip
+import os
+import time
+
+import fixtures
+from oslo_log import log as logging
+
+from datahub.news_detector.rule import article
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule import replay
+from datahub.tests import base
+from datahub.tests.benchmark import base as benchmark
+
+LOG = logging.getLogger(__name__)
+PAGES = 2000
+
+
+def write_warc(path, html, pages, gzipped):
+    block = (b'HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8'
+             b'\r\n\r\n' + html)
+    with open(path, 'wb') as f:
+        for i in range(pages):
+            record = (('WARC/1.0\r\nWARC-Type: response\r\n'
+                       'WARC-Target-URI: http://foo.bar/%d.html\r\n'
+                       'Content-Length: %d\r\n\r\n' % (i, len(block)))
+                      .encode('latin-1') + block + b'\r\n\r\n')
+            f.write(gzip.compress(record, 1) if gzipped else record)
+
+
+class ReplayBenchmark(base.BaseTestCase):
+    """Pages replayed from a WARC per second, read only and parsed."""
+
+    def test_replay(self):
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        html = benchmark.load_fixture('article_1.html').encode('utf-8')
+        conf = config.SourceConfig()
+        extractor = Extractor(conf)
+        for gzipped in (False, True):
+            path = os.path.join(tempdir, 'corpus%d.warc' % gzipped)
+            write_warc(path, html, PAGES, gzipped)
+            start = time.time()
+            conf.fetcher = replay.ReplayFetcher(conf,
+                                                replay.open_corpus(path))
+            index_s = time.time() - start
+            self.assertEqual(PAGES, len(conf.fetcher.corpus))
+
+            start = time.time()
+            for i in range(PAGES):
+                conf.fetcher.fetch_raw('http://foo.bar/%d.html' % i)
+            read_rate = PAGES / (time.time() - start)
+
+            start = time.time()
+            for i in range(0, PAGES, 50):
+                art = article.Article('http://foo.bar/%d.html' % i,
+                                      config=conf, extractor=extractor)
+                art.download()
+                art.parse()
+                self.assertTrue(art.is_parsed)
+            parse_rate = PAGES / 50 / (time.time() - start)
+            conf.fetcher.close()
+            LOG.info('%s WARC of %d pages: indexed in %.2f s, %d pages/s '
+                     'read, %d pages/s downloaded and parsed',
+                     'gzip' if gzipped else 'plain', PAGES, index_s,
+                     read_rate, parse_rate)
+            self.assertGreater(read_rate, parse_rate)
@@ -0,0 +1,85 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+from newspaper.source import Category
+from oslo_log import log as logging
+from urllib import parse
+
+from datahub.news_detector.rule import article
+from datahub.news_detector.rule import config
+from datahub.tests import base
+from datahub.tests.benchmark import base as benchmark
+
+LOG = logging.getLogger(__name__)
+
+
+def nested_loop_candidates(categories, articles, sampling=1):
+    """Candidate selection as done by `_generate_format_for_categories`
+    before articles were bucketed.
+    """
+    candidates = {}
+    for category in categories:
+        flag = sampling
+        domain_path = parse.urlparse(category.url).path
+        domain = parse.urlparse(category.url).netloc + domain_path
+        for art in articles:
+            a_domain = parse.urlparse(art.url).netloc
+            if domain_path:
+                a_domain += "/" + parse.urlparse(art.url).path.split('/', 2)[1]
+            if domain == a_domain:
+                if domain not in candidates:
+                    candidates[domain] = []
+                candidates[domain].append(art)
+                flag -= 1
+            if flag == 0:
+                break
+    return candidates
+
+
+class SourceBenchmark(base.BaseTestCase):
+
+    def setUp(self):
+        super(SourceBenchmark, self).setUp()
+        conf = config.SourceConfig()
+        self.source = article.Source('http://portal.vn', config=conf)
+        # 200 categories of 100 links each, plus one link per category
+        # under a section without a category page
+        self.source.categories = [Category('http://portal.vn/muc-%d' % i)
+                                  for i in range(200)]
+        self.source.articles = [
+            article.Article('http://portal.vn/muc-%d/%d/bai.html' % (i, j),
+                            config=conf)
+            for j in range(100) for i in range(200)]
+        self.source.articles += [
+            article.Article('http://portal.vn/khac/bai-%d.html' % i,
+                            config=conf) for i in range(200)]
+
+    def _generate(self, sampling):
+        article.split_url.cache_clear()
+        return self.source._generate_format_for_categories(
+            sampling=sampling, process_article=False)
+
+    def test_generate_format_for_categories(self):
+        for sampling in (1, 5):
+            legacy = nested_loop_candidates(self.source.categories,
+                                            self.source.articles, sampling)
+            self.assertEqual(legacy, self._generate(sampling))
+
+        legacy = benchmark.timeit(
+            lambda: nested_loop_candidates(self.source.categories,
+                                           self.source.articles, 5), 1)
+        bucketed = benchmark.timeit(lambda: self._generate(5), 5)
+        LOG.info('%d categories, %d links: nested loop %.1f ms, bucketed '
+                 '%.1f ms', len(self.source.categories),
+                 len(self.source.articles), legacy, bucketed)
+        self.assertLess(bucketed, legacy)
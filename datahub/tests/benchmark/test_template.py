@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+from oslo_log import log as logging
+
+from datahub.news_detector.rule.parser import Parser
+from datahub.tests import base
+from datahub.tests.benchmark import base as benchmark
+
+LOG = logging.getLogger(__name__)
+
+
+def xpath_re_extract(template, doc):
+    """Field extraction as done by `Article.from_format` before templates
+    were compiled.
+    """
+    result = {}
+    res = Parser.xpath_re(doc, template.title)
+    if res:
+        result['title'] = res[0].text
+    res = ''
+    for text in Parser.xpath_re(doc, template.text):
+        res += text.text + '\n'
+    result['text'] = res
+    res = Parser.xpath_re(doc, template.authors[0])
+    if res:
+        result['authors'] = res[0].text
+    res = Parser.xpath_re(doc, template.publish_date)
+    if res:
+        result['publish_date'] = res[0].text
+    return result
+
+
+class CompiledTemplateBenchmark(base.BaseTestCase):
+
+    def test_apply(self):
+        template = benchmark.parse_article(
+            benchmark.load_fixture('article_1.html'))
+        compiled = template.compile_template()
+        doc = Parser.fromstring(benchmark.load_fixture('article_2.html'))
+        self.assertEqual(xpath_re_extract(template, doc), compiled.apply(doc))
+
+        rounds = 500
+        legacy = benchmark.timeit(lambda: xpath_re_extract(template, doc),
+                                  rounds)
+        applied = benchmark.timeit(lambda: compiled.apply(doc), rounds)
+        LOG.info('article_2.html extraction: xpath_re %.1f us, compiled '
+                 'template %.1f us', legacy * 1000, applied * 1000)
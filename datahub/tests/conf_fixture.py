@@ -26,4 +26,7 @@ class ConfFixture(fixtures.Fixture):
 
     def _setUp(self):
         CONF.set_default('host', 'fake-dh')
+        CONF.set_default('template_store', ':memory:', group='news_detector')
+        CONF.set_default('seen_index', ':memory:', group='news_detector')
+        CONF.set_default('http_cache', ':memory:', group='news_detector')
         self.addCleanup(CONF.reset)
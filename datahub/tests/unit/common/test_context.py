@@ -60,6 +60,16 @@ class ContextTestCase(base.BaseTestCase):
         self.assertEqual(ctx.show_deleted, ctx2.show_deleted)
         self.assertEqual(ctx.request_id, ctx2.request_id)
 
+    def test_redacted_copy(self):
+        ctx = self._create_context(roles=['admin'])
+        ctx2 = ctx.redacted_copy()
+
+        self.assertIsNone(ctx2.auth_token)
+        self.assertEqual(ctx.user_name, ctx2.user_name)
+        self.assertEqual(ctx.roles, ctx2.roles)
+        self.assertEqual(ctx.request_id, ctx2.request_id)
+        self.assertIs(ctx, dh_context.get_current())
+
     def test_request_context_sets_is_admin(self):
         ctxt = dh_context.make_admin_context()
         self.assertTrue(ctxt.is_admin)
@@ -0,0 +1,107 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+import mock
+
+from datahub.common import httpcache
+from datahub.tests import base
+
+HEADERS = {'ETag': ['"v1"'],
+           'Last-Modified': ['Mon, 01 May 2017 10:00:00 GMT']}
+
+
+class HttpCacheTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(HttpCacheTest, self).setUp()
+        self.cache = httpcache.HttpCache(':memory:')
+        self.addCleanup(self.cache.close)
+
+    def test_put_and_get(self):
+        self.cache.put('http://foo.bar', 200, HEADERS, b'body')
+        entry = self.cache.get('http://foo.bar')
+
+        self.assertEqual(200, entry.status)
+        self.assertEqual(b'body', entry.body)
+        self.assertEqual('"v1"', entry.header('etag'))
+        self.assertEqual({'If-None-Match': '"v1"',
+                          'If-Modified-Since': 'Mon, 01 May 2017 10:00:00 '
+                                               'GMT'},
+                         entry.validators())
+        self.assertEqual(4, self.cache.size)
+        self.assertIsNone(self.cache.get('http://bar.foo'))
+
+    def test_put_replaces(self):
+        self.cache.put('http://foo.bar', 200, HEADERS, b'body')
+        self.cache.put('http://foo.bar', 200, {}, b'new')
+
+        self.assertEqual(b'new', self.cache.get('http://foo.bar').body)
+        self.assertEqual({}, self.cache.get('http://foo.bar').validators())
+        self.assertEqual(3, self.cache.size)
+
+    def test_refresh(self):
+        self.cache.put('http://foo.bar', 200, HEADERS, b'body')
+        self.cache.refresh('http://foo.bar', {'etag': ['"v2"']})
+
+        entry = self.cache.get('http://foo.bar')
+        self.assertEqual({'If-None-Match': '"v2"',
+                          'If-Modified-Since': 'Mon, 01 May 2017 10:00:00 '
+                                               'GMT'},
+                         entry.validators())
+        self.assertEqual(b'body', entry.body)
+
+    def test_ttl(self):
+        cache = httpcache.HttpCache(':memory:', ttl=60)
+        self.addCleanup(cache.close)
+        with mock.patch('time.time', return_value=1000):
+            cache.put('http://foo.bar', 200, HEADERS, b'body')
+        with mock.patch('time.time', return_value=1050):
+            self.assertIsNotNone(cache.get('http://foo.bar'))
+            # a validation restarts the ttl
+            cache.refresh('http://foo.bar')
+        with mock.patch('time.time', return_value=1100):
+            self.assertIsNotNone(cache.get('http://foo.bar'))
+        with mock.patch('time.time', return_value=1200):
+            self.assertIsNone(cache.get('http://foo.bar'))
+        self.assertEqual(0, cache.size)
+
+    def test_evicts_least_recently_used(self):
+        cache = httpcache.HttpCache(':memory:', max_size=30)
+        self.addCleanup(cache.close)
+        with mock.patch('time.time', side_effect=range(100)):
+            for i in range(3):
+                cache.put('http://foo.bar/%d' % i, 200, {}, b'x' * 10)
+            cache.get('http://foo.bar/0')
+            cache.put('http://foo.bar/3', 200, {}, b'x' * 10)
+
+        self.assertEqual(20, cache.size)
+        self.assertIsNotNone(cache.get('http://foo.bar/0'))
+        self.assertIsNotNone(cache.get('http://foo.bar/3'))
+        self.assertIsNone(cache.get('http://foo.bar/1'))
+        self.assertIsNone(cache.get('http://foo.bar/2'))
+
+    def test_persistent(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'cache', 'httpcache.sqlite')
+        first = httpcache.HttpCache(path)
+        first.put('http://foo.bar', 200, HEADERS, b'body')
+        first.close()
+
+        second = httpcache.HttpCache(path)
+        self.addCleanup(second.close)
+        self.assertEqual(b'body', second.get('http://foo.bar').body)
+        self.assertEqual(4, second.size)
@@ -0,0 +1,160 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import socket
+
+import mock
+import oslo_messaging as messaging
+from oslo_messaging.notify import _impl_test
+
+from datahub.common import metrics
+from datahub.common import mq
+from datahub.tests import base
+
+
+class MetricsTest(base.BaseTestCase):
+
+    def test_no_metrics(self):
+        self.assertFalse(metrics.NO_METRICS.enabled)
+        timer = metrics.NO_METRICS.timer('stage')
+        self.assertIs(timer, metrics.NO_METRICS.timer('other'))
+        with timer:
+            pass
+        metrics.NO_METRICS.count('nodes', 10)
+        metrics.NO_METRICS.flush()
+
+    def test_for_sink(self):
+        self.assertIs(metrics.NO_METRICS, metrics.for_sink(None))
+        sink = mock.Mock()
+        stats = metrics.for_sink(sink)
+        self.assertIs(sink, stats.sink)
+        self.assertIsNot(stats, metrics.for_sink(sink))
+
+    def test_timer(self):
+        sink = mock.Mock()
+        stats = metrics.Metrics(sink)
+        with mock.patch('time.perf_counter', side_effect=[1.0, 1.25]):
+            with stats.timer('stage'):
+                pass
+        stats.flush()
+        sink.send.assert_called_once_with([('stage', 250.0)], [])
+
+    def test_timer_exception(self):
+        stats = metrics.Metrics(mock.Mock())
+
+        def fail():
+            with stats.timer('stage'):
+                raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(['stage'], [name for name, ms in stats.timings])
+
+    def test_count_flush(self):
+        sink = mock.Mock()
+        stats = metrics.Metrics(sink)
+        stats.flush()
+        sink.send.assert_not_called()
+        stats.count('nodes', 10)
+        stats.flush()
+        stats.flush()
+        sink.send.assert_called_once_with([], [('nodes', 10)])
+
+    def test_records_per_unit(self):
+        sink = mock.Mock()
+        first = metrics.Metrics(sink)
+        second = metrics.Metrics(sink)
+        first.count('nodes', 1)
+        second.count('nodes', 2)
+        first.flush()
+        sink.send.assert_called_once_with([], [('nodes', 1)])
+
+    @mock.patch.object(metrics.LOG, 'exception')
+    def test_flush_error(self, mock_exception):
+        sink = mock.Mock(**{'send.side_effect': AttributeError})
+        stats = metrics.Metrics(sink)
+        stats.count('nodes', 10)
+        stats.flush()
+        self.assertTrue(mock_exception.called)
+
+
+class HistogramSinkTest(base.BaseTestCase):
+
+    def test_percentile(self):
+        sink = metrics.HistogramSink()
+        sink.send([('stage', value) for value in range(100, 0, -1)],
+                  [('nodes', 7)])
+        self.assertEqual(50, sink.percentile('stage', 50))
+        self.assertEqual(99, sink.percentile('stage', 99))
+        self.assertEqual(7, sink.percentile('nodes', 95))
+        self.assertIsNone(sink.percentile('missing', 50))
+
+    def test_size(self):
+        sink = metrics.HistogramSink(size=3)
+        sink.send([('stage', value) for value in range(10)], [])
+        self.assertEqual([7, 8, 9], list(sink.values['stage']))
+
+
+class StatsdSinkTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(StatsdSinkTest, self).setUp()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(self.server.close)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(5)
+        self.sink = metrics.StatsdSink('127.0.0.1',
+                                       self.server.getsockname()[1],
+                                       prefix='test')
+        self.addCleanup(self.sink.close)
+
+    def test_send(self):
+        self.sink.send([('parse', 12.5)], [('nodes', 42)])
+        # counts of different units must not be summed as counters
+        self.assertEqual(b'test.parse:12.500|ms\ntest.nodes:42|h',
+                         self.server.recv(1024))
+
+    def test_send_error(self):
+        with mock.patch.object(self.sink, '_socket') as mock_socket:
+            mock_socket.sendto.side_effect = socket.error
+            self.sink.send([('parse', 1)], [])
+        self.assertTrue(mock_socket.sendto.called)
+
+
+class NotifierSinkTest(base.TestCase):
+
+    def setUp(self):
+        super(NotifierSinkTest, self).setUp()
+        transport = messaging.get_notification_transport(base.CONF,
+                                                         url='fake:/')
+        self.notifier = messaging.Notifier(
+            transport, publisher_id='news_detector.test', driver='test',
+            serializer=mq.RequestContextSerializer(
+                mq.JsonPayloadSerializer()))
+        _impl_test.reset()
+        self.addCleanup(_impl_test.reset)
+
+    def test_send(self):
+        sink = metrics.NotifierSink(self.notifier,
+                                    event_type='detector.parse')
+        stats = metrics.Metrics(sink)
+        stats.timings.append(('parse', 12.5))
+        stats.count('nodes', 42)
+        stats.flush()
+
+        [(ctxt, message, priority, retry)] = _impl_test.NOTIFICATIONS
+        self.assertTrue(ctxt['is_admin'])
+        self.assertEqual('INFO', priority)
+        self.assertEqual('detector.parse', message['event_type'])
+        self.assertEqual({'timings': {'parse': 12.5}, 'counts': {'nodes': 42}},
+                         message['payload'])
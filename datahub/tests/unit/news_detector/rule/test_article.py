@@ -12,23 +12,40 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+
+import eventlet
 import fixtures
+import lxml.html
 import mock
 from mock import sentinel
 from newspaper.article import Article as BaseArticle
 from newspaper.cleaners import DocumentCleaner
 from newspaper.network import MRequest
+from newspaper.source import Category
 from newspaper.source import Source as BaseSource
 
+from datahub.common import metrics
 from datahub.news_detector.rule import article
 from datahub.news_detector.rule import config
 from datahub.news_detector.rule.extractor import Extractor
 from datahub.news_detector.rule.extractor import VideoExtractor
-from datahub.news_detector.rule.parser import ObjectParser
+from datahub.news_detector.rule.fetcher import Fetcher
+from datahub.news_detector.rule import fingerprint
+from datahub.news_detector.rule import health
 from datahub.news_detector.rule.parser import Parser
+from datahub.news_detector.rule import seen
+from datahub.news_detector.rule.template import CompiledTemplate
 
 from datahub.tests import base
 
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
 
 class ArticleTest(base.TestCase):
 
@@ -47,6 +64,91 @@ class ArticleTest(base.TestCase):
         self.assertRaises(article.ArticleException, self.article.process)
         mock_download.assert_called_once_with()
 
+    @mock.patch.object(BaseArticle, 'download')
+    def test_download_fetcher(self, mock_download):
+        self.config.fetcher = mock.Mock()
+        self.config.fetcher.fetch_raw.return_value = (b'fake_html', 'utf-8')
+        self.article.download()
+        self.config.fetcher.fetch_raw.assert_called_once_with(self.url)
+        mock_download.assert_called_once_with(html='fake_html')
+
+    def test_download_fetcher_keeps_bytes(self):
+        raw_html = load_fixture('article_1.html').encode('utf-8')
+        self.config.fetcher = mock.Mock()
+        self.config.fetcher.fetch_raw.return_value = (raw_html, None)
+        self.article.download()
+        self.assertIs(raw_html, self.article.raw_html)
+        self.assertEqual('utf-8', self.article.html_encoding)
+        self.assertEqual(load_fixture('article_1.html'), self.article.html)
+
+        with mock.patch.object(Parser, 'fromstring') as mock_from:
+            self.article.from_format(CompiledTemplate())
+            self.article.from_format(CompiledTemplate())
+        # the bytes build the first tree only
+        self.assertEqual([mock.call(raw_html, encoding='utf-8'),
+                          mock.call(self.article.html)],
+                         mock_from.call_args_list)
+        self.assertIsNone(self.article.raw_html)
+
+    def test_download_html_drops_bytes(self):
+        self.article.raw_html = b'old'
+        self.article.download(html='<html></html>')
+        self.assertIsNone(self.article.raw_html)
+
+    @mock.patch.object(Parser, 'fromstring')
+    def test_parse_sniffed_language(self, mock_from):
+        self.article.is_downloaded = True
+        self.article.html = '<html lang="en"><body>x</body></html>'
+        self.article.parse()
+        self.assertFalse(self.article.is_parsed)
+        mock_from.assert_not_called()
+
+        # self.config is the SourceConfig of the article here
+        base.TestCase.config(self, language_sniff_size=0,
+                             group='news_detector')
+        mock_from.return_value = None
+        self.article.parse()
+        mock_from.assert_called_once_with(self.article.html)
+
+    def _parsed(self, art):
+        art.title = '//h1'
+        art.authors = ['//span']
+        art.is_parsed = True
+
+    def test_parse_downloaded_fingerprints(self):
+        self.config.fingerprints = fingerprint.FingerprintCache(10)
+        with mock.patch.object(article.Article, 'parse', autospec=True,
+                               side_effect=self._parsed) as mock_parse:
+            for html in ('<p>a</p>', '<p>a</p>\n', '<p>b</p>'):
+                art = article.Article(self.url, config=self.config,
+                                      extractor=self.extractor)
+                art.download(html=html)
+                art.parse_downloaded()
+                self.assertTrue(art.is_parsed)
+                self.assertEqual('//h1', art.title)
+
+        self.assertEqual(2, mock_parse.call_count)
+        # cached results are not shared with the articles
+        art.authors.append('//div')
+        self.assertEqual(['//span'], self.config.fingerprints.get(
+            self.url, '<p>b</p>').authors)
+
+    @mock.patch.object(article.Article, 'parse_downloaded')
+    @mock.patch.object(article.Article, 'download')
+    def test_process_marks_seen(self, mock_download, mock_parse):
+        self.config.seen_index = seen.SeenIndex(':memory:', 10)
+        self.article.process()
+        self.assertNotIn(self.url, self.config.seen_index)
+        self.article.is_parsed = True
+        self.article.process()
+        self.assertIn(self.url, self.config.seen_index)
+
+    @mock.patch.object(BaseArticle, 'download')
+    def test_download_not_marked_seen(self, mock_download):
+        self.config.seen_index = seen.SeenIndex(':memory:', 10)
+        self.article.download()
+        self.assertNotIn(self.url, self.config.seen_index)
+
     @mock.patch.object(Parser, 'fromstring')
     @mock.patch.object(BaseArticle, 'download')
     def test_process_no_parse(self, mock_download, mock_from):
@@ -61,8 +163,7 @@ class ArticleTest(base.TestCase):
                           self.article.from_format, None)
 
     @mock.patch.object(Parser, 'fromstring')
-    @mock.patch.object(Parser, 'xpath_re')
-    def test_from_format_none(self, mock_xpath, mock_from):
+    def test_from_format_none(self, mock_from):
         target = article.Article('http://foo.bar', config=self.config,
                                  extractor=self.extractor)
         target.is_downloaded = True
@@ -71,25 +172,26 @@ class ArticleTest(base.TestCase):
 
         target.from_format(self.article)
 
-        mock_xpath.assert_not_called()
+        self.assertEqual('', target.title)
+        self.assertEqual('', target.text)
+        self.assertEqual([], target.authors)
+        self.assertEqual('', target.publish_date)
+        self.assertTrue(target.is_parsed)
 
     @mock.patch.object(Parser, 'fromstring')
-    @mock.patch.object(Parser, 'xpath_re')
-    def test_from_format_ok(self, mock_xpath, mock_from):
-        mock_xpath.side_effect = [
-            [ObjectParser(self.doc, 'xpath1', 'fake_title1')],
-            [ObjectParser(self.doc, 'xpath1', 'fake_text1')],
-            [ObjectParser(self.doc, 'xpath1', 'fake_author1')],
-            [ObjectParser(self.doc, 'xpath1', 'fake_date1')]]
-        self.article.title = 'fake_title'
-        self.article.text = 'fake_text'
-        self.article.publish_date = 'fake_date'
-        self.article.authors = ['fake_author']
+    def test_from_format_ok(self, mock_from):
+        self.article.title = '//h1'
+        self.article.text = '//div[@id="content"]//text()'
+        self.article.publish_date = '//meta[@name="date"]/@content'
+        self.article.authors = ['//*[re:test(@class, "^author$", "i")]']
         self.article.is_parsed = True
         target = article.Article('http://foo.bar', config=self.config,
                                  extractor=self.extractor)
         target.is_downloaded = True
-        mock_from.return_value = self.doc
+        mock_from.return_value = lxml.html.fromstring(
+            '<html><head><meta name="date" content="fake_date1"></head>'
+            '<body><h1>fake_title1</h1><div class="Author">fake_author1'
+            '</div><div id="content"><p>fake_text1</p></div></body></html>')
 
         target.from_format(self.article)
 
@@ -97,10 +199,21 @@ class ArticleTest(base.TestCase):
         self.assertEqual('fake_text1\n', target.text)
         self.assertEqual('fake_date1', target.publish_date)
         self.assertEqual('fake_author1', target.authors)
-        mock_xpath.assert_has_calls([mock.call(target.doc, 'fake_title'),
-                                     mock.call(target.doc, 'fake_text'),
-                                     mock.call(target.doc, 'fake_author'),
-                                     mock.call(target.doc, 'fake_date')])
+        compiled = self.article.compiled_template
+        self.assertIsInstance(compiled, CompiledTemplate)
+
+        # the template is compiled once and can be given directly
+        other = article.Article('http://foo.bar', config=self.config,
+                                extractor=self.extractor)
+        other.is_downloaded = True
+        other.from_format(self.article)
+        self.assertIs(compiled, self.article.compiled_template)
+        other.from_format(compiled)
+        self.assertEqual('fake_title1', other.title)
+
+    def test_compile_template_not_parsed(self):
+        self.assertRaises(article.ArticleException,
+                          self.article.compile_template)
 
     @mock.patch.object(Parser, 'fromstring')
     def test_from_format_exc_doc(self, mock_from):
@@ -111,6 +224,7 @@ class ArticleTest(base.TestCase):
         self.assertRaises(article.ArticleException,
                           target.from_format, self.article)
 
+    @mock.patch('copy.deepcopy')
     @mock.patch.object(BaseArticle, 'set_movies')
     @mock.patch.object(BaseArticle, 'release_resources')
     @mock.patch.object(VideoExtractor, 'get_videos')
@@ -126,15 +240,18 @@ class ArticleTest(base.TestCase):
     @mock.patch.object(Extractor, 'get_meta_lang')
     @mock.patch.object(Extractor, 'get_authors')
     @mock.patch.object(Extractor, 'get_title')
+    @mock.patch.object(Parser, 'drop_index')
+    @mock.patch.object(Parser, 'index')
     @mock.patch.object(BaseArticle, 'get_parse_candidate')
     @mock.patch.object(Parser, 'fromstring')
     @mock.patch.object(BaseArticle, 'download')
     def test_process_ok(self, mock_download, mock_from, mock_get_parse,
-                        mock_get_title, mock_get_auth, mock_get_lang,
-                        mock_get_ico, mock_get_desc, mock_get_link,
-                        mock_extract, mock_get_kw, mock_get_data,
-                        mock_get_date, mock_clean, mock_calc, mock_video,
-                        mock_release, mock_set_video):
+                        mock_index, mock_drop_index, mock_get_title,
+                        mock_get_auth, mock_get_lang, mock_get_ico,
+                        mock_get_desc, mock_get_link, mock_extract,
+                        mock_get_kw, mock_get_data, mock_get_date,
+                        mock_clean, mock_calc, mock_video, mock_release,
+                        mock_set_video, mock_deepcopy):
         self.article.is_downloaded = True
         mock_get_title.return_value = 'fake_title'
         mock_get_auth.return_value = ['fake_auth']
@@ -159,6 +276,137 @@ class ArticleTest(base.TestCase):
         mock_download.assert_called_once_with()
         mock_release.assert_called_once_with()
         mock_set_video.assert_called_once_with('fake_video')
+        mock_index.assert_called_once_with(self.clean_doc)
+        mock_drop_index.assert_called_once_with(self.clean_doc)
+        mock_get_title.assert_called_once_with(self.clean_doc)
+        mock_clean.assert_called_once_with(self.clean_doc)
+        mock_deepcopy.assert_not_called()
+        self.assertIsNone(self.article.clean_doc)
+        self.assertEqual(self.doc, self.article.doc)
+
+    def _parse_fixture(self, name):
+        target = article.Article('http://baotainguyenmoitruong.vn/kinh-te/'
+                                 '201703/bai-viet-1.html',
+                                 config=self.config, extractor=self.extractor)
+        target.download(html=load_fixture(name))
+        target.parse()
+        return target
+
+    def test_parse_fixture_metrics(self):
+        sink = metrics.HistogramSink()
+        self.config.metrics_sink = sink
+        with mock.patch.object(sink, 'send', wraps=sink.send) as mock_send:
+            target = self._parse_fixture('article_1.html')
+        self.assertTrue(target.is_parsed)
+        self.assertEqual(1, mock_send.call_count)
+        for stage in ('parse', 'fromstring', 'index', 'get_meta_lang',
+                      'get_title', 'get_authors', 'get_favicon',
+                      'get_meta_description', 'get_canonical_link',
+                      'extract_tags', 'get_meta_keywords', 'get_meta_data',
+                      'get_publishing_date', 'clean',
+                      'calculate_best_node'):
+            self.assertEqual(1, len(sink.values[stage]), stage)
+        self.assertNotIn('deepcopy', sink.values)
+        self.assertGreater(sink.percentile('nodes', 50),
+                           sink.percentile('clean.nodes', 50))
+
+    def test_parse_metrics_flushed_on_error(self):
+        sink = mock.Mock()
+        self.config.metrics_sink = sink
+        self.article.is_downloaded = True
+        self.article.html = '<html lang="vi"></html>'
+        with mock.patch.object(self.article, '_parse',
+                               side_effect=ValueError):
+            self.assertRaises(ValueError, self.article.parse)
+        timings, counts = sink.send.call_args[0]
+        self.assertEqual(['parse'], [name for name, ms in timings])
+
+    @mock.patch.object(Parser, 'drop_index')
+    @mock.patch.object(Extractor, 'get_title', side_effect=ValueError)
+    def test_parse_index_dropped_on_error(self, mock_get_title,
+                                          mock_drop_index):
+        target = article.Article('http://baotainguyenmoitruong.vn/kinh-te/'
+                                 '201703/bai-viet-1.html',
+                                 config=self.config, extractor=self.extractor)
+        target.download(html=load_fixture('article_1.html'))
+        self.assertRaises(ValueError, target.parse)
+        mock_drop_index.assert_called_once_with(target.clean_doc)
+
+    def test_parse_metrics_sink_error(self):
+        self.config.metrics_sink = mock.Mock()
+        self.config.metrics_sink.send.side_effect = AttributeError
+        target = self._parse_fixture('article_1.html')
+        self.assertTrue(target.is_parsed)
+        self.assertTrue(self.config.metrics_sink.send.called)
+
+    def test_parse_fixture_in_place(self):
+        with mock.patch('copy.deepcopy') as mock_deepcopy:
+            target = self._parse_fixture('article_1.html')
+        mock_deepcopy.assert_not_called()
+        self.assertTrue(target.is_parsed)
+        self.assertIsNone(target.clean_doc)
+        self.assertEqual('/html/body/div[2]/div[2]/h1', target.title)
+        self.assertEqual('/html/head/link[1]/@href', target.canonical_link)
+        self.assertEqual('/html/head/meta[9]/@content', target.publish_date)
+
+    def test_parse_fixture_bytes(self):
+        from_text = self._parse_fixture('article_large.html')
+        target = article.Article(from_text.url, config=self.config,
+                                 extractor=self.extractor)
+        target.download(html=from_text.html)
+        target.raw_html = from_text.html.encode('utf-8')
+        target.html_encoding = 'utf-8'
+        target.parse()
+        self.assertIsNone(target.raw_html)
+        for attr in ('title', 'authors', 'publish_date', 'canonical_link',
+                     'text', 'meta_description', 'meta_keywords', 'tags',
+                     'meta_data'):
+            self.assertEqual(getattr(from_text, attr), getattr(target, attr))
+
+    def test_parse_fixture_keep_clean_doc(self):
+        in_place = self._parse_fixture('article_1.html')
+        self.config.keep_clean_doc = True
+        kept = self._parse_fixture('article_1.html')
+        self.assertIsNotNone(kept.clean_doc)
+        self.assertIsNot(kept.doc, kept.clean_doc)
+        # the kept tree is untouched by the cleaner
+        self.assertTrue(kept.clean_doc.xpath('//script'))
+        self.assertFalse(kept.doc.xpath('//script'))
+        for attr in ('title', 'authors', 'publish_date', 'canonical_link',
+                     'text', 'meta_description', 'meta_keywords', 'tags',
+                     'meta_data'):
+            self.assertEqual(getattr(in_place, attr), getattr(kept, attr))
+
+    def test_fetch_metadata(self):
+        target = article.Article('http://baotainguyenmoitruong.vn/kinh-te/'
+                                 '201703/bai-viet-1.html',
+                                 config=self.config, extractor=self.extractor)
+        target.download(html=load_fixture('article_1.html'))
+        with mock.patch.object(lxml.html, 'fromstring') as mock_from:
+            metadata = target.fetch_metadata()
+        mock_from.assert_not_called()
+        self.assertFalse(target.is_parsed)
+        self.assertEqual('http://baotainguyenmoitruong.vn/kinh-te/201703/'
+                         'bai-viet-1.html', metadata.canonical_link)
+        self.assertEqual('2017-09-01T08:56:00+07:00', metadata.publish_date)
+        self.assertEqual('vi', metadata.meta_lang)
+        self.assertEqual(metadata.meta_keywords,
+                         metadata.meta_data['keywords'])
+
+    def test_fetch_metadata_fetcher(self):
+        self.config.fetcher = mock.Mock()
+        self.config.fetcher.fetch_head.return_value = \
+            Parser.head_fromchunks([load_fixture('article_en.html')])
+        metadata = self.article.fetch_metadata()
+        self.config.fetcher.fetch_head.assert_called_once_with(self.url)
+        self.config.fetcher.fetch.assert_not_called()
+        self.assertFalse(self.article.is_downloaded)
+        self.assertEqual('en', metadata.meta_lang)
+
+    def test_fetch_metadata_failed(self):
+        self.config.fetcher = mock.Mock()
+        self.config.fetcher.fetch_head.return_value = None
+        self.assertIsNone(self.article.fetch_metadata())
 
 
 class SourceTest(base.BaseTestCase):
@@ -193,6 +441,30 @@ class SourceTest(base.BaseTestCase):
         self.assertEqual({}, res)
         mock_download.assert_called_once_with()
 
+    @mock.patch.object(BaseSource, 'download')
+    def test_process_domain_failing(self, mock_download):
+        self.config.health = health.HealthTracker(7.0, error_rate=0.1,
+                                                  min_requests=1)
+        self.config.health.failure('foo.bar')
+        self.assertEqual({}, self.source.process())
+        mock_download.assert_not_called()
+
+    @mock.patch.object(article.Source, 'parse_categories')
+    @mock.patch.object(article.Source, 'download_categories')
+    @mock.patch.object(article.Source, 'set_categories')
+    @mock.patch.object(article.Source, 'parse')
+    @mock.patch.object(article.Source, 'download')
+    def test_process_domain_fails(self, mock_download, mock_parse,
+                                  mock_set, mock_download_categories,
+                                  mock_parse_categories):
+        self.config.health = health.HealthTracker(7.0, error_rate=0.1,
+                                                  min_requests=1)
+        mock_download_categories.side_effect = (
+            lambda: self.config.health.failure('foo.bar'))
+        self.assertEqual({}, self.source.process())
+        mock_download.assert_called_once_with()
+        mock_parse_categories.assert_not_called()
+
     @mock.patch('newspaper.network.multithread_request')
     @mock.patch.object(Parser, 'fromstring')
     @mock.patch.object(BaseSource, 'download')
@@ -209,7 +481,7 @@ class SourceTest(base.BaseTestCase):
     @mock.patch('newspaper.network.multithread_request')
     @mock.patch.object(article.Article, 'process')
     @mock.patch.object(article.Article, 'is_valid_url')
-    @mock.patch.object(Extractor, 'get_urls')
+    @mock.patch.object(Extractor, 'iter_urls')
     @mock.patch.object(BaseSource, '_get_category_urls')
     @mock.patch.object(Parser, 'fromstring')
     @mock.patch('newspaper.network.get_html')
@@ -226,8 +498,8 @@ class SourceTest(base.BaseTestCase):
                                  sentinel.fake_html2]
         mock_valid.return_value = True
         mock_process.side_effect = [None, article.ArticleException, None, None]
-        mock_get_url.side_effect = [[('fake_url1', 'fake_title1')],
-                                    [('fake_url2', 'fake_title2')]]
+        mock_get_url.side_effect = [iter([('fake_url1', 'fake_title1')]),
+                                    iter([('fake_url2', 'fake_title2')])]
         mock_get_cat.return_value = ['http://foo.bar/fake_url1',
                                      'http://foo.bar/fake_url2']
 
@@ -277,3 +549,168 @@ class SourceTest(base.BaseTestCase):
 
     def test_process_source_ok(self):
         self._process_test(is_process=True, process_all=False)
+
+    @mock.patch.object(article.Article, 'is_valid_url', autospec=True,
+                       side_effect=lambda a: a.url.startswith('http'))
+    def test_categories_to_articles(self, mock_valid):
+        cat1 = Category('http://foo.bar/news')
+        cat1.doc = Parser.fromstring(
+            '<html><body><a href="/news/2017/a-long-article-title.html">'
+            'A</a><a href="/#top">top</a><a href="mailto:x@foo.bar">m</a>'
+            '</body></html>')
+        cat2 = Category('http://foo.bar/world')
+        cat2.doc = Parser.fromstring(
+            '<html><body><a href="http://foo.bar/news/2017/'
+            'a-long-article-title.html">B</a></body></html>')
+        self.source.categories = [cat1, cat2]
+        res = self.source.categories_to_articles()
+        self.assertEqual(
+            ['http://foo.bar/news/2017/a-long-article-title.html'],
+            [a.url for a in res])
+        self.assertEqual(3, mock_valid.call_count)
+
+    @mock.patch.object(article.Article, 'is_valid_url', autospec=True,
+                       side_effect=lambda a: not a.url.endswith('/'))
+    def test_categories_to_articles_first_valid(self, mock_valid):
+        category = Category('http://foo.bar/news')
+        category.links = [('http://foo.bar/news/1.html/', 'A'),
+                          ('http://foo.bar/news/1.html', 'B'),
+                          ('http://foo.bar/news/1.html', 'C')]
+        self.source.categories = [category]
+        res = self.source.categories_to_articles()
+        self.assertEqual(['http://foo.bar/news/1.html'],
+                         [a.url for a in res])
+        self.assertEqual(3, mock_valid.call_count)
+
+    def test_purge_articles(self):
+        valid = mock.Mock(**{'is_valid_url.return_value': True})
+        invalid = mock.Mock(**{'is_valid_url.return_value': False})
+        articles = [valid, invalid]
+        self.assertIs(articles, self.source.purge_articles('url', articles))
+        self.assertEqual([valid], articles)
+        res = self.source.purge_articles('url', iter([invalid, valid]))
+        self.assertNotIsInstance(res, list)
+        self.assertEqual([valid], list(res))
+
+    def test_download_fetcher(self):
+        self.source.fetcher = mock.Mock()
+        self.source.fetcher.fetch.return_value = 'fake_html'
+        self.source.download()
+        self.assertEqual('fake_html', self.source.html)
+        self.source.fetcher.fetch.assert_called_once_with(self.url,
+                                                          cached=True)
+
+    def test_download_categories_fetcher(self):
+        self.source.fetcher = mock.Mock()
+        self.source.fetcher.fetch_many.return_value = ['fake_html1', '']
+        self.source.categories = [Category('http://foo.bar/a'),
+                                  Category('http://foo.bar/b')]
+        self.source.download_categories()
+        self.assertEqual(['http://foo.bar/a'],
+                         [c.url for c in self.source.categories])
+        self.assertEqual('fake_html1', self.source.categories[0].html)
+        self.source.fetcher.fetch_many.assert_called_once_with(
+            ['http://foo.bar/a', 'http://foo.bar/b'], cached=True)
+
+    def test_generate_format_fetcher(self):
+        self.config.fetcher = Fetcher(self.config)
+        self.source = article.Source(self.url, config=self.config,
+                                     extractor=self.extractor)
+        self.source.categories = [Category('http://foo.bar/a'),
+                                  Category('http://foo.bar/b')]
+        urls = ['http://foo.bar/a/1', 'http://foo.bar/a/2',
+                'http://foo.bar/b/1']
+        self.source.articles = [article.Article(url, config=self.config)
+                                for url in urls]
+        processed = []
+
+        def process(target):
+            # yield so that the domains are processed concurrently
+            eventlet.sleep(0)
+            processed.append(target.url)
+            target.is_parsed = target.url != 'http://foo.bar/a/1'
+
+        with mock.patch.object(article.Article, 'process', autospec=True,
+                               side_effect=process):
+            res = self.source._generate_format_for_categories(sampling=2)
+
+        self.assertEqual(['http://foo.bar/a/1', 'http://foo.bar/b/1',
+                          'http://foo.bar/a/2'], processed)
+        self.assertEqual(['http://foo.bar/a/2'],
+                         [a.url for a in res['foo.bar/a']])
+        self.assertEqual(['http://foo.bar/b/1'],
+                         [a.url for a in res['foo.bar/b']])
+
+    def test_generate_format_sampling(self):
+        self.source.categories = [Category('http://foo.bar/a'),
+                                  Category('http://foo.bar'),
+                                  Category('http://foo.bar/c')]
+        urls = ['http://foo.bar/a/1', 'http://foo.bar/b/1',
+                'http://foo.bar/a/2', 'http://foo.bar/a/3', 'http://foo.bar']
+        self.source.articles = [article.Article(url, config=self.config)
+                                for url in urls]
+
+        res = self.source._generate_format_for_categories(
+            sampling=2, process_article=False)
+        self.assertEqual({'foo.bar/a': urls[0:4:2], 'foo.bar': urls[:2]},
+                         dict((k, [a.url for a in v])
+                              for k, v in res.items()))
+
+        res = self.source._generate_format_for_categories(
+            sampling=-1, process_article=False)
+        self.assertEqual(urls[0:4:2] + urls[3:4],
+                         [a.url for a in res['foo.bar/a']])
+        self.assertEqual(urls, [a.url for a in res['foo.bar']])
+
+    def test_generate_format_skips_seen(self):
+        self.source.seen_index = seen.SeenIndex(':memory:', 10)
+        self.source.seen_index.add('https://foo.bar/a/1/')
+        self.source.categories = [Category('http://foo.bar/a')]
+        urls = ['http://foo.bar/a/1', 'http://foo.bar/a/2']
+        self.source.articles = [article.Article(url, config=self.config)
+                                for url in urls]
+
+        res = self.source._generate_format_for_categories(
+            sampling=1, process_article=False)
+        self.assertEqual(['http://foo.bar/a/2'],
+                         [a.url for a in res['foo.bar/a']])
+
+    def test_generate_format_seen_lookups(self):
+        self.source.seen_index = mock.MagicMock()
+        self.source.seen_index.__contains__.side_effect = [True, False]
+        self.source.categories = [Category('http://foo.bar/a')]
+        urls = ['http://foo.bar/a/%d' % i for i in range(5)]
+        self.source.articles = [article.Article(url, config=self.config)
+                                for url in urls]
+
+        res = self.source._generate_format_for_categories(
+            sampling=1, process_article=False)
+        self.assertEqual(urls[1:2], [a.url for a in res['foo.bar/a']])
+        self.assertEqual(2, self.source.seen_index.__contains__.call_count)
+
+    def test_parse_categories_fingerprints(self):
+        self.config.fingerprints = fingerprint.FingerprintCache(10)
+        html = '<html><body><a href="/a/1">one</a></body></html>'
+        for _ in range(2):
+            category = Category('http://foo.bar/a')
+            category.html = html
+            empty = Category('http://foo.bar/b')
+            empty.html = ''
+            self.source.categories = [category, empty]
+            with mock.patch.object(Parser, 'fromstring',
+                                   wraps=Parser.fromstring) as mock_from:
+                self.source.parse_categories()
+            self.assertEqual([category], self.source.categories)
+            self.assertEqual([('/a/1', 'one')], category.links)
+
+        # the unchanged category is not parsed again
+        mock_from.assert_called_once_with('')
+
+    @mock.patch.object(BaseSource, '_get_category_urls')
+    def test_set_categories(self, mock_get_cat):
+        mock_get_cat.return_value = ['http://foo.bar/a/', 'http://foo.bar/b',
+                                     'https://foo.bar/a?utm_source=x',
+                                     'http://foo.bar/b']
+        self.source.set_categories()
+        self.assertEqual(['http://foo.bar/a/', 'http://foo.bar/b'],
+                         [c.url for c in self.source.categories])
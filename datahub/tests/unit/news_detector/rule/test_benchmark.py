@@ -0,0 +1,139 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+
+import fixtures
+import mock
+
+from datahub.news_detector.rule import benchmark
+from datahub.news_detector.rule import replay
+from datahub.tests import base
+
+STAGES = {'fromstring': {'count': 1, 'pages_per_sec': 1000.0,
+                         'mean_ms': 1.0, 'p50_ms': 1.0, 'p95_ms': 1.0,
+                         'p99_ms': 1.0}}
+
+
+class BenchmarkTest(base.TestCase):
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(50, benchmark.percentile(samples, 50))
+        self.assertEqual(99, benchmark.percentile(samples, 99))
+        self.assertEqual(1, benchmark.percentile(samples, 0))
+        self.assertEqual(7, benchmark.percentile([7], 95))
+        self.assertEqual(0.0, benchmark.percentile([], 50))
+
+    def test_summarize(self):
+        result = benchmark.summarize([0.003, 0.001, 0.002, 0.002])
+        self.assertEqual(4, result['count'])
+        self.assertAlmostEqual(500.0, result['pages_per_sec'])
+        self.assertAlmostEqual(2.0, result['mean_ms'])
+        self.assertAlmostEqual(2.0, result['p50_ms'])
+        self.assertAlmostEqual(3.0, result['p99_ms'])
+
+    def test_compare(self):
+        baseline = {'fromstring': {'p50_ms': 1.0},
+                    'clean': {'p50_ms': 2.0},
+                    'deepcopy': {'p50_ms': 0.0}}
+        results = {'fromstring': {'p50_ms': 1.05},
+                   'clean': {'p50_ms': 2.5},
+                   'deepcopy': {'p50_ms': 1.0},
+                   'from_format': {'p50_ms': 1.0}}
+        self.assertEqual([('clean', 2.0, 2.5)],
+                         benchmark.compare(baseline, results, 10))
+
+    def test_load_bundled_corpus(self):
+        pages = benchmark.load_corpus(benchmark.BUNDLED_CORPUS)
+        self.assertIn(benchmark.CORPUS_URL + 'article_1.html',
+                      [page.url for page in pages])
+        self.assertTrue(all(isinstance(page.body, bytes) for page in pages))
+
+    def test_load_replay_corpus(self):
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        with open(os.path.join(tempdir, 'a.html'), 'wb') as f:
+            f.write(b'<p>a</p>')
+        with open(os.path.join(tempdir, replay.DIRECTORY_INDEX), 'w') as f:
+            f.write('http://foo.bar/a\ta.html\tutf-8\n'
+                    'http://foo.bar/b\tmissing.html\n')
+        self.assertEqual(
+            [benchmark.BenchmarkPage('http://foo.bar/a', b'<p>a</p>',
+                                     'utf-8')],
+            benchmark.load_corpus(tempdir))
+
+    def test_run(self):
+        pages = [page for page in
+                 benchmark.load_corpus(benchmark.BUNDLED_CORPUS)
+                 if page.url.endswith('article_1.html')]
+        results = benchmark.Benchmark(pages).run(rounds=2)
+        stages = ['decode', 'fromstring', 'index']
+        stages += benchmark.Benchmark.EXTRACTOR_STAGES
+        stages += ['get_publishing_date', 'deepcopy', 'clean',
+                   'calculate_best_node', 'from_format']
+        self.assertEqual(stages, list(results))
+        for result in results.values():
+            self.assertEqual(2, result['count'])
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class BenchmarkCommandTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(BenchmarkCommandTest, self).setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.output = os.path.join(self.tempdir, 'results.json')
+        self.load = self.useFixture(fixtures.MockPatchObject(
+            benchmark, 'load_corpus',
+            return_value=[benchmark.BenchmarkPage('http://foo.bar', b'',
+                                                  None)])).mock
+        self.run = self.useFixture(fixtures.MockPatchObject(
+            benchmark.Benchmark, 'run', return_value=STAGES)).mock
+
+    def _baseline(self, p50_ms):
+        path = os.path.join(self.tempdir, 'baseline.json')
+        stages = {'fromstring': dict(STAGES['fromstring'], p50_ms=p50_ms)}
+        with open(path, 'w') as f:
+            json.dump({'stages': stages}, f)
+        return path
+
+    def test_main(self):
+        self.assertEqual(0, benchmark.main(['--rounds', '3',
+                                            '--output', self.output]))
+        self.load.assert_called_once_with(benchmark.BUNDLED_CORPUS)
+        self.run.assert_called_once_with(3)
+        with open(self.output) as f:
+            results = json.load(f)
+        self.assertEqual(1, results['pages'])
+        self.assertEqual(STAGES, results['stages'])
+        self.assertNotIn('regressions', results)
+
+    def test_main_no_regression(self):
+        self.assertEqual(0, benchmark.main(
+            ['--output', self.output, '--baseline', self._baseline(0.95)]))
+
+    @mock.patch('sys.stderr')
+    def test_main_regression(self, mock_stderr):
+        self.assertEqual(1, benchmark.main(
+            ['--output', self.output, '--baseline', self._baseline(0.5),
+             '--threshold', '20']))
+        with open(self.output) as f:
+            results = json.load(f)
+        self.assertEqual([{'stage': 'fromstring', 'baseline_p50_ms': 0.5,
+                           'p50_ms': 1.0}], results['regressions'])
+        self.assertTrue(mock_stderr.write.called)
+
+    @mock.patch('sys.stderr')
+    def test_main_empty_corpus(self, mock_stderr):
+        self.load.return_value = []
+        self.assertEqual(2, benchmark.main(['--corpus', self.tempdir]))
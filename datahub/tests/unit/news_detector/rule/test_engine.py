@@ -12,18 +12,43 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+import sqlite3
+
+import eventlet
+import fixtures
 import mock
 
+from datahub.common import metrics
+from datahub.common import mq
 from datahub.news_detector.rule import article
 from datahub.news_detector.rule import engine
+from datahub.news_detector.rule import replay
+from datahub.news_detector.rule import store
 from datahub.tests import base
 
 
+def parsed(art):
+    art.is_parsed = True
+
+
+def downloaded(art):
+    art.is_downloaded = True
+
+
+def fake_article(**kwargs):
+    values = dict(title='//h1', text='//p//text()', authors=[],
+                  publish_date='', canonical_link='')
+    values.update(kwargs)
+    return mock.Mock(**values)
+
+
 class RuleEngineTestCase(base.TestCase):
 
     def setUp(self):
         super(RuleEngineTestCase, self).setUp()
         self.engine = engine.Engine()
+        self.addCleanup(self.engine.close)
 
     @mock.patch.object(article.Article, 'process',
                        side_effect=article.ArticleException)
@@ -42,10 +67,334 @@ class RuleEngineTestCase(base.TestCase):
         self.assertIsNone(res)
         self.assertFalse(mock_process.called)
 
-    @mock.patch.object(article.Source, 'process', return_value='foobar')
+    @mock.patch.object(article.Source, 'process', return_value={})
     def test_detect_domain_ok(self, mock_process):
         res = self.engine.detect(self.context, target_url="http://foo.bar",
                                  is_article=False)
 
-        self.assertEqual(res, 'foobar')
+        self.assertEqual(res, {})
+        mock_process.assert_called_once_with()
+
+    def test_detect_no_store(self):
+        self.config(template_store='', group='news_detector')
+        self.assertIsNone(engine.Engine().store)
+
+    @mock.patch.object(article.Source, 'process')
+    def test_detect_domain_saves_templates(self, mock_process):
+        parsed = fake_article(is_parsed=True)
+        mock_process.return_value = {'foo.bar/news': [parsed],
+                                     'foo.bar/empty': []}
+
+        res = self.engine.detect(self.context, target_url="http://foo.bar",
+                                 is_article=False)
+
+        self.assertEqual(mock_process.return_value, res)
+        record = self.engine.store.get('foo.bar/news')
+        self.assertEqual('//h1', record.title)
+        self.assertIsNone(self.engine.store.get('foo.bar/empty'))
+
+    @mock.patch.object(article.Article, 'process')
+    @mock.patch.object(article.Article, 'download', autospec=True,
+                       side_effect=downloaded)
+    @mock.patch.object(article.Article, 'from_format', autospec=True)
+    @mock.patch.object(article.Source, 'process')
+    def test_detect_domain_known(self, mock_source, mock_format,
+                                 mock_download, mock_process):
+        record = self.engine.store.save('foo.bar/news', fake_article())
+        news = [article.Article('http://foo.bar/news/%d.html' % i,
+                                config=self.engine.config)
+                for i in range(2)]
+        mock_source.return_value = {'foo.bar/news': news}
+
+        def from_format(target, template):
+            target.title = 'fake_title'
+            target.text = 'fake_text'
+            target.is_parsed = True
+
+        mock_format.side_effect = from_format
+        res = self.engine.detect(self.context, target_url="http://foo.bar",
+                                 is_article=False)
+
+        mock_source.assert_called_once_with(process_article=False)
+        self.assertEqual({'foo.bar/news': news}, res)
+        self.assertEqual('fake_title', news[0].title)
+        mock_format.assert_called_once_with(news[0], record.template)
+        self.assertFalse(mock_process.called)
+        self.assertEqual(1, record.successes)
+
+    @mock.patch.object(article.Source, 'process', return_value={})
+    def test_detect_domain_known_untrusted(self, mock_process):
+        self.engine.store.save('foo.bar/news', fake_article())
+        for _ in range(store.MIN_ATTEMPTS):
+            self.engine.store.record_failure('foo.bar/news')
+
+        self.engine.detect(self.context, target_url="http://foo.bar",
+                           is_article=False)
+
+        mock_process.assert_called_once_with()
+
+    @mock.patch.object(article.Article, 'process')
+    @mock.patch.object(article.Article, 'download', autospec=True,
+                       side_effect=downloaded)
+    @mock.patch.object(article.Article, 'from_format', autospec=True)
+    def test_detect_article_known(self, mock_format, mock_download,
+                                  mock_process):
+        record = self.engine.store.save('foo.bar/news', fake_article())
+
+        def from_format(target, template):
+            target.title = 'fake_title'
+            target.text = 'fake_text'
+            target.is_parsed = True
+
+        mock_format.side_effect = from_format
+        res = self.engine.detect(self.context,
+                                 target_url="http://foo.bar/news/1.html",
+                                 is_article=True)
+
+        self.assertEqual('fake_title', res.title)
+        self.assertFalse(mock_process.called)
+        mock_download.assert_called_once_with(res)
+        mock_format.assert_called_once_with(res, record.template)
+        self.assertEqual(1, record.successes)
+
+    @mock.patch.object(article.Article, 'parse', autospec=True)
+    @mock.patch.object(article.Article, 'download', autospec=True,
+                       side_effect=downloaded)
+    @mock.patch.object(article.Article, 'from_format',
+                       side_effect=article.ArticleException)
+    def test_detect_article_known_redetect(self, mock_format, mock_download,
+                                           mock_parse):
+        self.engine.store.save('foo.bar/news', fake_article())
+
+        def parse(target):
+            target.title = '//h2'
+            target.is_parsed = True
+
+        mock_parse.side_effect = parse
+        res = self.engine.detect(self.context,
+                                 target_url="http://foo.bar/news/1.html",
+                                 is_article=True)
+
+        self.assertTrue(res.is_parsed)
+        record = self.engine.store.get('foo.bar/news')
+        self.assertEqual(2, record.version)
+        self.assertEqual('//h2', record.title)
+
+    @mock.patch.object(article.Article, 'parse')
+    @mock.patch.object(article.Article, 'download')
+    @mock.patch.object(article.Article, 'from_format')
+    def test_detect_article_known_download_failed(self, mock_format,
+                                                  mock_download, mock_parse):
+        record = self.engine.store.save('foo.bar/news', fake_article())
+
+        res = self.engine.detect(self.context,
+                                 target_url="http://foo.bar/news/1.html",
+                                 is_article=True)
+
+        self.assertIsNone(res)
+        self.assertFalse(mock_format.called)
+        self.assertFalse(mock_parse.called)
+        self.assertEqual(0, record.failures)
+
+    @mock.patch.object(article.Article, 'process')
+    def test_detect_article_known_untrusted(self, mock_process):
+        self.engine.store.save('foo.bar', fake_article())
+        for _ in range(store.MIN_ATTEMPTS):
+            self.engine.store.record_failure('foo.bar')
+
+        self.engine.detect(self.context, target_url="http://foo.bar/1.html",
+                           is_article=True)
+
         mock_process.assert_called_once_with()
+
+    @mock.patch.object(article.Article, 'process', autospec=True)
+    def test_detect_article_saves_template(self, mock_process):
+        def process(target):
+            target.title = '//h1'
+            target.is_parsed = True
+
+        mock_process.side_effect = process
+        self.engine.detect(self.context,
+                           target_url="http://foo.bar/news/1.html",
+                           is_article=True)
+
+        self.assertEqual('//h1', self.engine.store.get('foo.bar/news').title)
+
+    def test_detect_many(self):
+        def detect(context, url, is_article=False):
+            # the first domain is the slowest one
+            eventlet.sleep(0.01 if 'slow' in url else 0)
+            if url.endswith('bad'):
+                raise ValueError(url)
+            return url.upper()
+
+        urls = ['http://slow.bar/1', 'http://foo.bar/1', 'http://slow.bar/2',
+                'http://foo.bar/2', 'http://foo.bar/bad']
+        with mock.patch.object(self.engine, 'detect',
+                               side_effect=detect) as mock_detect:
+            res = list(self.engine.detect_many(self.context, urls))
+
+        self.assertEqual([('http://foo.bar/1', 'HTTP://FOO.BAR/1'),
+                          ('http://foo.bar/2', 'HTTP://FOO.BAR/2'),
+                          ('http://foo.bar/bad', None),
+                          ('http://slow.bar/1', 'HTTP://SLOW.BAR/1'),
+                          ('http://slow.bar/2', 'HTTP://SLOW.BAR/2')], res)
+        self.assertEqual(5, mock_detect.call_count)
+        mock_detect.assert_any_call(self.context, 'http://slow.bar/2',
+                                    is_article=True)
+
+    @mock.patch.object(article.Article, 'process', autospec=True,
+                       side_effect=parsed)
+    def test_detect_many_skips_seen(self, mock_process):
+        self.engine.config.seen_index.add('http://foo.bar/old')
+        urls = ['http://foo.bar/1', 'https://foo.bar/1/', 'http://foo.bar/old']
+
+        res = dict(self.engine.detect_many(self.context, urls))
+
+        self.assertIsNotNone(res['http://foo.bar/1'])
+        self.assertIsNone(res['https://foo.bar/1/'])
+        self.assertIsNone(res['http://foo.bar/old'])
+        self.assertEqual(1, mock_process.call_count)
+
+    @mock.patch.object(article.Article, 'process')
+    def test_detect_many_skips_failing_domain(self, mock_process):
+        for _ in range(engine.CONF.news_detector.circuit_min_requests):
+            self.engine.config.health.failure('dead.bar')
+        urls = ['http://foo.bar/1', 'http://dead.bar/1', 'http://dead.bar/2']
+
+        res = dict(self.engine.detect_many(self.context, urls))
+
+        self.assertIsNotNone(res['http://foo.bar/1'])
+        self.assertIsNone(res['http://dead.bar/1'])
+        self.assertIsNone(res['http://dead.bar/2'])
+        self.assertEqual(1, mock_process.call_count)
+        # tried again once the domain recovers
+        self.assertNotIn('http://dead.bar/1', self.engine.config.seen_index)
+
+    def test_domain_health(self):
+        tracker = self.engine.config.health
+        self.assertIs(tracker, self.engine.config.fetcher.health)
+        self.assertEqual(engine.CONF.news_detector.fetch_timeout,
+                         tracker.max_timeout)
+        self.config(domain_health=False, group='news_detector')
+        self.assertIsNone(engine.Engine().config.health)
+
+    @mock.patch.object(article.Article, 'process')
+    def test_detect_many_retries_failed(self, mock_process):
+        urls = ['http://foo.bar/1', 'https://foo.bar/1/']
+        mock_process.side_effect = [article.ArticleException, None]
+
+        res = dict(self.engine.detect_many(self.context, urls))
+
+        # not parsed, so neither marked seen
+        self.assertIsNone(res['http://foo.bar/1'])
+        self.assertFalse(res['https://foo.bar/1/'].is_parsed)
+        self.assertEqual(2, mock_process.call_count)
+        self.assertNotIn('http://foo.bar/1', self.engine.config.seen_index)
+
+    def test_detect_no_seen_index(self):
+        self.config(seen_index='', group='news_detector')
+        self.assertIsNone(engine.Engine().config.seen_index)
+
+    def test_seen_index_default_off(self):
+        # the test configuration turns it on
+        engine.CONF.clear_default('seen_index', group='news_detector')
+        self.assertIsNone(engine.Engine().config.seen_index)
+
+    def test_replay_corpus(self):
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        with open(os.path.join(tempdir, replay.DIRECTORY_INDEX), 'w'):
+            pass
+        self.config(replay_corpus=tempdir, group='news_detector')
+        with mock.patch.object(engine, 'TemplateStore') as mock_store, \
+                mock.patch.object(engine, 'SeenIndex') as mock_seen:
+            fetcher = engine.Engine().config.fetcher
+        self.assertIsInstance(fetcher, replay.ReplayFetcher)
+        self.assertEqual(tempdir, fetcher.corpus.path)
+        mock_store.assert_called_once_with(':memory:')
+        mock_seen.assert_called_once_with(
+            ':memory:', engine.CONF.news_detector.seen_index_size)
+
+    def test_metrics_sink(self):
+        self.assertIsNone(self.engine.config.metrics_sink)
+        self.config(metrics_sink='memory', group='news_detector')
+        sink = engine.Engine().config.metrics_sink
+        self.assertIsInstance(sink, metrics.HistogramSink)
+        self.config(metrics_sink='statsd', statsd_port=8126,
+                    group='news_detector')
+        sink = engine.Engine().config.metrics_sink
+        self.addCleanup(sink.close)
+        self.assertEqual(('127.0.0.1', 8126), sink.address)
+
+    @mock.patch.object(mq, 'get_notifier')
+    @mock.patch.object(mq, 'NOTIFIER', mock.sentinel.notifier)
+    def test_metrics_sink_notifier(self, mock_get_notifier):
+        self.config(metrics_sink='notifier', group='news_detector')
+        sink = engine.Engine().config.metrics_sink
+        self.assertIs(mock_get_notifier.return_value, sink.notifier)
+        mock_get_notifier.assert_called_once_with(service='news_detector')
+
+    def test_detect_many_workers(self):
+        self.config(detect_workers=2, group='news_detector')
+        running = []
+        peak = []
+
+        def detect(context, url, is_article=False):
+            running.append(url)
+            peak.append(len(running))
+            eventlet.sleep(0.001)
+            running.remove(url)
+
+        urls = ['http://%d.bar/%d' % (i % 4, i) for i in range(12)]
+        with mock.patch.object(self.engine, 'detect', side_effect=detect):
+            res = list(self.engine.detect_many(self.context, urls,
+                                               is_article=False))
+
+        self.assertEqual(sorted(urls), sorted(url for url, _ in res))
+        self.assertEqual(2, max(peak))
+
+    def test_detect_many_single_domain(self):
+        self.config(detect_workers=3, group='news_detector')
+        running = []
+        peak = []
+
+        def detect(context, url, is_article=False):
+            running.append(url)
+            peak.append(len(running))
+            eventlet.sleep(0.001)
+            running.remove(url)
+
+        urls = ['http://foo.bar/%d' % i for i in range(6)]
+        with mock.patch.object(self.engine, 'detect', side_effect=detect):
+            res = list(self.engine.detect_many(self.context, urls,
+                                               is_article=False))
+
+        self.assertEqual(6, len(res))
+        self.assertEqual(3, max(peak))
+
+    def test_detect_many_seen_index_error(self):
+        urls = ['http://foo.bar/1', 'http://foo.bar/2']
+        with mock.patch.object(self.engine.config.seen_index, 'add',
+                               side_effect=sqlite3.OperationalError):
+            res = dict(self.engine.detect_many(self.context, urls))
+
+        self.assertEqual({'http://foo.bar/1': None,
+                          'http://foo.bar/2': None}, res)
+
+    def test_close(self):
+        self.config(parse_workers=1, metrics_sink='statsd',
+                    group='news_detector')
+        target = engine.Engine()
+        parts = [target.config.parse_pool, target.config.fetcher,
+                 target.store, target.config.seen_index,
+                 target.config.metrics_sink]
+        closes = [self.useFixture(fixtures.MockPatchObject(
+            part, 'close', wraps=part.close)).mock for part in parts]
+
+        target.close()
+
+        for close in closes:
+            close.assert_called_once_with()
+
+    def test_detect_many_empty(self):
+        self.assertEqual([], list(self.engine.detect_many(self.context, [])))
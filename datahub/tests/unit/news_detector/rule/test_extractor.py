@@ -13,6 +13,7 @@
 # under the License.
 
 from collections import defaultdict
+from lxml import etree
 import mock
 from mock import sentinel
 from newspaper.extractors import ContentExtractor
@@ -22,6 +23,7 @@ from datahub.news_detector.rule import config
 from datahub.news_detector.rule import extractor
 from datahub.news_detector.rule.parser import ObjectParser
 from datahub.news_detector.rule.parser import Parser
+from datahub.news_detector.rule import scoring
 
 from datahub.tests import base
 
@@ -384,117 +386,138 @@ class RuleExtractorTestCase(base.TestCase):
         res = self.extractor._get_urls(None, 'fake_title')
         self.assertEqual([], res)
 
-    @mock.patch.object(Parser, 'getElementsByTag')
-    def test_get_urls_titles(self, mock_get):
-        self.fake_meta_data.ele = mock.MagicMock()
-        self.fake_meta_data.ele.get.return_value = 'http://www.example.com'
-        self.fake_meta_data.ele.text = 'fake_text'
-        mock_get.return_value = [self.fake_meta_data]
-        res = self.extractor._get_urls(self.doc, 'fake_title')
-        self.assertEqual([('http://www.example.com', 'fake_text')], res)
-        mock_get.assert_called_once_with(self.doc, tag='a')
-        self.fake_meta_data.ele.get.assert_has_calls([
-            mock.call('href'), mock.call('href'), mock.call('href')
-        ])
-
-    @mock.patch.object(Parser, 'getElementsByTag')
-    def test_get_urls_no_titles(self, mock_get):
-        self.fake_meta_data.ele = mock.MagicMock()
-        self.fake_meta_data.ele.get.return_value = 'http://www.example.com'
-        self.fake_meta_data.ele.text = 'fake_text'
-        mock_get.return_value = [self.fake_meta_data]
-        res = self.extractor._get_urls(self.doc, None)
-        self.assertEqual([('http://www.example.com')], res)
-        mock_get.assert_called_once_with(self.doc, tag='a')
-        self.fake_meta_data.ele.get.assert_has_calls([
-            mock.call('href'), mock.call('href'), mock.call('href')
-        ])
-
-    @mock.patch.object(ContentExtractor, 'get_score')
-    @mock.patch.object(ContentExtractor, 'update_node_count')
-    @mock.patch.object(ContentExtractor, 'update_score')
-    @mock.patch.object(Parser, 'getParent')
-    @mock.patch.object(ContentExtractor, 'is_boostable')
-    @mock.patch.object(StopWords, 'get_stopword_count')
-    @mock.patch.object(ContentExtractor, 'is_highlink_density')
-    @mock.patch.object(Parser, 'getText')
-    @mock.patch.object(ContentExtractor, 'nodes_to_check')
-    def test_calculate_best_node(self, mock_check, mock_get_text,
-                                 mock_highlink, mock_get_sw, mock_boost,
-                                 mock_get_parent, mock_update_score,
-                                 mock_update_count, mock_get_score):
-        mock_ws = mock.MagicMock()
-        mock_check.return_value = [self.fake_meta_data]
-        mock_get_text.return_value = 'fake_text'
-        mock_highlink.return_value = False
-        mock_boost.return_value = True
-        mock_get_parent.side_effect = [self.fake_author, self.fake_meta_lang]
-        mock_get_score.return_value = 1
-
-        mock_get_sw.return_value = mock_ws
-        mock_ws.get_stopword_count.return_value = 3
-
-        res = self.extractor.calculate_best_node(self.doc)
+    def _links_doc(self):
+        return Parser.fromstring(
+            '<html><body><a href="http://www.example.com">fake_text</a>'
+            '<a href="/a#top">top</a><a>no href</a>'
+            '<a href="http://www.example.com">again</a>'
+            '<a href="/b"><b>b</b></a></body></html>')
+
+    def test_get_urls_titles(self):
+        res = self.extractor._get_urls(self._links_doc(), 'fake_title')
+        self.assertEqual([('http://www.example.com', 'fake_text'),
+                          ('/b', None)], res)
+
+    def test_get_urls_no_titles(self):
+        res = self.extractor._get_urls(self._links_doc(), None)
+        self.assertEqual(['http://www.example.com', '/b'], res)
+
+    def test_iter_urls_lazy(self):
+        urls = self.extractor.iter_urls(self._links_doc())
+        self.assertEqual('http://www.example.com', next(urls))
+        self.assertEqual('/b', next(urls))
+        self.assertRaises(StopIteration, next, urls)
+
+    def _best_node_doc(self):
+        return Parser.fromstring(
+            '<html><body><div id="a"><p>t1</p></div>'
+            '<div id="b"><p>t2</p><p>t3</p></div></body></html>')
+
+    @mock.patch.object(extractor.Extractor, '_is_boostable',
+                       return_value=False)
+    @mock.patch.object(scoring.LinkDensity, 'is_high',
+                       return_value=False)
+    @mock.patch.object(extractor.Extractor, 'get_stopword_count')
+    def test_calculate_best_node(self, mock_get_sw, mock_highlink,
+                                 mock_boost):
+        mock_get_sw.side_effect = lambda text, counts: \
+            {'t1': 10, 't2': 5, 't3': 6}[text]
+
+        res = self.extractor.calculate_best_node(self._best_node_doc())
+
+        # div#b: 5 + 6 beats div#a: 10 and body: (10 + 5 + 6) / 2
+        self.assertEqual('/html/body/div[2]//text()', res.xpath)
+        self.assertEqual('b', res.ele.get('id'))
+        self.assertEqual(3, mock_highlink.call_count)
+        # scores are not written on the tree
+        self.assertIsNone(res.ele.get('gravityScore'))
+
+    @mock.patch.object(extractor.Extractor, '_is_boostable',
+                       return_value=False)
+    @mock.patch.object(scoring.LinkDensity, 'is_high',
+                       return_value=False)
+    @mock.patch.object(extractor.Extractor, 'get_stopword_count',
+                       return_value=0)
+    def test_calculate_best_node_no_score(self, mock_get_sw, mock_highlink,
+                                          mock_boost):
+        res = self.extractor.calculate_best_node(self._best_node_doc())
+        self.assertIsNone(res)
+
+    @mock.patch.object(scoring.LinkDensity, 'is_high',
+                       return_value=False)
+    @mock.patch.object(extractor.Extractor, 'get_stopword_count',
+                       return_value=3)
+    def test_calculate_best_node_first_parent(self, mock_get_sw,
+                                              mock_highlink):
+        # every parent gets a negative score, the first one is kept
+        with mock.patch.object(extractor.Extractor, '_upscores',
+                               return_value=[-1, -1, -1]):
+            res = self.extractor.calculate_best_node(self._best_node_doc())
+        self.assertEqual('a', res.ele.get('id'))
+
+    def test_upscores(self):
+        nodes = [(mock.Mock(), 3)] * 16
+        with mock.patch.object(self.extractor, '_is_boostable',
+                               return_value=False):
+            res = self.extractor._upscores(nodes, {})
+        # the last quarter of the nodes is lowered
+        self.assertEqual([3] * 12 + [3, 2, -1, -6], res)
+
+    def test_upscores_boost(self):
+        nodes = [(mock.Mock(), 3)] * 3
+        with mock.patch.object(self.extractor, '_is_boostable',
+                               side_effect=[True, False, True]):
+            res = self.extractor._upscores(nodes, {})
+        self.assertEqual([53, 3, 28], res)
+
+    def test_parent_scores(self):
+        doc = self._best_node_doc()
+        nodes = [(ObjectParser(p, tree=doc.getroottree()), 0)
+                 for p in doc.iter('p')]
+        with mock.patch.object(Parser, 'getParent',
+                               wraps=Parser.getParent) as mock_parent:
+            scores = self.extractor._parent_scores(nodes, [10, 5, 6])
+
+        body = doc.find('body')
+        div_a, div_b = body.findall('div')
+        self.assertEqual([div_a, body, div_b], list(scores))
+        self.assertEqual([10, 1], scores[div_a][1:])
+        self.assertEqual([10.5, 3], scores[body][1:])
+        self.assertEqual([11, 2], scores[div_b][1:])
+        self.assertEqual('/html/body/div[2]', scores[div_b][0].xpath)
+        # one wrapper per unique element
+        self.assertEqual(3, mock_parent.call_count)
+
+    def test_parent_scores_root(self):
+        doc = etree.fromstring('<div><p>t1</p></div>')
+        nodes = [(ObjectParser(doc.find('p'), tree=doc.getroottree()), 0)]
+        scores = self.extractor._parent_scores(nodes, [4])
+        self.assertEqual([doc], list(scores))
+        self.assertEqual([4, 1], scores[doc][1:])
+
+    def test_get_stopwords_cached(self):
+        stopwords = self.extractor.get_stopwords()
+        self.assertIs(stopwords, self.extractor.get_stopwords())
+        self.extractor.update_language('en')
+        self.assertIsNot(stopwords, self.extractor.get_stopwords())
 
-        self.assertEqual(self.fake_author, res)
-        mock_check.assert_called_once_with(self.doc)
-        mock_get_text.assert_has_calls([mock.call(self.ele),
-                                        mock.call(self.ele)])
-        mock_highlink.assert_called_once_with(self.ele)
-        mock_get_sw.assert_has_calls([mock.call('fake_text'),
-                                      mock.call('fake_text')], any_order=True)
-        mock_boost.assert_called_once_with(self.ele)
-        mock_get_parent.assert_has_calls([mock.call(self.fake_meta_data),
-                                          mock.call(self.fake_author)])
-        mock_update_score.assert_has_calls([
-            mock.call(self.fake_author, 53),
-            mock.call(self.fake_meta_lang, 26.5)])
-        mock_update_count.assert_has_calls([mock.call(self.fake_author, 1),
-                                            mock.call(self.fake_meta_lang, 1)])
-        mock_get_score.assert_has_calls([mock.call(self.fake_author),
-                                         mock.call(self.fake_meta_lang)])
-
-    @mock.patch.object(ContentExtractor, 'get_score')
-    @mock.patch.object(ContentExtractor, 'update_node_count')
-    @mock.patch.object(ContentExtractor, 'update_score')
-    @mock.patch.object(Parser, 'getParent')
-    @mock.patch.object(ContentExtractor, 'is_boostable')
     @mock.patch.object(StopWords, 'get_stopword_count')
-    @mock.patch.object(ContentExtractor, 'is_highlink_density')
-    @mock.patch.object(Parser, 'getText')
-    @mock.patch.object(ContentExtractor, 'nodes_to_check')
-    def test_calculate_best_node_15(self, mock_check, mock_get_text,
-                                    mock_highlink, mock_get_sw, mock_boost,
-                                    mock_get_parent, mock_update_score,
-                                    mock_update_count, mock_get_score):
-        mock_ws = mock.MagicMock()
-        mock_check.return_value = [self.fake_meta_data] * 16
-        mock_get_text.return_value = 'fake_text'
-        mock_highlink.return_value = False
-        mock_boost.return_value = True
-        mock_get_parent.return_value = self.fake_author
-        mock_get_score.return_value = 1
-
-        mock_get_sw.return_value = mock_ws
-        mock_ws.get_stopword_count.return_value = 3
-
-        res = self.extractor.calculate_best_node(self.doc)
-
-        self.assertEqual(self.fake_author, res)
-        mock_check.assert_called_once_with(self.doc)
-        mock_get_text.assert_has_calls([mock.call(self.ele),
-                                        mock.call(self.ele)])
-        mock_highlink.assert_has_calls([mock.call(self.ele)] * 16)
-        mock_get_sw.assert_has_calls([mock.call('fake_text'),
-                                      mock.call('fake_text')], any_order=True)
-        mock_boost.assert_has_calls([mock.call(self.ele)] * 16)
-        mock_get_parent.assert_has_calls([mock.call(self.fake_meta_data),
-                                          mock.call(self.fake_author)])
-        mock_update_score.assert_has_calls([mock.call(self.fake_author, 53),
-                                            mock.call(self.fake_author, 26.5)])
-        mock_update_count.assert_has_calls([mock.call(self.fake_author, 1),
-                                            mock.call(self.fake_author, 1)])
-        mock_get_score.assert_called_once_with(self.fake_author)
+    def test_get_stopword_count_memo(self, mock_get_sw):
+        mock_get_sw.return_value.get_stopword_count.return_value = 4
+        counts = {}
+        self.assertEqual(4, self.extractor.get_stopword_count('foo', counts))
+        self.assertEqual(4, self.extractor.get_stopword_count('foo', counts))
+        self.assertEqual({'foo': 4}, counts)
+        mock_get_sw.assert_called_once_with('foo')
+
+    def test_is_boostable(self):
+        doc = Parser.fromstring(
+            '<div><p>the one of the and the of it is a</p><p>x</p>'
+            '<p>caption</p></div>')
+        self.extractor.update_language('en')
+        paragraphs = doc.findall('.//p')
+        self.assertTrue(self.extractor.is_boostable(paragraphs[2]))
+        self.assertFalse(self.extractor.is_boostable(paragraphs[0]))
 
     @mock.patch.object(ContentExtractor, 'nodes_to_check')
     def test_calculate_best_node_none(self, mock_check):
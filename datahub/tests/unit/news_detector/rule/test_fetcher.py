@@ -0,0 +1,233 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import eventlet
+import mock
+import requests
+
+from datahub.common import httpcache
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule import fetcher
+from datahub.news_detector.rule import health
+from datahub.tests import base
+
+
+def fake_response(url, text='', status=200):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.encoding = 'utf-8'
+    response._content = text.encode('utf-8')
+    return response
+
+
+class FetcherTest(base.TestCase):
+
+    def setUp(self):
+        super(FetcherTest, self).setUp()
+        self.conf = config.SourceConfig()
+        self.fetcher = fetcher.Fetcher(self.conf)
+
+    def test_init_defaults(self):
+        self.config(fetch_pool_size=5, fetch_per_host=2, fetch_timeout=3,
+                    group='news_detector')
+        ftc = fetcher.Fetcher(self.conf)
+        self.assertEqual(5, ftc.pool_size)
+        self.assertEqual(2, ftc.per_host)
+        self.assertEqual(3, ftc.timeout)
+        self.assertEqual('datahub/1.0', ftc.session.headers['User-Agent'])
+
+    def test_fetch(self):
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get:
+            mock_get.return_value = fake_response('http://foo.bar', 'ok')
+            self.assertEqual('ok', self.fetcher.fetch('http://foo.bar'))
+        mock_get.assert_called_once_with('http://foo.bar', headers=None,
+                                         timeout=self.fetcher.timeout,
+                                         allow_redirects=True)
+
+    def test_fetch_cached(self):
+        cache = httpcache.HttpCache(':memory:')
+        ftc = fetcher.Fetcher(self.conf, cache=cache)
+        self.addCleanup(ftc.close)
+        first = fake_response('http://foo.bar', 'ok')
+        first.headers['ETag'] = '"v1"'
+        not_modified = fake_response('http://foo.bar', status=304)
+        with mock.patch.object(ftc.session, 'get') as mock_get:
+            mock_get.side_effect = [first, not_modified]
+            self.assertEqual('ok', ftc.fetch('http://foo.bar', cached=True))
+            self.assertEqual('ok', ftc.fetch('http://foo.bar', cached=True))
+
+        self.assertEqual({'If-None-Match': '"v1"'},
+                         mock_get.call_args[1]['headers'])
+        self.assertEqual(b'ok', cache.get('http://foo.bar').body)
+
+    def test_fetch_no_validators_not_cached(self):
+        cache = httpcache.HttpCache(':memory:')
+        ftc = fetcher.Fetcher(self.conf, cache=cache)
+        self.addCleanup(ftc.close)
+        with mock.patch.object(ftc.session, 'get') as mock_get:
+            mock_get.return_value = fake_response('http://foo.bar', 'ok')
+            self.assertEqual('ok', ftc.fetch('http://foo.bar', cached=True))
+        self.assertIsNone(cache.get('http://foo.bar'))
+
+    def test_fetch_no_validators_drops_entry(self):
+        cache = httpcache.HttpCache(':memory:')
+        ftc = fetcher.Fetcher(self.conf, cache=cache)
+        self.addCleanup(ftc.close)
+        cache.put('http://foo.bar', 200, {'ETag': ['"v1"']}, b'old')
+        with mock.patch.object(ftc.session, 'get') as mock_get:
+            mock_get.return_value = fake_response('http://foo.bar', 'new')
+            self.assertEqual('new', ftc.fetch('http://foo.bar', cached=True))
+        self.assertEqual({'If-None-Match': '"v1"'},
+                         mock_get.call_args[1]['headers'])
+        self.assertIsNone(cache.get('http://foo.bar'))
+
+    def test_fetch_not_cached(self):
+        cache = httpcache.HttpCache(':memory:')
+        ftc = fetcher.Fetcher(self.conf, cache=cache)
+        self.addCleanup(ftc.close)
+        cache.put('http://foo.bar', 200, {'ETag': ['"v1"']}, b'old')
+        response = fake_response('http://foo.bar', 'new')
+        response.headers['ETag'] = '"v2"'
+        with mock.patch.object(ftc.session, 'get') as mock_get:
+            mock_get.return_value = response
+            self.assertEqual('new', ftc.fetch('http://foo.bar'))
+        self.assertIsNone(mock_get.call_args[1]['headers'])
+        self.assertEqual(b'old', cache.get('http://foo.bar').body)
+
+    def test_fetch_raw(self):
+        response = fake_response('http://foo.bar')
+        response._content = 'B\xe1o'.encode('latin-1')
+        response.headers['Content-Type'] = 'text/html; charset=ISO-8859-1'
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get:
+            mock_get.return_value = response
+            self.assertEqual((b'B\xe1o', 'ISO-8859-1'),
+                             self.fetcher.fetch_raw('http://foo.bar'))
+            self.assertEqual('B\xe1o', self.fetcher.fetch('http://foo.bar'))
+
+    def test_fetch_raw_no_charset(self):
+        response = fake_response('http://foo.bar', '<p>B\xe1o</p>')
+        response.headers['Content-Type'] = 'text/html'
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get:
+            mock_get.return_value = response
+            self.assertEqual(('<p>B\xe1o</p>'.encode('utf-8'), None),
+                             self.fetcher.fetch_raw('http://foo.bar'))
+            self.assertEqual('<p>B\xe1o</p>',
+                             self.fetcher.fetch('http://foo.bar'))
+
+    def test_fetch_raw_error(self):
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get:
+            mock_get.side_effect = requests.exceptions.Timeout
+            self.assertEqual((b'', None),
+                             self.fetcher.fetch_raw('http://foo.bar'))
+
+    def test_fetch_error(self):
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get:
+            mock_get.side_effect = requests.exceptions.Timeout
+            self.assertEqual('', self.fetcher.fetch('http://foo.bar'))
+
+    def test_fetch_http_error(self):
+        self.conf.http_success_only = True
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get:
+            mock_get.return_value = fake_response('http://foo.bar', 'no',
+                                                  status=404)
+            self.assertEqual('', self.fetcher.fetch('http://foo.bar'))
+
+    def test_fetch_health(self):
+        tracker = health.HealthTracker(7.0, min_timeout=1.0)
+        ftc = fetcher.Fetcher(self.conf, health=tracker)
+        tracker.success('foo.bar', 0.5)
+        with mock.patch.object(ftc.session, 'get') as mock_get:
+            mock_get.side_effect = [
+                fake_response('http://foo.bar/1', 'ok'),
+                fake_response('http://foo.bar/2', 'no', status=404),
+                fake_response('http://foo.bar/3', 'no', status=503),
+                requests.exceptions.ConnectionError]
+            self.assertEqual('ok', ftc.fetch('http://Foo.bar/1'))
+            self.assertEqual('', ftc.fetch('http://foo.bar/2'))
+            self.assertEqual('', ftc.fetch('http://foo.bar/3'))
+            self.assertEqual('', ftc.fetch('http://foo.bar/4'))
+
+        self.assertAlmostEqual(1.5, mock_get.call_args_list[0][1]['timeout'])
+        domain = tracker.get('foo.bar')
+        self.assertEqual(5, domain.requests)
+        # the 404 is not a failure of the domain
+        self.assertAlmostEqual(1 - 0.8 ** 2, domain.error_rate)
+
+    def test_fetch_health_open(self):
+        tracker = health.HealthTracker(7.0, min_requests=1, error_rate=0.1)
+        ftc = fetcher.Fetcher(self.conf, health=tracker)
+        tracker.failure('foo.bar')
+        with mock.patch.object(ftc.session, 'get') as mock_get:
+            self.assertEqual('', ftc.fetch('http://foo.bar/1'))
+            self.assertIsNone(ftc.fetch_head('http://foo.bar/1'))
+        mock_get.assert_not_called()
+
+    def test_fetch_head(self):
+        response = fake_response('http://foo.bar')
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        chunks = [b'<html><head><title>t</title>', b'</head><body>',
+                  b'<p>text</p>', b'</body></html>']
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get, \
+                mock.patch.object(response, 'iter_content') as mock_iter, \
+                mock.patch.object(response, 'close') as mock_close:
+            mock_get.return_value = response
+            mock_iter.return_value = iter(chunks)
+            doc = self.fetcher.fetch_head('http://foo.bar')
+
+        self.assertEqual('t', doc.findtext('head/title'))
+        mock_get.assert_called_once_with('http://foo.bar', stream=True,
+                                         timeout=self.fetcher.timeout,
+                                         allow_redirects=True)
+        mock_iter.assert_called_once_with(fetcher.HEAD_CHUNK_SIZE)
+        # the body is left unread
+        self.assertEqual([b'<p>text</p>', b'</body></html>'],
+                         list(mock_iter.return_value))
+        mock_close.assert_called_once_with()
+
+    def test_fetch_head_error(self):
+        with mock.patch.object(self.fetcher.session, 'get') as mock_get:
+            mock_get.side_effect = requests.exceptions.Timeout
+            self.assertIsNone(self.fetcher.fetch_head('http://foo.bar'))
+
+    def test_fetch_many_keeps_order(self):
+        def get(url, **kwargs):
+            # finish the first urls last
+            eventlet.sleep(0.01 if url.endswith('0') else 0)
+            return fake_response(url, url)
+
+        urls = ['http://foo.bar/%d' % i for i in range(5)]
+        with mock.patch.object(self.fetcher.session, 'get', side_effect=get):
+            self.assertEqual(urls, self.fetcher.fetch_many(urls))
+
+    def test_fetch_many_limits(self):
+        ftc = fetcher.Fetcher(self.conf, pool_size=4, per_host=2)
+        running = {}
+        peaks = {}
+
+        def get(url, **kwargs):
+            host = url.split('/')[2]
+            running[host] = running.get(host, 0) + 1
+            peaks[host] = max(peaks.get(host, 0), running[host])
+            peaks['all'] = max(peaks.get('all', 0), sum(running.values()))
+            eventlet.sleep(0.001)
+            running[host] -= 1
+            return fake_response(url, 'ok')
+
+        urls = ['http://%s/%d' % (host, i)
+                for host in ('a.bar', 'b.bar', 'c.bar') for i in range(4)]
+        with mock.patch.object(ftc.session, 'get', side_effect=get):
+            self.assertEqual(['ok'] * 12, ftc.fetch_many(urls))
+        self.assertEqual(2, peaks['a.bar'])
+        self.assertEqual(4, peaks['all'])
@@ -0,0 +1,92 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import mock
+
+from datahub.news_detector.rule import fingerprint
+from datahub.tests import base
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+class FingerprintTest(base.BaseTestCase):
+
+    def test_digest(self):
+        html = '<html><body><p>t</p></body></html>'
+        self.assertEqual(fingerprint.digest(html),
+                         fingerprint.digest('\r\n  ' + html + '\n'))
+        self.assertNotEqual(fingerprint.digest(html),
+                            fingerprint.digest(html.replace('t', 'u')))
+
+    def test_simhash_near_duplicate(self):
+        html = load_fixture('article_1.html')
+        changed = html.replace('</body>', '<div>12:05 Quảng cáo</div></body>')
+        near = fingerprint.distance(fingerprint.simhash(html),
+                                    fingerprint.simhash(changed))
+        other = fingerprint.distance(
+            fingerprint.simhash(html),
+            fingerprint.simhash(load_fixture('article_en.html')))
+        self.assertLessEqual(near, 3)
+        self.assertGreater(other, 10)
+
+    def test_simhash_without_numpy(self):
+        html = load_fixture('article_1.html')
+        expected = fingerprint.simhash(html)
+        with mock.patch.object(fingerprint, 'numpy', None):
+            self.assertEqual(expected, fingerprint.simhash(html))
+        self.assertEqual(0, fingerprint.simhash('<p></p>'))
+
+    def test_distance(self):
+        self.assertEqual(0, fingerprint.distance(5, 5))
+        self.assertEqual(2, fingerprint.distance(0b101, 0b110))
+
+
+class FingerprintCacheTest(base.BaseTestCase):
+
+    def test_get(self):
+        cache = fingerprint.FingerprintCache(10)
+        cache.put('http://foo.bar', '<p>a</p>', 'result')
+        self.assertEqual('result', cache.get('http://foo.bar', '<p>a</p>'))
+        self.assertIsNone(cache.get('http://foo.bar', '<p>b</p>'))
+        self.assertIsNone(cache.get('http://bar.foo', '<p>a</p>'))
+
+    def test_lru(self):
+        cache = fingerprint.FingerprintCache(2)
+        for url in ('a', 'b'):
+            cache.put(url, url, url)
+        cache.get('a', 'a')
+        cache.put('c', 'c', 'c')
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get('b', 'b'))
+        self.assertEqual('a', cache.get('a', 'a'))
+
+    def test_simhash_distance(self):
+        html = load_fixture('article_1.html')
+        changed = html.replace('</body>', '<div>12:05 Quảng cáo</div></body>')
+        exact = fingerprint.FingerprintCache(10)
+        near = fingerprint.FingerprintCache(10, max_distance=3)
+        for cache in (exact, near):
+            cache.put('http://foo.bar', html, 'result')
+
+        self.assertIsNone(exact.get('http://foo.bar', changed))
+        self.assertEqual('result', near.get('http://foo.bar', changed))
+        self.assertIsNone(near.get('http://foo.bar',
+                                   load_fixture('article_en.html')))
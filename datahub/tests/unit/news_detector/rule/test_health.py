@@ -0,0 +1,112 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import fixtures
+import mock
+
+from datahub.news_detector.rule import health
+from datahub.tests import base
+
+
+class HealthTrackerTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(HealthTrackerTest, self).setUp()
+        self.now = 1000.0
+        self.useFixture(fixtures.MockPatch(
+            'time.monotonic', side_effect=lambda: self.now))
+        self.tracker = health.HealthTracker(7.0, min_timeout=1.0,
+                                            error_rate=0.5, min_requests=3,
+                                            cooldown=60)
+
+    def _fail(self, domain, times):
+        for _ in range(times):
+            self.tracker.failure(domain)
+
+    def test_domain_of(self):
+        self.assertEqual('foo.bar:8080',
+                         health.domain_of('https://Foo.Bar:8080/a?b=c'))
+
+    def test_timeout_unknown(self):
+        self.assertEqual(7.0, self.tracker.timeout('foo.bar'))
+        self.tracker.failure('foo.bar')
+        self.assertEqual(7.0, self.tracker.timeout('foo.bar'))
+
+    def test_timeout_adapts(self):
+        self.tracker.success('foo.bar', 0.8)
+        # first sample: latency + 4 * latency / 2
+        self.assertAlmostEqual(2.4, self.tracker.timeout('foo.bar'))
+        for _ in range(50):
+            self.tracker.success('foo.bar', 0.1)
+        self.assertEqual(1.0, self.tracker.timeout('foo.bar'))
+        self.tracker.success('slow.bar', 3.0)
+        self.assertEqual(7.0, self.tracker.timeout('slow.bar'))
+
+    def test_error_rate(self):
+        self.tracker.success('foo.bar', 0.1)
+        self.tracker.failure('foo.bar')
+        domain = self.tracker.get('foo.bar')
+        self.assertEqual(2, domain.requests)
+        self.assertAlmostEqual(0.2, domain.error_rate)
+        self.assertIsNone(self.tracker.get('other.bar'))
+
+    def test_min_requests(self):
+        self._fail('foo.bar', 2)
+        self.assertFalse(self.tracker.is_open('foo.bar'))
+        self.assertTrue(self.tracker.allow('foo.bar'))
+
+    def test_opens(self):
+        # error rate 0.2, 0.36, 0.488 then 0.59
+        self._fail('foo.bar', 3)
+        self.assertFalse(self.tracker.is_open('foo.bar'))
+        self.tracker.failure('foo.bar')
+        self.assertTrue(self.tracker.is_open('foo.bar'))
+        self.assertFalse(self.tracker.allow('foo.bar'))
+        self.assertTrue(self.tracker.allow('other.bar'))
+
+    def test_healthy_domain_stays_closed(self):
+        for _ in range(20):
+            self.tracker.success('foo.bar', 0.1)
+            self.tracker.success('foo.bar', 0.1)
+            self.tracker.failure('foo.bar')
+        self.assertFalse(self.tracker.is_open('foo.bar'))
+
+    def test_probe_success_closes(self):
+        self._fail('foo.bar', 4)
+        self.now += 61
+        self.assertFalse(self.tracker.is_open('foo.bar'))
+        self.assertTrue(self.tracker.allow('foo.bar'))
+        # a single probe at once
+        self.assertFalse(self.tracker.allow('foo.bar'))
+        self.assertTrue(self.tracker.is_open('foo.bar'))
+
+        self.tracker.success('foo.bar', 0.5)
+        self.assertFalse(self.tracker.is_open('foo.bar'))
+        self.assertTrue(self.tracker.allow('foo.bar'))
+        self.assertEqual(0.0, self.tracker.get('foo.bar').error_rate)
+
+    def test_probe_failure_reopens(self):
+        self._fail('foo.bar', 4)
+        self.now += 61
+        self.assertTrue(self.tracker.allow('foo.bar'))
+        self.now += 10
+        self.tracker.failure('foo.bar')
+        self.now += 55
+        self.assertFalse(self.tracker.allow('foo.bar'))
+        self.now += 10
+        self.assertTrue(self.tracker.allow('foo.bar'))
+
+    @mock.patch.object(health.LOG, 'warning')
+    def test_open_logged(self, mock_warning):
+        self._fail('foo.bar', 10)
+        mock_warning.assert_called_once_with(
+            'Skip foo.bar for 60 seconds, 59% of its requests failed')
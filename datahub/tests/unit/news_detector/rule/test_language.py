@@ -0,0 +1,88 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule.language import sniff_language
+from datahub.news_detector.rule.parser import Parser
+from datahub.tests import base
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class SniffLanguageTest(base.TestCase):
+
+    def assertSniffed(self, expected, html, size=8192):
+        self.assertEqual(expected, sniff_language(html, size))
+
+    def test_html_lang(self):
+        self.assertSniffed('vi', '<html lang="VI"><body>x</body></html>')
+        self.assertSniffed('en-us', "<html class=a lang='en-US'></html>")
+        self.assertSniffed('en', '<HTML lang=en><body></body></HTML>')
+
+    def test_meta(self):
+        self.assertSniffed('vi', '<html><head><meta http-equiv='
+                                 '"Content-Language" content="vi"></head>'
+                                 '</html>')
+        self.assertSniffed('en', '<html lang=""><head><meta name="language" '
+                                 'content="en"/></head></html>')
+
+    def test_meta_order(self):
+        self.assertSniffed('en', '<html><meta name="lang" content="vi">'
+                                 '<meta http-equiv="content-language" '
+                                 'content="en"></html>')
+
+    def test_nothing_declared(self):
+        self.assertSniffed('', '<html><head></head><body>x</body></html>')
+        self.assertSniffed('', '<html xml:lang="en"><body>x</body></html>')
+
+    def test_comments_ignored(self):
+        self.assertSniffed('', '<!-- <html lang="en"> --><html><body>x'
+                               '</body></html>')
+        self.assertSniffed('', '<html><body><!-- <meta name="lang" '
+                               'content="en">')
+
+    def test_scripts_ignored(self):
+        self.assertSniffed('vi', '<html><script>s = "<meta name=\'lang\' '
+                                 'content=\'en\'>";</script><meta '
+                                 'name="lang" content="vi"></html>')
+        self.assertSniffed('', '<SCRIPT type="text/javascript">'
+                               'document.write("<html lang=\'en\'>")'
+                               '</Script ><html><body>x</body></html>')
+        self.assertSniffed('', '<html><body><script><meta name="lang" '
+                               'content="en">')
+
+    def test_script_fixture(self):
+        with open(os.path.join(FIXTURES, 'article_script_lang.html')) as f:
+            self.assertSniffed('vi', f.read())
+
+    def test_inconclusive(self):
+        padding = '<p>%s</p>' % ('x' * 100)
+        # the html tag or a meta may follow the sniffed window
+        self.assertSniffed(None, padding + '<html lang="vi"></html>', 50)
+        self.assertSniffed(None, '<html><head>' + padding +
+                                 '<meta name="lang" content="vi">', 50)
+        self.assertSniffed(None, '<html><meta http-equiv="content-language">'
+                                 '</html>')
+
+    def test_same_as_meta_lang(self):
+        extractor = Extractor(config.SourceConfig())
+        for name in sorted(os.listdir(FIXTURES)):
+            with open(os.path.join(FIXTURES, name)) as f:
+                html = f.read()
+            self.assertEqual(
+                extractor.get_meta_lang(Parser.fromstring(html))[0],
+                sniff_language(html, 8192))
@@ -0,0 +1,149 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from concurrent import futures
+import os
+import pickle
+import subprocess
+import sys
+import threading
+
+import eventlet
+import mock
+
+import datahub
+from datahub.news_detector.rule import article
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule import parse_pool
+from datahub.tests import base
+from datahub.tests.unit.news_detector.rule.test_article import load_fixture
+
+URL = 'http://baotainguyenmoitruong.vn/kinh-te/201703/bai-viet-1.html'
+
+# Parses from concurrent green threads of a monkey patched process, as in
+# the services of datahub.cmd
+MONKEY_PATCHED_PARSE = '''
+import eventlet
+eventlet.monkey_patch()
+import sys
+
+from datahub.news_detector.rule import article
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule import parse_pool
+
+conf = config.SourceConfig()
+pool = parse_pool.ParsePool(2)
+with open(sys.argv[1]) as f:
+    html = f.read()
+
+
+def parse(i):
+    art = article.Article(sys.argv[2] % i, config=conf)
+    art.download(html=html)
+    pool.parse(art)
+    return art.is_parsed
+
+
+print(sum(eventlet.GreenPool(4).imap(parse, range(8))))
+pool.close()
+'''
+
+
+class ParseResultTest(base.BaseTestCase):
+
+    def test_pickle(self):
+        result = parse_pool.ParseResult(title='//h1', tags={'//a'},
+                                        is_parsed=True)
+        loaded = pickle.loads(pickle.dumps(result))
+        self.assertEqual('//h1', loaded.title)
+        self.assertEqual({'//a'}, loaded.tags)
+        self.assertIsNone(loaded.text)
+        self.assertTrue(loaded.is_parsed)
+
+    def test_update(self):
+        art = mock.Mock()
+        parse_pool.ParseResult(title='//h1', text='//p').update(art)
+        self.assertEqual('//h1', art.title)
+        self.assertEqual('//p', art.text)
+
+
+class ParsePoolTest(base.TestCase):
+
+    def setUp(self):
+        super(ParsePoolTest, self).setUp()
+        self.conf = config.SourceConfig()
+        self.extractor = Extractor(self.conf)
+
+    def _article(self):
+        art = article.Article(URL, config=self.conf,
+                              extractor=self.extractor)
+        art.download(html=load_fixture('article_1.html'))
+        return art
+
+    def test_parse(self):
+        pool = parse_pool.ParsePool(1)
+        self.addCleanup(pool.close)
+        expected = self._article()
+        expected.parse()
+        target = self._article()
+
+        pool.parse(target)
+
+        self.assertTrue(target.is_parsed)
+        self.assertIsNone(target.top_node)
+        for field in parse_pool.ParseResult.FIELDS:
+            if field == 'link_hash':
+                # the hash is salted with the parse time
+                continue
+            self.assertEqual(getattr(expected, field),
+                             getattr(target, field))
+
+    def test_parse_not_downloaded(self):
+        pool = parse_pool.ParsePool(1)
+        self.addCleanup(pool.close)
+        target = article.Article(URL, config=self.conf)
+        self.assertRaises(article.ArticleException, pool.parse, target)
+
+    def test_parse_monkey_patched(self):
+        fixture = os.path.join(os.path.dirname(__file__), 'fixtures',
+                               'article_1.html')
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(os.path.abspath(datahub.__file__))))
+        output = subprocess.check_output(
+            [sys.executable, '-c', MONKEY_PATCHED_PARSE, fixture,
+             URL.replace('-1.html', '-%d.html')],
+            env=env, stderr=subprocess.DEVNULL, timeout=120)
+        self.assertEqual(b'8', output.strip())
+
+    @mock.patch.object(parse_pool.patcher, 'is_monkey_patched',
+                       return_value=True)
+    def test_wait_native_thread(self, mock_patched):
+        future = futures.Future()
+        waiter = eventlet.spawn(parse_pool.ParsePool._wait, future)
+        eventlet.sleep(0)
+        # the executor completes its futures from its own thread
+        thread = threading.Thread(target=future.set_result, args=(42,))
+        thread.start()
+        thread.join()
+        self.assertEqual(42, waiter.wait())
+
+    @mock.patch.object(article.Article, 'parse')
+    @mock.patch.object(article.Article, 'download')
+    def test_article_process_in_pool(self, mock_download, mock_parse):
+        self.conf.parse_pool = mock.Mock()
+        target = self._article()
+        target.process()
+        self.conf.parse_pool.parse.assert_called_once_with(target)
+        self.assertFalse(mock_parse.called)
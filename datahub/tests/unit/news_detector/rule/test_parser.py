@@ -12,14 +12,36 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import gc
+import os
+import subprocess
+import sys
+import threading
+
 from lxml import etree
 from lxml import html
 import mock
 
+import datahub
 from datahub.news_detector.rule import parser
 from datahub.news_detector.rule.parser import Parser
 from datahub.tests import base
 
+GREEN_HTML_PARSERS = '''
+import eventlet
+eventlet.monkey_patch()
+
+from datahub.news_detector.rule import parser
+
+
+def get_parser(i):
+    eventlet.sleep(0)
+    return id(parser.html_parser('utf-8'))
+
+
+print(len(set(eventlet.GreenPool(4).imap(get_parser, range(8)))))
+'''
+
 
 class ObjectParserTest(base.BaseTestCase):
 
@@ -39,6 +61,38 @@ class ObjectParserTest(base.BaseTestCase):
         obj_text = parser.ObjectParser(None, 'xpath3', None)
         self.assertEqual('', obj_text.text)
 
+    @mock.patch.object(Parser, 'getText', return_value='lazy')
+    def test_lazy_text(self, mock_get_text):
+        obj = parser.ObjectParser(self.root, 'xpath1')
+        mock_get_text.assert_not_called()
+        self.assertEqual('lazy', obj.text)
+        self.assertEqual('lazy', obj.text)
+        mock_get_text.assert_called_once_with(self.root)
+
+    def test_lazy_xpath(self):
+        tree = mock.MagicMock()
+        tree.getpath.return_value = '/html/child'
+        child = self.root.find('child')
+        obj = parser.ObjectParser(child, tree=tree)
+        tree.getpath.assert_not_called()
+        self.assertEqual('/html/child', obj.xpath)
+        self.assertEqual('/html/child', obj.xpath)
+        tree.getpath.assert_called_once_with(child)
+
+    def test_override(self):
+        tree = etree.ElementTree(self.root)
+        obj = parser.ObjectParser(self.root.find('child'), tree=tree)
+        obj.xpath += '/@content'
+        obj.text += 'foo'
+        self.assertEqual('/html/child/@content', obj.xpath)
+        self.assertEqual('testfoo', obj.text)
+        obj.text = 'bar'
+        self.assertEqual('bar', obj.text)
+
+    def test_slots(self):
+        obj = parser.ObjectParser(self.root, 'xpath1', 'foobar')
+        self.assertFalse(hasattr(obj, '__dict__'))
+
     def test_clear(self):
         obj_text = parser.ObjectParser(self.root, 'xpath3', 'foobar')
         obj_text.clear()
@@ -60,29 +114,112 @@ class ParserTest(base.BaseTestCase):
                                     "<html name='froot'><sib>sib</sib><child "
                                     "name='fake'>test</child>foo</html>")
 
-    def test_xpath_re_str(self):
+    @mock.patch.object(parser, 'compile_xpath')
+    def test_xpath_re_str(self, mock_compile):
         node = mock.MagicMock()
-        node.xpath.return_value = ['fake_str']
+        mock_compile.return_value.return_value = ['fake_str']
         res = Parser.xpath_re(node, 'fake_exp')
         self.assertEqual(1, len(res))
         self.assertIsNone(res[0].ele)
         self.assertEqual('fake_str', res[0].text)
         self.assertEqual('fake_exp', res[0].xpath)
-        node.xpath.assert_called_once_with(
-            'fake_exp',
-            namespaces={'re': "http://exslt.org/regular-expressions"})
+        mock_compile.assert_called_once_with('fake_exp')
+        mock_compile.return_value.assert_called_once_with(node)
 
-    def test_xpath_re_node(self):
+    @mock.patch.object(parser, 'compile_xpath')
+    def test_xpath_re_node(self, mock_compile):
         node = mock.MagicMock()
-        node.xpath.return_value = [self.doc]
+        mock_compile.return_value.return_value = [self.doc]
         res = Parser.xpath_re(node, 'fake_exp')
         self.assertEqual(1, len(res))
 
         self.assertEqual(self.doc, res[0].ele)
         self.assertEqual('fake_exp', res[0].xpath)
-        node.xpath.assert_called_once_with(
-            'fake_exp',
-            namespaces={'re': "http://exslt.org/regular-expressions"})
+        mock_compile.assert_called_once_with('fake_exp')
+
+    def test_xpath_re_regexp(self):
+        res = Parser.xpath_re(self.doc,
+                              '//*[re:test(@name, "^FAKE$", "i")]/@name')
+        self.assertEqual(['fake'], [r.text for r in res])
+
+    def test_compile_xpath_cached(self):
+        compiled = parser.compile_xpath('//child')
+        self.assertIsInstance(compiled, etree.XPath)
+        self.assertIs(compiled, parser.compile_xpath('//child'))
+
+    def test_tag_xpath(self):
+        self.assertEqual('descendant-or-self::*', parser.tag_xpath().path)
+        self.assertEqual(
+            'descendant-or-self::child[re:test(@name, "fa", "i")]',
+            parser.tag_xpath('child', 'name', 'fa').path)
+        self.assertIs(parser.tag_xpath('child', 'name', 'fa'),
+                      parser.tag_xpath('child', 'name', 'fa'))
+
+    def test_html_parser_per_thread(self):
+        own = parser.html_parser('utf-8')
+        self.assertIs(own, parser.html_parser('utf-8'))
+        self.assertIsNot(own, parser.html_parser('latin-1'))
+        self.assertIsNone(parser.html_parser('unknown-charset'))
+        other = []
+        thread = threading.Thread(
+            target=lambda: other.append(parser.html_parser('utf-8')))
+        thread.start()
+        thread.join()
+        self.assertIsNot(own, other[0])
+
+    def test_html_parser_green_threads(self):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(os.path.abspath(datahub.__file__))))
+        output = subprocess.check_output(
+            [sys.executable, '-c', GREEN_HTML_PARSERS], env=env,
+            stderr=subprocess.DEVNULL, timeout=120)
+        self.assertEqual(b'1', output.strip())
+
+    def test_fromstring_bytes(self):
+        data = '<html><body><p>B\xe1o</p></body></html>'
+        for encoding in ('utf-8', 'latin-1', 'cp1258'):
+            doc = Parser.fromstring(data.encode(encoding), encoding)
+            self.assertEqual('B\xe1o', doc.findtext('body/p'))
+
+    def test_fromstring_bytes_unknown_encoding(self):
+        doc = Parser.fromstring(b'<html><body><p>Bao</p></body></html>',
+                                'unknown-charset')
+        self.assertEqual('Bao', doc.findtext('body/p'))
+
+    def test_fromstring_bytes_empty(self):
+        self.assertIsNone(Parser.fromstring(b'', 'utf-8'))
+
+    def test_decode(self):
+        self.assertEqual(('B\xe1o', 'latin-1'),
+                         Parser.decode(b'B\xe1o', 'latin-1'))
+        self.assertEqual(('', None), Parser.decode(b''))
+        data = '<meta charset="utf-8"><p>B\xe1o</p>'
+        self.assertEqual((data, 'utf-8'),
+                         Parser.decode(data.encode('utf-8'), 'unknown'))
+
+    def test_head_fromchunks_stops_after_head(self):
+        consumed = []
+
+        def chunks():
+            for chunk in ('<html><head><title>t</title>', '</head>',
+                          '<body><p>text</p>', '</body></html>'):
+                consumed.append(chunk)
+                yield chunk
+
+        doc = Parser.head_fromchunks(chunks())
+        self.assertEqual(2, len(consumed))
+        self.assertEqual('t', doc.findtext('head/title'))
+        self.assertFalse(doc.xpath('//p'))
+
+    def test_head_fromchunks_bytes(self):
+        chunks = ['<html><head><title>B\xe1o</title></head>'.encode(
+            'latin-1')]
+        doc = Parser.head_fromchunks(chunks, encoding='latin-1')
+        self.assertEqual('B\xe1o', doc.findtext('head/title'))
+
+    def test_head_fromchunks_empty(self):
+        self.assertIsNone(Parser.head_fromchunks([]))
+        self.assertIsNone(Parser.head_fromchunks(['']))
 
     def test_drop_tag_list(self):
         node1, node2 = mock.MagicMock(), mock.MagicMock()
@@ -124,6 +261,64 @@ class ParserTest(base.BaseTestCase):
         res = Parser.getElementsByTag(root, tag='root')
         self.assertEqual([], res)
 
+    def test_get_ele_by_tag_indexed(self):
+        doc = html.fromstring('<html><head><meta name="Author" content="a">'
+                              '<meta property="og:author" content="b">'
+                              '<link rel="icon" href="c"></head><body>'
+                              '<div class="byline">d</div><p>e</p></body>'
+                              '</html>')
+        queries = [{'attr': 'name', 'value': 'author'},
+                   {'attr': 'property', 'value': 'author'},
+                   {'attr': 'class', 'value': 'byline'},
+                   {'tag': 'link', 'attr': 'rel', 'value': 'icon'},
+                   {'tag': 'meta', 'attr': 'name', 'value': 'lang'},
+                   {'tag': 'p'},
+                   {'tag': 'html'},
+                   {}]
+        expected = [[(r.ele, r.xpath) for r in
+                     Parser.getElementsByTag(doc, **query)]
+                    for query in queries]
+
+        index = Parser.index(doc)
+        self.addCleanup(Parser.drop_index, doc)
+        self.assertIs(index, Parser.get_index(doc))
+        with mock.patch.object(doc, 'xpath') as mock_xpath:
+            results = [[(r.ele, r.xpath) for r in
+                        Parser.getElementsByTag(doc, **query)]
+                       for query in queries]
+            mock_xpath.assert_not_called()
+        self.assertEqual(expected, results)
+
+    def test_drop_index(self):
+        doc = html.fromstring('<html><body><p>e</p></body></html>')
+        Parser.index(doc)
+        Parser.drop_index(doc)
+        self.assertIsNone(Parser.get_index(doc))
+
+    def test_index_dropped_with_doc(self):
+        doc = html.fromstring('<html><body><p>e</p></body></html>')
+        Parser.index(doc)
+        count = len(parser._INDEXES)
+        del doc
+        gc.collect()
+        self.assertEqual(count - 1, len(parser._INDEXES))
+
+    def test_index_regex_case(self):
+        doc = html.fromstring('<html><body><p class="2">e</p>'
+                              '<p class="b">f</p></body></html>')
+        Parser.index(doc)
+        self.addCleanup(Parser.drop_index, doc)
+        for value, expected in ((r'^\D+$', ['b']), (r'^\d+$', ['2'])):
+            found = Parser.getElementsByTag(doc, tag='p', attr='class',
+                                            value=value)
+            self.assertEqual(expected, [r.ele.get('class') for r in found])
+
+    def test_get_index_not_indexed(self):
+        doc = html.fromstring('<html><body><p>e</p></body></html>')
+        Parser.index(doc)
+        self.addCleanup(Parser.drop_index, doc)
+        self.assertIsNone(Parser.get_index(self.doc))
+
     def test_child_node_with_text_enable(self):
         res = Parser.childNodesWithText(self.ele_text)
         self.assertEqual(1, len(res))
@@ -173,6 +368,13 @@ class ParserTest(base.BaseTestCase):
         self.assertEqual('sib', res.tag)
         self.assertEqual('sib', res.text)
 
+    def test_previous_siblings(self):
+        doc = etree.fromstring('<html><a/><b/><c/></html>')
+        res = Parser.previousSiblings(doc.find('c'))
+        self.assertEqual('b', next(res).tag)
+        self.assertEqual(['a'], [n.tag for n in res])
+        self.assertEqual([], list(Parser.previousSiblings(doc.find('a'))))
+
     def test_get_parent_no_obj_parser(self):
         node = self.doc.find('child')
         res = Parser.getParent(node)
@@ -0,0 +1,212 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import gzip
+import os
+
+import fixtures
+import mock
+import requests
+
+from datahub.news_detector.rule import article
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule import replay
+from datahub.tests import base
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+ARTICLE_URL = 'http://baotainguyenmoitruong.vn/kinh-te/201703/bai-viet-1.html'
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+def http_response(body, status=200, headers=None):
+    lines = ['HTTP/1.1 %d OK' % status]
+    for name, value in (headers or {}).items():
+        lines.append('%s: %s' % (name, value))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+def warc_record(url, block, record_type='response'):
+    head = ('WARC/1.0\r\nWARC-Type: %s\r\nWARC-Target-URI: %s\r\n'
+            'Content-Length: %d\r\n\r\n' % (record_type, url, len(block)))
+    return head.encode('latin-1') + block + b'\r\n\r\n'
+
+
+class ParseHttpResponseTest(base.BaseTestCase):
+
+    def test_parse(self):
+        page = replay.parse_http_response(http_response(
+            b'<html></html>',
+            headers={'Content-Type': 'text/html; charset=windows-1258'}))
+        self.assertEqual(200, page.status)
+        self.assertEqual(b'<html></html>', page.body)
+        self.assertEqual('windows-1258', page.charset)
+
+    def test_parse_encoded(self):
+        body = gzip.compress(b'<html></html>')
+        chunked = b'%x\r\n%s\r\n0\r\n\r\n' % (len(body), body)
+        page = replay.parse_http_response(http_response(
+            chunked, headers={'Transfer-Encoding': 'chunked',
+                              'Content-Encoding': 'gzip'}))
+        self.assertEqual(b'<html></html>', page.body)
+        self.assertIsNone(page.charset)
+
+    def test_parse_not_http(self):
+        self.assertIsNone(replay.parse_http_response(b'<html></html>'))
+        self.assertIsNone(replay.parse_http_response(
+            b'HTTP/1.1 OK\r\n\r\n'))
+
+
+class WarcCorpusTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(WarcCorpusTest, self).setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+
+    def _corpus(self, records, gzipped=False):
+        path = os.path.join(self.tempdir, 'corpus.warc')
+        with open(path, 'wb') as f:
+            for record in records:
+                f.write(gzip.compress(record) if gzipped else record)
+        corpus = replay.WarcCorpus(path)
+        self.addCleanup(corpus.close)
+        return corpus
+
+    def _records(self):
+        return [
+            warc_record('http://foo.bar/a', b'GET /a HTTP/1.1\r\n\r\n',
+                        record_type='request'),
+            warc_record('http://foo.bar/a', http_response(b'first')),
+            warc_record('<https://foo.bar/b/>', http_response(b'b')),
+            warc_record('http://foo.bar/a', http_response(b'last')),
+        ]
+
+    def test_get(self):
+        corpus = self._corpus(self._records())
+        self.assertFalse(corpus.gzipped)
+        self.assertEqual(2, len(corpus))
+        self.assertEqual(b'last', corpus.get('http://foo.bar/a').body)
+        self.assertEqual(b'b', corpus.get('http://foo.bar/b').body)
+        self.assertIn('https://foo.bar/a?utm_source=x', corpus)
+        self.assertIsNone(corpus.get('http://foo.bar/c'))
+
+    def test_get_gzipped(self):
+        corpus = self._corpus(self._records(), gzipped=True)
+        self.assertTrue(corpus.gzipped)
+        self.assertEqual(2, len(corpus))
+        self.assertEqual(b'last', corpus.get('http://foo.bar/a').body)
+        self.assertEqual(b'b', corpus.get('http://foo.bar/b').body)
+
+    def test_empty(self):
+        corpus = self._corpus([])
+        self.assertEqual(0, len(corpus))
+        self.assertIsNone(corpus.get('http://foo.bar/a'))
+
+
+class DirectoryCorpusTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(DirectoryCorpusTest, self).setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        with open(os.path.join(self.tempdir, 'a.html.gz'), 'wb') as f:
+            f.write(gzip.compress(b'<p>a</p>'))
+        with open(os.path.join(self.tempdir, 'b.html'), 'wb') as f:
+            f.write(b'<p>b</p>')
+        with open(os.path.join(self.tempdir, replay.DIRECTORY_INDEX),
+                  'w') as f:
+            f.write('http://foo.bar/a\ta.html.gz\tutf-8\n'
+                    'http://foo.bar/b\tb.html\n'
+                    'http://foo.bar/c\tmissing.html\n')
+        self.corpus = replay.open_corpus(self.tempdir)
+
+    def test_get(self):
+        self.assertIsInstance(self.corpus, replay.DirectoryCorpus)
+        self.assertEqual(3, len(self.corpus))
+        page = self.corpus.get('http://foo.bar/a')
+        self.assertEqual(b'<p>a</p>', page.body)
+        self.assertEqual('utf-8', page.charset)
+        page = self.corpus.get('http://foo.bar/b')
+        self.assertEqual(b'<p>b</p>', page.body)
+        self.assertIsNone(page.charset)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.corpus.get('http://foo.bar/c'))
+        self.assertIsNone(self.corpus.get('http://foo.bar/d'))
+
+
+class ReplayFetcherTest(base.TestCase):
+
+    def setUp(self):
+        super(ReplayFetcherTest, self).setUp()
+        self.conf = config.SourceConfig()
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        path = os.path.join(tempdir, 'corpus.warc')
+        html = load_fixture('article_1.html')
+        with open(path, 'wb') as f:
+            f.write(warc_record(ARTICLE_URL, http_response(
+                html, headers={'Content-Type':
+                               'text/html; charset=utf-8'})))
+            f.write(warc_record('http://foo.bar/moved', http_response(
+                b'', status=301, headers={'Location': ARTICLE_URL})))
+            f.write(warc_record(
+                'http://baotainguyenmoitruong.vn/kinh-te/old',
+                http_response(b'', status=302, headers={
+                    'Location': '201703/bai-viet-1.html'})))
+            f.write(warc_record('http://foo.bar/gone', http_response(
+                b'gone', status=404)))
+        self.fetcher = replay.ReplayFetcher(self.conf,
+                                            replay.open_corpus(path))
+        self.addCleanup(self.fetcher.close)
+        self.html = html
+
+    def test_fetch_raw(self):
+        self.assertEqual((self.html, 'utf-8'),
+                         self.fetcher.fetch_raw(ARTICLE_URL))
+        self.assertEqual((self.html, 'utf-8'),
+                         self.fetcher.fetch_raw('http://foo.bar/moved'))
+        self.assertEqual((b'', None),
+                         self.fetcher.fetch_raw('http://foo.bar/missing'))
+
+    def test_fetch_relative_redirect(self):
+        self.assertEqual((self.html, 'utf-8'), self.fetcher.fetch_raw(
+            'http://baotainguyenmoitruong.vn/kinh-te/old'))
+
+    def test_fetch_http_success_only(self):
+        self.conf.http_success_only = True
+        self.assertEqual('', self.fetcher.fetch('http://foo.bar/gone'))
+        self.conf.http_success_only = False
+        self.assertEqual('gone', self.fetcher.fetch('http://foo.bar/gone'))
+
+    def test_fetch_many(self):
+        self.assertEqual([self.html.decode('utf-8'), ''],
+                         self.fetcher.fetch_many([ARTICLE_URL,
+                                                  'http://foo.bar/missing']))
+
+    def test_fetch_head(self):
+        doc = self.fetcher.fetch_head(ARTICLE_URL)
+        self.assertTrue(doc.xpath('/html/head/title'))
+        self.assertIsNone(self.fetcher.fetch_head('http://foo.bar/missing'))
+
+    @mock.patch.object(requests.Session, 'send')
+    def test_article_offline(self, mock_send):
+        self.conf.fetcher = self.fetcher
+        target = article.Article(ARTICLE_URL, config=self.conf,
+                                 extractor=Extractor(self.conf))
+        target.download()
+        target.parse()
+        self.assertTrue(target.is_parsed)
+        self.assertEqual('/html/head/link[1]/@href', target.canonical_link)
+        mock_send.assert_not_called()
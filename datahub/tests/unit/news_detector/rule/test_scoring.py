@@ -0,0 +1,149 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import random
+
+import lxml.html
+import mock
+from newspaper.extractors import ContentExtractor
+import testtools
+
+from datahub.news_detector.rule import config
+from datahub.news_detector.rule.extractor import Extractor
+from datahub.news_detector.rule.parser import Parser
+from datahub.news_detector.rule import scoring
+from datahub.tests import base
+from datahub.tests.unit.news_detector.rule.test_article import load_fixture
+
+
+def random_features(nodes_number, seed=42):
+    rand = random.Random(seed)
+    stopword_counts = [rand.randint(3, 60) for _ in range(nodes_number)]
+    boostable = [rand.random() < 0.3 for _ in range(nodes_number)]
+    parents = [rand.randint(-1, nodes_number // 4)
+               for _ in range(nodes_number)]
+    grandparents = [rand.randint(-1, nodes_number // 4)
+                    for _ in range(nodes_number)]
+    return stopword_counts, boostable, parents, grandparents
+
+
+class ScorerTest(base.BaseTestCase):
+
+    scorer = scoring.PYTHON
+
+    def test_upscores(self):
+        res = self.scorer.upscores([3] * 16, [False] * 16)
+        self.assertEqual([3] * 12 + [3, 2, -1, -6], list(res))
+
+    def test_upscores_boost(self):
+        res = self.scorer.upscores([3, 3, 3, 3], [True, False, True, True])
+        self.assertEqual([53, 3, 28, 19], list(res))
+
+    def test_upscores_large_tail(self):
+        res = self.scorer.upscores([3] * 40, [False] * 40)
+        # penalties above 40 turn into a small bonus
+        self.assertEqual([3] * 30 + [3, 2, -1, -6, -13, -22, -33, 8, 8, 8],
+                         list(res))
+
+    def test_upscores_empty(self):
+        self.assertEqual([], list(self.scorer.upscores([], [])))
+
+    def test_accumulate(self):
+        scores, counts = self.scorer.accumulate([0, 1, 1, -1], [2, 2, -1, -1],
+                                                [10, 5, 6, 7], 3)
+        self.assertEqual([10, 11, 7.5], scores)
+        self.assertEqual([1, 2, 2], counts)
+
+
+@testtools.skipIf(scoring.numpy is None, 'NumPy is not installed')
+class NumpyScorerTest(ScorerTest):
+
+    scorer = scoring.NUMPY
+
+    def test_same_as_python(self):
+        for nodes_number in (10, 16, 1000, 5000):
+            stopword_counts, boostable, parents, grandparents = \
+                random_features(nodes_number)
+            upscores = scoring.PYTHON.upscores(stopword_counts, boostable)
+            self.assertEqual(upscores,
+                             self.scorer.upscores(stopword_counts,
+                                                  boostable).tolist())
+            size = nodes_number // 4 + 1
+            self.assertEqual(
+                scoring.PYTHON.accumulate(parents, grandparents, upscores,
+                                          size),
+                self.scorer.accumulate(parents, grandparents, upscores,
+                                       size))
+
+
+class GetScorerTest(base.TestCase):
+
+    def test_python(self):
+        self.config(scorer='python', group='news_detector')
+        self.assertIs(scoring.PYTHON, scoring.get_scorer(10000))
+
+    @testtools.skipIf(scoring.numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        self.config(scorer='numpy', group='news_detector')
+        self.assertIs(scoring.NUMPY, scoring.get_scorer(1))
+
+    @testtools.skipIf(scoring.numpy is None, 'NumPy is not installed')
+    def test_auto(self):
+        self.assertIs(scoring.PYTHON, scoring.get_scorer(10))
+        self.assertIs(scoring.NUMPY,
+                      scoring.get_scorer(scoring.NUMPY_MIN_NODES))
+
+    @mock.patch.object(scoring, 'NUMPY', None)
+    def test_no_numpy(self):
+        self.config(scorer='numpy', group='news_detector')
+        self.assertIs(scoring.PYTHON, scoring.get_scorer(10000))
+
+
+class LinkDensityTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(LinkDensityTest, self).setUp()
+        self.extractor = Extractor(config.SourceConfig())
+
+    def _legacy(self, ele):
+        return ContentExtractor.is_highlink_density(self.extractor, ele)
+
+    def test_is_high(self):
+        doc = Parser.fromstring(
+            '<div><p id="a">some words here <a>one</a> more words</p>'
+            '<p id="b"><a>link one</a><a>link two</a> x</p>'
+            '<p id="c"><a>only</a></p><p id="d">no links</p>'
+            '<p id="e"><a> </a>; !</p></div>')
+        density = scoring.LinkDensity(doc)
+        res = dict((p.get('id'), density.is_high(p))
+                   for p in doc.iter('p'))
+        self.assertEqual({'a': False, 'b': True, 'c': True, 'd': False,
+                          'e': True}, res)
+
+    def test_same_as_legacy(self):
+        for name in ('article_1.html', 'article_large.html',
+                     'category.html'):
+            doc = Parser.fromstring(load_fixture(name))
+            density = scoring.LinkDensity(doc)
+            for ele in doc.iter('p', 'td', 'li', 'ul', 'div'):
+                self.assertEqual(self._legacy(ele), density.is_high(ele),
+                                 lxml.html.tostring(ele)[:200])
+
+    def test_merged_link_words(self):
+        # "ab" + "cd ef" are joined as "abcd ef": 2 link words, not 3
+        doc = Parser.fromstring(
+            '<div><p><a>ab</a><a>cd ef</a><!-- x --> w1 w2 w3</p></div>')
+        p = doc.find('.//p')
+        self.assertEqual(self._legacy(p), scoring.LinkDensity(p).is_high(p))
+        self.assertFalse(scoring.LinkDensity(p).is_high(p))
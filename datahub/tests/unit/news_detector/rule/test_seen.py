@@ -0,0 +1,93 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+import mock
+
+from datahub.news_detector.rule import seen
+from datahub.tests import base
+
+
+class CanonicalizeTest(base.BaseTestCase):
+
+    def test_canonicalize(self):
+        self.assertEqual('http://foo.bar/news/1.html?id=2',
+                         seen.canonicalize('HTTPS://Foo.BAR:443/news/1.html'
+                                           '?utm_source=fb&id=2&fbclid=x'
+                                           '#comments'))
+
+    def test_canonicalize_trailing_slash(self):
+        self.assertEqual('http://foo.bar/news',
+                         seen.canonicalize('http://foo.bar/news/'))
+        for url in ('http://foo.bar', 'http://foo.bar/'):
+            self.assertEqual('http://foo.bar/', seen.canonicalize(url))
+
+    def test_canonicalize_keeps_port_and_query(self):
+        self.assertEqual('http://foo.bar:8080/?b=1&a=',
+                         seen.canonicalize('http://foo.bar:8080/?b=1&a='))
+
+
+class SeenIndexTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(SeenIndexTest, self).setUp()
+        self.index = seen.SeenIndex(':memory:', 100)
+        self.addCleanup(self.index.close)
+
+    def test_add(self):
+        self.assertNotIn('http://foo.bar/1', self.index)
+        self.assertTrue(self.index.add('http://foo.bar/1'))
+        self.assertFalse(self.index.add('https://foo.bar/1/?utm_medium=x'))
+        self.assertIn('http://FOO.bar/1#top', self.index)
+        self.assertEqual(1, len(self.index))
+
+    def test_discard(self):
+        self.index.add('http://foo.bar/1')
+        self.index.add('http://foo.bar/2')
+        self.index.discard('https://foo.bar/1/')
+        self.index.discard('http://foo.bar/3')
+        self.assertNotIn('http://foo.bar/1', self.index)
+        self.assertIn('http://foo.bar/2', self.index)
+        self.assertEqual(1, len(self.index))
+        self.assertTrue(self.index.add('http://foo.bar/1'))
+
+    def test_bounded(self):
+        index = seen.SeenIndex(':memory:', 10)
+        self.addCleanup(index.close)
+        with mock.patch('time.time', side_effect=range(1000)):
+            for i in range(10):
+                index.add('http://foo.bar/%d' % i)
+            # seeing it again makes it the most recent one
+            index.add('http://foo.bar/0')
+            index.add('http://foo.bar/10')
+
+        self.assertEqual(9, len(index))
+        self.assertIn('http://foo.bar/0', index)
+        self.assertIn('http://foo.bar/10', index)
+        self.assertNotIn('http://foo.bar/1', index)
+        self.assertNotIn('http://foo.bar/2', index)
+
+    def test_persistent(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'db', 'seen.sqlite')
+        first = seen.SeenIndex(path, 100)
+        first.add('http://foo.bar/1')
+        first.close()
+
+        second = seen.SeenIndex(path, 100)
+        self.addCleanup(second.close)
+        self.assertIn('http://foo.bar/1', second)
+        self.assertEqual(1, len(second))
@@ -0,0 +1,155 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+import mock
+
+from datahub.news_detector.rule import store
+from datahub.news_detector.rule.template import CompiledTemplate
+from datahub.tests import base
+
+
+def fake_article(title='/html/head/title'):
+    return mock.Mock(title=title, text='//p//text()',
+                     authors=['//div[@class="byline"]'],
+                     publish_date='//meta/@content',
+                     canonical_link='//link[@rel="canonical"]/@href')
+
+
+class TemplateKeysTest(base.BaseTestCase):
+
+    def test_template_keys(self):
+        self.assertEqual(['foo.bar/news', 'foo.bar/news/', 'foo.bar'],
+                         store.template_keys('http://foo.bar/news/1.html'))
+
+    def test_template_keys_no_path(self):
+        self.assertEqual(['foo.bar'], store.template_keys('http://foo.bar'))
+        self.assertEqual(['foo.bar'],
+                         store.template_keys('http://foo.bar/'))
+
+    def test_template_key(self):
+        self.assertEqual('foo.bar/news',
+                         store.template_key('http://foo.bar/news/1.html'))
+        self.assertEqual('foo.bar', store.template_key('http://foo.bar/1'))
+        self.assertEqual('foo.bar', store.template_key('http://foo.bar'))
+
+
+class TemplateStoreTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(TemplateStoreTest, self).setUp()
+        self.store = store.TemplateStore(':memory:')
+        self.addCleanup(self.store.close)
+
+    def test_save_and_get(self):
+        record = self.store.save('foo.bar/news', fake_article())
+
+        self.assertEqual('foo.bar/news', record.key)
+        self.assertEqual('foo.bar', record.site)
+        self.assertEqual('/html/head/title', record.title)
+        self.assertEqual('//div[@class="byline"]', record.authors)
+        self.assertEqual('//link[@rel="canonical"]/@href',
+                         record.canonical_link)
+        self.assertEqual(1, record.version)
+        self.assertIsNone(record.success_rate)
+        self.assertIs(record, self.store.get('foo.bar/news'))
+
+    def test_get_unknown(self):
+        self.assertIsNone(self.store.get('foo.bar'))
+
+    def test_save_again_bumps_version(self):
+        self.store.save('foo.bar/news', fake_article())
+        self.store.record_success('foo.bar/news')
+        record = self.store.save('foo.bar/news', fake_article('//h1'))
+
+        self.assertEqual(2, record.version)
+        self.assertEqual('//h1', record.title)
+        self.assertEqual(0, record.successes)
+
+    def test_template_compiled_once(self):
+        record = self.store.save('foo.bar', fake_article())
+
+        self.assertIsInstance(record.template, CompiledTemplate)
+        self.assertIs(record.template, self.store.get('foo.bar').template)
+
+    def test_lookup(self):
+        self.store.save('foo.bar', fake_article())
+        self.store.save('foo.bar/news', fake_article('//h1'))
+
+        self.assertEqual('foo.bar/news',
+                         self.store.lookup('http://foo.bar/news/1').key)
+        self.assertEqual('foo.bar',
+                         self.store.lookup('http://foo.bar/other/1').key)
+        self.assertIsNone(self.store.lookup('http://bar.foo/news/1'))
+
+    def test_get_site(self):
+        self.store.save('foo.bar/b', fake_article())
+        self.store.save('foo.bar/a', fake_article())
+        self.store.save('bar.foo/a', fake_article())
+
+        self.assertEqual(['foo.bar/a', 'foo.bar/b'],
+                         [r.key for r in self.store.get_site('foo.bar')])
+
+    def test_success_rate(self):
+        self.store.save('foo.bar', fake_article())
+        for _ in range(3):
+            self.store.record_success('foo.bar')
+        self.store.record_failure('foo.bar')
+
+        record = self.store.get('foo.bar')
+        self.assertEqual(0.75, record.success_rate)
+        self.assertTrue(record.is_trusted(0.5))
+
+    def test_is_trusted(self):
+        record = self.store.save('foo.bar', fake_article())
+        for _ in range(store.MIN_ATTEMPTS - 1):
+            self.store.record_failure('foo.bar')
+        self.assertTrue(record.is_trusted(0.5))
+
+        self.store.record_failure('foo.bar')
+        self.assertFalse(record.is_trusted(0.5))
+
+    def test_delete(self):
+        self.store.save('foo.bar', fake_article())
+        self.store.delete('foo.bar')
+
+        self.assertIsNone(self.store.get('foo.bar'))
+
+    def test_persistent(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'db', 'templates.sqlite')
+        first = store.TemplateStore(path)
+        first.save('foo.bar', fake_article())
+        first.record_success('foo.bar')
+        first.close()
+
+        second = store.TemplateStore(path)
+        self.addCleanup(second.close)
+        record = second.get('foo.bar')
+        self.assertEqual('/html/head/title', record.title)
+        self.assertEqual(1, record.successes)
+
+    def test_saved_by_other_process(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'templates.sqlite')
+        first = store.TemplateStore(path)
+        self.addCleanup(first.close)
+        second = store.TemplateStore(path)
+        self.addCleanup(second.close)
+        self.assertIsNone(first.get('foo.bar'))
+
+        second.save('foo.bar', fake_article())
+        self.assertEqual('/html/head/title', first.get('foo.bar').title)
@@ -0,0 +1,77 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from lxml import etree
+from lxml import html
+import mock
+
+from datahub.news_detector.rule import template
+from datahub.tests import base
+
+
+class CompiledTemplateTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(CompiledTemplateTest, self).setUp()
+        self.doc = html.fromstring(
+            '<html><head><title>fake title</title>'
+            '<meta property="article:published_time" content="fake_date">'
+            '</head><body><div class="byline">By <b>Foo Bar</b></div>'
+            '<div id="content"><p>first</p><p>second <a>link</a></p></div>'
+            '</body></html>')
+
+    def test_init_compiles_xpaths(self):
+        tpl = template.CompiledTemplate(title='/html/head/title',
+                                        text='//p//text()')
+        self.assertEqual(['text', 'title'], sorted(tpl._xpaths))
+        self.assertIsInstance(tpl._xpaths['title'], etree.XPath)
+
+    def test_init_bad_xpath(self):
+        self.assertRaises(etree.XPathSyntaxError,
+                          template.CompiledTemplate, title='//[')
+
+    def test_from_article(self):
+        art = mock.Mock(title='/html/head/title', text='//p//text()',
+                        authors=['//div[@class="byline"]', '//b'],
+                        publish_date='//meta/@content')
+        tpl = template.CompiledTemplate.from_article(art)
+        self.assertEqual('/html/head/title', tpl.title)
+        self.assertEqual('//p//text()', tpl.text)
+        self.assertEqual('//div[@class="byline"]', tpl.authors)
+        self.assertEqual('//meta/@content', tpl.publish_date)
+
+    def test_from_article_no_authors(self):
+        art = mock.Mock(title='', text='', authors=[], publish_date='')
+        tpl = template.CompiledTemplate.from_article(art)
+        self.assertEqual('', tpl.authors)
+        self.assertEqual({}, tpl._xpaths)
+
+    def test_apply(self):
+        tpl = template.CompiledTemplate(
+            title='/html/head/title',
+            text='/html/body/div[2]//text()',
+            authors='//*[re:test(@class, "BYLINE", "i")]',
+            publish_date='/html/head/meta[1]/@content')
+        res = tpl.apply(self.doc)
+        self.assertEqual({'title': 'fake title',
+                          'text': 'first\nsecond \nlink\n',
+                          'authors': 'By Foo Bar',
+                          'publish_date': 'fake_date'}, res)
+        self.assertEqual(str, type(res['publish_date']))
+
+    def test_apply_not_found(self):
+        tpl = template.CompiledTemplate(title='//h1', text='//article//text()',
+                                        authors='//*[@rel="author"]')
+        res = tpl.apply(self.doc)
+        self.assertEqual({'text': ''}, res)
@@ -0,0 +1,101 @@
+# Copyright 2017 EGG Club.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+import mock
+from scrapy.http import HtmlResponse
+from scrapy.http import Request
+from scrapy.settings import Settings
+from scrapy import Spider
+
+from datahub.news_slave.core import httpcache
+from datahub.tests import base
+
+URL = 'http://foo.bar/news'
+
+
+class SqliteCacheStorageTest(base.BaseTestCase):
+
+    def setUp(self):
+        super(SqliteCacheStorageTest, self).setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.spider = Spider('news')
+        self.storage = self._storage(HTTPCACHE_EXPIRATION_SECS=60)
+
+    def _storage(self, **settings):
+        values = {'HTTPCACHE_DIR': self.tempdir,
+                  'HTTPCACHE_EXPIRATION_SECS': 0,
+                  'HTTPCACHE_MAX_SIZE': 1024}
+        values.update(settings)
+        storage = httpcache.SqliteCacheStorage(Settings(values))
+        storage.open_spider(self.spider)
+        self.addCleanup(storage.close_spider, self.spider)
+        return storage
+
+    def _response(self, body=b'<html>news</html>'):
+        return HtmlResponse(URL, status=200, body=body,
+                            headers={'Content-Type': 'text/html',
+                                     'ETag': '"v1"'})
+
+    def test_open_spider(self):
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir,
+                                                    'news.sqlite')))
+        self.assertEqual(60, self.storage.cache.ttl)
+        self.assertEqual(1024, self.storage.cache.max_size)
+
+    def test_store_and_retrieve(self):
+        request = Request(URL)
+        self.storage.store_response(self.spider, request, self._response())
+
+        response = self.storage.retrieve_response(self.spider, request)
+        self.assertIsInstance(response, HtmlResponse)
+        self.assertEqual(URL, response.url)
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'<html>news</html>', response.body)
+        self.assertEqual(b'"v1"', response.headers.get('ETag'))
+
+    def test_store_replaces(self):
+        request = Request(URL)
+        self.storage.store_response(self.spider, request, self._response())
+        self.storage.store_response(self.spider, request,
+                                    self._response(b'<html>new</html>'))
+
+        response = self.storage.retrieve_response(self.spider, request)
+        self.assertEqual(b'<html>new</html>', response.body)
+
+    def test_retrieve_missing(self):
+        self.assertIsNone(self.storage.retrieve_response(self.spider,
+                                                         Request(URL)))
+
+    def test_expiry(self):
+        request = Request(URL)
+        with mock.patch('time.time', return_value=1000):
+            self.storage.store_response(self.spider, request,
+                                        self._response())
+        with mock.patch('time.time', return_value=1050):
+            self.assertIsNotNone(
+                self.storage.retrieve_response(self.spider, request))
+        with mock.patch('time.time', return_value=1100):
+            self.assertIsNone(
+                self.storage.retrieve_response(self.spider, request))
+
+    def test_not_get(self):
+        request = Request(URL, method='POST')
+        self.storage.store_response(self.spider, request, self._response())
+
+        self.assertIsNone(self.storage.retrieve_response(self.spider,
+                                                         request))
+        self.assertIsNone(self.storage.cache.get(URL))